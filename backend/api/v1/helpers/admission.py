@@ -0,0 +1,157 @@
+####################################################################################################
+# ADMISSION CONTROL (PER-CLIENT TOKEN BUCKETS), REQUEST COALESCING AND BACKPRESSURE
+####################################################################################################
+
+# Built-in imports
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+# External imports
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
+
+# Own imports
+from api.v1.helpers import observability
+
+
+logger = Logger(service="captain-sustainability", child=True)
+
+# Sustained requests per second of every client and extra requests of its bursts
+# (a rate of 0 disables the admission control). The buckets live in the process
+# memory, so they limit the clients of every execution environment (the global
+# limits are the API Gateway stage throttling)
+ADMISSION_RATE_PER_SECOND = float(os.environ.get("ADMISSION_RATE_PER_SECOND", 1))
+ADMISSION_BURST = float(os.environ.get("ADMISSION_BURST", 10))
+ADMISSION_MAX_CLIENTS = int(os.environ.get("ADMISSION_MAX_CLIENTS", 10_000))
+
+
+class OverloadedError(Exception):
+    """
+    The request can't be served now (client over its rate or model throttled
+    for too long). Returned to the client as a 429 with "Retry-After".
+    """
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        # Whole seconds for the "Retry-After" header
+        self.retry_after = str(max(1, math.ceil(retry_after)))
+
+
+class TokenBucket:
+    """
+    Token bucket of a client: "burst" tokens, refilled at "rate" per second.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def take(self, now: float, cost: float = 1) -> float:
+        """
+        Take the tokens of a request. Returns 0 if it is admitted, otherwise the
+        seconds until the bucket has enough tokens.
+        """
+        # Requests larger than the bucket are admitted once it is full, but
+        # their full cost is charged: the debt (negative tokens) is paid by
+        # waiting, so large batches don't exceed the rate of the client
+        needed = min(cost, self.burst)
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    Per-client admission control, with the token buckets of the most recent
+    clients (the least recently seen ones are evicted past "max_clients").
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int) -> None:
+        """
+        :param rate (float): Tokens (requests) per second of every client.
+        :param burst (float): Maximum tokens of every client.
+        :param max_clients (int): Maximum number of tracked clients.
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def admit(self, client_id: str, cost: float = 1) -> None:
+        """
+        Admit a request of a client, or raise "OverloadedError" if the client
+        is over its rate.
+
+        :param client_id (str): The client identifier (e.g. its IP address).
+        :param cost (float): The tokens of the request (e.g. the batch items).
+        """
+        if self.rate <= 0:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(client_id, None)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst, now)
+            self._buckets[client_id] = bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            wait_seconds = bucket.take(now, cost)
+
+        observability.add_metric(
+            "AdmissionRejected", MetricUnit.Count, int(bool(wait_seconds))
+        )
+        if wait_seconds:
+            logger.warning(
+                "Rejected a request over the client rate", client_id=client_id
+            )
+            raise OverloadedError("Too many requests, retry later", wait_seconds)
+
+
+class SingleFlight:
+    """
+    Coalescing of identical concurrent calls: the first caller of a key runs
+    the call and the rest wait for its result (or error) instead of repeating it.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, asyncio.Task] = {}
+
+    async def arun(
+        self, key: str, call: Callable[[], Awaitable[dict]]
+    ) -> tuple[dict, bool]:
+        """
+        Run a call once for all the concurrent callers of the same key. Returns
+        the result and whether it was shared (run by another caller).
+
+        :param key (str): The key of identical calls (e.g. the response cache key).
+        :param call (Callable): Async function of the call.
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shielded, so a cancelled caller (e.g. a disconnected client) does not
+        # cancel the call of the other callers
+        return await asyncio.shield(task), shared
+
+
+admission_controller = AdmissionController(
+    ADMISSION_RATE_PER_SECOND, ADMISSION_BURST, ADMISSION_MAX_CLIENTS
+)
+single_flight = SingleFlight()
@@ -0,0 +1,243 @@
+####################################################################################################
+# HELPERS FOR AMAZON BEDROCK (CLIENT, REQUEST BODIES AND RESPONSE PARSING)
+####################################################################################################
+
+# Built-in imports
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator
+
+# External imports
+import orjson
+from botocore.config import Config
+
+# Own imports
+from api.v1.helpers import clients
+
+
+# Default model, the models of every request are selected with "routing.MODEL_REGISTRY"
+MODEL_ID = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+MAX_TOKENS = 4000
+
+# Prompt caching stores the (large and static) prefix of the requests on Bedrock,
+# so that following requests skip most of the input tokens processing.
+# Note: a prefix below the model minimum is not cached (the checkpoint is just
+# ignored). The system prompt (~1.3k tokens) reaches the 1024 tokens of the
+# Sonnet models, but not the 2048 tokens of Claude 3.5 Haiku, so the "light"
+# tier only gets cache hits once the history (last answer checkpoint) is longer
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+CACHE_CHECKPOINT = {"type": "ephemeral"}
+
+
+# Maximum number of concurrent model calls per worker (executor threads and HTTP connections)
+BEDROCK_MAX_CONCURRENCY = int(os.environ.get("BEDROCK_MAX_CONCURRENCY", 64))
+
+BEDROCK_CLIENT_CONFIG = Config(
+    max_pool_connections=BEDROCK_MAX_CONCURRENCY,
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=300,  # Long answers are generated in one (non-streaming) response
+    # No retries in botocore (it would also retry the throttling with its own
+    # backoff): the failover and the bounded retries are done by "routing.py"
+    retries={"mode": "standard", "total_max_attempts": 1},
+)
+
+
+# The client is created with the first model call instead of at import, so the
+# cold starts of the requests that never reach the model (docs, rejections and
+# cached answers) skip it. With SnapStart it is preloaded into the snapshot.
+BEDROCK_CLIENT_PRELOAD = (
+    os.environ.get("BEDROCK_CLIENT_PRELOAD", "false").lower() == "true"
+)
+
+
+def get_client(region: str | None = None):
+    """
+    Get the (shared and thread-safe) Bedrock Runtime client of a region.
+
+    :param region (str): The AWS region (default: the region of the function).
+    """
+    return clients.get_client("bedrock-runtime", region, BEDROCK_CLIENT_CONFIG)
+
+
+if BEDROCK_CLIENT_PRELOAD:
+    get_client()
+
+# boto3 is synchronous, so the async endpoints run the model calls in this
+# bounded executor instead of blocking the event loop for the whole call
+executor = ThreadPoolExecutor(
+    max_workers=BEDROCK_MAX_CONCURRENCY,
+    thread_name_prefix="bedrock",
+)
+
+
+def _with_cache_checkpoint(message: dict) -> dict:
+    """
+    Copy of the message with a cache checkpoint on its last content block.
+    """
+    content = message["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = [*content[:-1], {**content[-1], "cache_control": CACHE_CHECKPOINT}]
+    return {**message, "content": content}
+
+
+@functools.lru_cache(maxsize=16)
+def _encode_request_prefix(system: str, prompt_cache: bool) -> bytes:
+    """
+    JSON of the request body up to its "messages", encoded once per system
+    prompt (the largest and static part of every request).
+    """
+    if prompt_cache:
+        system = [{"type": "text", "text": system, "cache_control": CACHE_CHECKPOINT}]
+    prefix = orjson.dumps(
+        {
+            "anthropic_version": ANTHROPIC_VERSION,
+            "max_tokens": MAX_TOKENS,
+            "system": system,
+        }
+    )
+    return prefix[:-1] + b',"messages":'
+
+
+def build_request_body(
+    system: str,
+    messages: list[dict],
+    prompt_cache: bool = PROMPT_CACHE_ENABLED,
+) -> bytes:
+    """
+    Build the JSON body for the Anthropic "messages" API on Bedrock (only the
+    messages are encoded on every request, see "_encode_request_prefix()").
+
+    With "prompt_cache", there are cache checkpoints after the system prompt and
+    after the last answer of the model, as the conversation up to that point is
+    the stable prefix of the next turns. The input "messages" are not modified.
+
+    :param system (str): The system prompt for the model.
+    :param messages (list[dict]): The conversation in Anthropic "messages" format.
+    :param prompt_cache (bool): Add the prompt caching checkpoints to the request.
+    """
+    if prompt_cache:
+        last_answer = max(
+            (i for i, message in enumerate(messages) if message["role"] == "assistant"),
+            default=None,
+        )
+        if last_answer is not None:
+            messages = [
+                *messages[:last_answer],
+                _with_cache_checkpoint(messages[last_answer]),
+                *messages[last_answer + 1 :],
+            ]
+
+    return _encode_request_prefix(system, prompt_cache) + orjson.dumps(messages) + b"}"
+
+
+def invoke(body: bytes, model_id: str = MODEL_ID, region: str | None = None) -> dict:
+    """
+    Invoke the model and wait for the complete answer (blocking call).
+
+    :param body (bytes): The JSON body created with "build_request_body()".
+    :param model_id (str): The Bedrock model or inference profile identifier.
+    :param region (str): The AWS region of the model (default: the function region).
+    """
+    response = get_client(region).invoke_model(body=body, modelId=model_id)
+    return orjson.loads(response.get("body").read())
+
+
+def invoke_stream(
+    body: bytes, model_id: str = MODEL_ID, region: str | None = None
+) -> Iterator[dict]:
+    """
+    Invoke the model with response streaming and yield the decoded Anthropic
+    stream events ("message_start", "content_block_delta", "message_stop", ...)
+    as soon as Bedrock sends them.
+
+    :param body (bytes): The JSON body created with "build_request_body()".
+    :param model_id (str): The Bedrock model or inference profile identifier.
+    :param region (str): The AWS region of the model (default: the function region).
+    """
+    response = get_client(region).invoke_model_with_response_stream(
+        body=body, modelId=model_id
+    )
+    stream = response.get("body")
+    try:
+        for event in stream:
+            chunk = event.get("chunk")
+            if chunk:
+                yield orjson.loads(chunk.get("bytes"))
+    finally:
+        # Releases the HTTP connection when the consumer stops before the end
+        stream.close()
+
+
+async def ainvoke(
+    body: bytes, model_id: str = MODEL_ID, region: str | None = None
+) -> dict:
+    """
+    Non-blocking version of "invoke()" for async code.
+
+    :param body (bytes): The JSON body created with "build_request_body()".
+    :param model_id (str): The Bedrock model or inference profile identifier.
+    :param region (str): The AWS region of the model (default: the function region).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, invoke, body, model_id, region)
+
+
+async def ainvoke_stream(
+    body: bytes, model_id: str = MODEL_ID, region: str | None = None
+) -> AsyncIterator[dict]:
+    """
+    Non-blocking version of "invoke_stream()" for async code (every blocking
+    read of the stream runs in the executor).
+
+    :param body (bytes): The JSON body created with "build_request_body()".
+    :param model_id (str): The Bedrock model or inference profile identifier.
+    :param region (str): The AWS region of the model (default: the function region).
+    """
+    loop = asyncio.get_running_loop()
+    events = invoke_stream(body, model_id, region)
+    end_of_stream = object()
+    read = None
+    try:
+        while True:
+            # Shielded, so a cancelled consumer does not lose track of the read
+            read = loop.run_in_executor(executor, next, events, end_of_stream)
+            event = await asyncio.shield(read)
+            if event is end_of_stream:
+                return
+            yield event
+    finally:
+        if read is not None and not read.done():
+            # The generator can't be closed while it runs in the executor, so a
+            # cancelled consumer (e.g. a client disconnect) waits for the read
+            await asyncio.wait([read])
+        events.close()
+
+
+def extract_text(response_body: dict) -> str:
+    """
+    Get the text of the first content block of a (non-streaming) model answer.
+
+    :param response_body (dict): The decoded body returned by "invoke()".
+    """
+    return response_body.get("content")[0]["text"]
+
+
+def extract_usage(usage: dict) -> dict:
+    """
+    Normalize the token usage reported by the model (including prompt caching).
+
+    :param usage (dict): The "usage" of the response body (or of the stream events).
+    """
+    cache_read_tokens = usage.get("cache_read_input_tokens") or 0
+    return {
+        "input_tokens": usage.get("input_tokens") or 0,
+        "output_tokens": usage.get("output_tokens") or 0,
+        "cache_read_input_tokens": cache_read_tokens,
+        "cache_write_input_tokens": usage.get("cache_creation_input_tokens") or 0,
+        "cache_hit": cache_read_tokens > 0,
+    }
@@ -0,0 +1,227 @@
+####################################################################################################
+# RESPONSE CACHE FOR REPEATED ASSESSMENTS (IN-PROCESS LRU + SHARED DYNAMODB TTL TIER)
+####################################################################################################
+
+# Built-in imports
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+# External imports
+from aws_lambda_powertools import Logger
+
+# Own imports
+from api.v1.helpers import clients
+
+
+logger = Logger(service="captain-sustainability", child=True)
+
+
+def _digest(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _normalize_content(content: str | list) -> str | list:
+    """
+    Normalize a message content: collapse the whitespaces of the texts and
+    replace the (base64) images by their digest.
+    """
+    if isinstance(content, str):
+        return " ".join(content.split())
+
+    normalized = []
+    for block in content:
+        if block.get("type") == "text":
+            normalized.append({"type": "text", "text": " ".join(block["text"].split())})
+        elif block.get("type") == "image":
+            normalized.append(
+                {"type": "image", "digest": _digest(block["source"]["data"])}
+            )
+        else:
+            normalized.append(block)
+    return normalized
+
+
+def build_cache_key(model_id: str, system: str, messages: list[dict]) -> str:
+    """
+    Canonical hash of a model request: same model, system prompt, history,
+    prompt and images (by digest) produce the same key.
+
+    :param model_id (str): The Bedrock model or inference profile identifier.
+    :param system (str): The system prompt.
+    :param messages (list[dict]): The conversation (including the new user turn).
+    """
+    canonical = {
+        "model_id": model_id,
+        "system": _digest(system),
+        "messages": [
+            {"role": message["role"], "content": _normalize_content(message["content"])}
+            for message in messages
+        ],
+    }
+    return _digest(json.dumps(canonical, sort_keys=True, separators=(",", ":")))
+
+
+class LRUCache:
+    """
+    In-process LRU cache with a maximum size in bytes. It lives at module level,
+    so it survives between warm invocations of the same Lambda execution environment.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """
+        :param max_bytes (int): Maximum size of the (JSON serialized) cached values.
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items: OrderedDict[str, tuple[dict, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, value: dict) -> None:
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.current_bytes += size
+
+            # Evict the least recently used values until the cache fits again
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+
+class DynamoDBCache:
+    """
+    Shared cache tier on a DynamoDB table with TTL (partition key "cache_key").
+    """
+
+    def __init__(self, table_name: str, ttl_seconds: int, client=None) -> None:
+        """
+        :param table_name (str): The DynamoDB table name.
+        :param ttl_seconds (int): Time to live of the cached values.
+        :param client: Optional boto3 DynamoDB client (e.g. for local tests with moto).
+        """
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+
+    @property
+    def client(self):
+        # Created on first use, to keep it out of the cold start
+        if self._client is None:
+            self._client = clients.get_client("dynamodb")
+        return self._client
+
+    def get(self, key: str) -> dict | None:
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"cache_key": {"S": key}},
+        )
+        item = response.get("Item")
+        # DynamoDB deletes expired items lazily, so the TTL is also checked here
+        if not item or int(item["expires_at"]["N"]) < time.time():
+            return None
+        return json.loads(item["value"]["S"])
+
+    def set(self, key: str, value: dict) -> None:
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "cache_key": {"S": key},
+                "value": {"S": json.dumps(value)},
+                "expires_at": {"N": str(int(time.time()) + self.ttl_seconds)},
+            },
+        )
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: the in-process LRU is checked first, then the
+    shared DynamoDB tier (if configured), whose hits are promoted to the LRU.
+    """
+
+    def __init__(self, memory: LRUCache, shared: DynamoDBCache | None = None) -> None:
+        self.memory = memory
+        self.shared = shared
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """
+        Create the cache from the "RESPONSE_CACHE_*" environment variables.
+        """
+        memory = LRUCache(
+            int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        )
+        table_name = os.environ.get("RESPONSE_CACHE_TABLE")
+        shared = None
+        if table_name:
+            ttl_seconds = int(
+                os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 24 * 60 * 60)
+            )
+            shared = DynamoDBCache(table_name, ttl_seconds)
+        return cls(memory, shared)
+
+    def get(self, key: str) -> tuple[dict | None, str | None]:
+        """
+        Get the cached value and the tier that served it ("memory" or "dynamodb").
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            return value, "memory"
+
+        if self.shared is not None:
+            # The shared tier is an optimization, so its errors are never fatal
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"Error reading the shared response cache: {e}")
+            if value is not None:
+                self.memory.set(key, value)
+                return value, "dynamodb"
+
+        return None, None
+
+    def set(self, key: str, value: dict) -> None:
+        self.memory.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value)
+            except Exception as e:
+                logger.warning(f"Error writing the shared response cache: {e}")
+
+    async def aget(self, key: str) -> tuple[dict | None, str | None]:
+        """
+        Non-blocking version of "get()" (only the shared tier needs a thread).
+        """
+        value = self.memory.get(key)
+        if value is not None or self.shared is None:
+            return value, "memory" if value is not None else None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: dict) -> None:
+        """
+        Non-blocking version of "set()" (only the shared tier needs a thread).
+        """
+        if self.shared is None:
+            self.memory.set(key, value)
+            return
+        await asyncio.to_thread(self.set, key, value)
+
+
+response_cache = ResponseCache.from_env()
@@ -0,0 +1,416 @@
+####################################################################################################
+# DETERMINISTIC CARBON FOOTPRINT CALCULATIONS (NO LLM INVOLVED)
+####################################################################################################
+
+# The coefficients below are approximations based on the public "Cloud Carbon Footprint"
+# methodology (https://www.cloudcarbonfootprint.org/docs/methodology), which derives:
+#   - Operational emissions (scope 2): energy (kWh) * PUE * grid intensity (kgCO2e/kWh)
+#   - Embodied emissions (scope 3): server manufacturing emissions amortized by usage
+#   - Scope 1 emissions are the direct emissions of AWS data centers (reported as 0 here)
+
+# Built-in imports
+import re
+import math
+
+# Own imports
+from api.v1.helpers import catalog
+
+
+DEFAULT_REGION = "us-east-1"
+DEFAULT_HOURS = 730  # Hours in one month
+DEFAULT_UTILIZATION = 0.5
+
+# Power Usage Effectiveness of AWS data centers
+PUE = 1.135
+
+# Grid emission factors per region (kgCO2e/kWh)
+REGION_GRID_INTENSITY = {
+    "us-east-1": 0.379069,
+    "us-east-2": 0.410608,
+    "us-west-1": 0.322167,
+    "us-west-2": 0.322167,
+    "us-gov-east-1": 0.379069,
+    "us-gov-west-1": 0.322167,
+    "ca-central-1": 0.00012,
+    "sa-east-1": 0.0617,
+    "eu-west-1": 0.2786,
+    "eu-west-2": 0.225,
+    "eu-west-3": 0.0511,
+    "eu-central-1": 0.338,
+    "eu-north-1": 0.0088,
+    "eu-south-1": 0.2339,
+    "ap-east-1": 0.71,
+    "ap-south-1": 0.708,
+    "ap-northeast-1": 0.462,
+    "ap-northeast-2": 0.415,
+    "ap-northeast-3": 0.462,
+    "ap-southeast-1": 0.408,
+    "ap-southeast-2": 0.79,
+    "me-south-1": 0.732,
+    "af-south-1": 0.928,
+}
+
+# Min/max power draw per vCPU (watts) for each processor family
+PROCESSOR_WATTS_PER_VCPU = {
+    "intel": (0.74, 3.5),
+    "amd": (0.45, 2.02),
+    "graviton": (0.47, 1.69),
+}
+
+# Power draw of memory (watts per GiB)
+MEMORY_WATTS_PER_GIB = 0.392
+
+# Power draw of storage (watts per TB)
+STORAGE_WATTS_PER_TB = {
+    "ssd": 1.2,
+    "hdd": 0.65,
+}
+
+# Embodied emissions of a typical host, shared by the vCPUs it provides
+EMBODIED_KGCO2E_PER_HOST = 1200
+HOST_VCPUS = 96
+HOST_LIFESPAN_HOURS = 4 * 365 * 24
+
+# Memory (GiB) per vCPU for each instance class (first letter of the family)
+MEMORY_GIB_PER_VCPU = {
+    "m": 4,
+    "c": 2,
+    "r": 8,
+    "x": 16,
+    "z": 8,
+}
+
+# Instance types that do not follow the family/size naming rules (vcpus, memory_gib, processor)
+INSTANCE_SPECS_OVERRIDES = {
+    "mac1.metal": (12, 32, "intel"),
+    "mac2.metal": (8, 16, "graviton"),
+    "mac2-m2.metal": (8, 24, "graviton"),
+    "mac2-m2pro.metal": (12, 32, "graviton"),
+    "mac2-m1ultra.metal": (20, 128, "graviton"),
+}
+
+# Burstable ("t") instances do not follow a linear vCPU/memory ratio
+BURSTABLE_SPECS = {
+    "nano": (2, 0.5),
+    "micro": (2, 1),
+    "small": (2, 2),
+    "medium": (2, 4),
+    "large": (2, 8),
+    "xlarge": (4, 16),
+    "2xlarge": (8, 32),
+}
+
+# vCPUs for the named sizes ("<n>xlarge" and "metal" are handled by "get_instance_specs()")
+SIZE_VCPUS = {
+    "nano": 1,
+    "micro": 1,
+    "small": 1,
+    "medium": 1,
+    "large": 2,
+    "xlarge": 4,
+}
+
+# Lambda allocates one full vCPU for every 1769 MB of configured memory
+LAMBDA_MB_PER_VCPU = 1769
+
+# Storage media of each EBS volume type and S3 storage class (with its replicas)
+EBS_STORAGE_MEDIA = {
+    "gp2": "ssd",
+    "gp3": "ssd",
+    "io1": "ssd",
+    "io2": "ssd",
+    "io2 block express": "ssd",
+    "st1": "hdd",
+    "sc1": "hdd",
+}
+
+S3_STORAGE_MEDIA = {
+    "standard": ("hdd", 3),
+    "intelligent_tiering": ("hdd", 3),
+    "express_onezone": ("ssd", 1),
+    "standard_ia": ("hdd", 3),
+    "onezone_ia": ("hdd", 1),
+    "glacier_ir": ("hdd", 3),
+    "glacier": ("hdd", 3),
+    "deep_archive": ("hdd", 3),
+}
+
+# Services estimated as (a number of) instances of a given type
+INSTANCE_SERVICES = {"EC2", "RDS", "ELASTICACHE", "EKS"}
+SUPPORTED_SERVICES = {service.upper() for service in catalog.SUPPORTED_SERVICES}
+
+INSTANCE_TYPE_PATTERN = re.compile(
+    r"^(?:(?P<prefix>db|cache)\.)?(?P<family>[a-z][a-z0-9-]*)\.(?P<size>[a-z0-9-]+)$"
+)
+
+
+def get_instance_specs(instance_type: str) -> tuple[int, float, str]:
+    """
+    Get the (vcpus, memory_gib, processor) of an EC2/RDS/ElastiCache instance type,
+    derived from its family and size (e.g. "m6g.2xlarge" -> (8, 32, "graviton")).
+
+    :param instance_type (str): The instance type, with optional "db."/"cache." prefix.
+    """
+    instance_type = instance_type.strip().lower()
+    if instance_type in INSTANCE_SPECS_OVERRIDES:
+        return INSTANCE_SPECS_OVERRIDES[instance_type]
+
+    match = INSTANCE_TYPE_PATTERN.match(instance_type)
+    if not match:
+        raise ValueError(f"Invalid instance type <{instance_type}>")
+    family, size = match.group("family"), match.group("size")
+
+    # Generation and attributes come after the class letters (e.g. "m" + "6" + "gd")
+    instance_class = family[0]
+    attributes = family.lstrip("abcdefghijklmnopqrstuvwxyz").lstrip("0123456789")
+    if "g" in attributes.split("-")[0]:
+        processor = "graviton"
+    elif "a" in attributes.split("-")[0]:
+        processor = "amd"
+    else:
+        processor = "intel"
+
+    if instance_class == "t":
+        if size not in BURSTABLE_SPECS:
+            raise ValueError(
+                f"Invalid size <{size}> for instance type <{instance_type}>"
+            )
+        vcpus, memory_gib = BURSTABLE_SPECS[size]
+        return vcpus, memory_gib, processor
+
+    if size in SIZE_VCPUS:
+        vcpus = SIZE_VCPUS[size]
+    elif size.endswith("xlarge") and size[: -len("xlarge")].isdigit():
+        vcpus = 4 * int(size[: -len("xlarge")])
+    elif size.startswith("metal"):
+        # "metal" means the whole host, "metal-48xl" states the equivalent size
+        multiplier = size.partition("-")[2].rstrip("xl")
+        vcpus = 4 * int(multiplier) if multiplier.isdigit() else HOST_VCPUS
+    else:
+        raise ValueError(f"Invalid size <{size}> for instance type <{instance_type}>")
+
+    if instance_class not in MEMORY_GIB_PER_VCPU:
+        raise ValueError(f"Unsupported instance family <{family}>")
+    return vcpus, vcpus * MEMORY_GIB_PER_VCPU[instance_class], processor
+
+
+def _compute_watts(
+    vcpus: float, memory_gib: float, processor: str, utilization: float
+) -> float:
+    """
+    Average power draw (watts) of the given compute capacity.
+    """
+    min_watts, max_watts = PROCESSOR_WATTS_PER_VCPU[processor]
+    cpu_watts = vcpus * (min_watts + utilization * (max_watts - min_watts))
+    return cpu_watts + memory_gib * MEMORY_WATTS_PER_GIB
+
+
+def _embodied_kgco2e(vcpus: float, hours: float) -> float:
+    """
+    Share of the host embodied emissions for the given vCPU usage.
+    """
+    host_share = min(vcpus / HOST_VCPUS, 1)
+    return EMBODIED_KGCO2E_PER_HOST * host_share * hours / HOST_LIFESPAN_HOURS
+
+
+def _number(resource: dict, key: str, default: float | None = None) -> float:
+    """
+    Read a finite non-negative number from the resource (or its default, if given).
+    """
+    value = resource.get(key, default)
+    if value is None:
+        raise ValueError(f"Missing <{key}> for {resource.get('service')} resource")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid <{key}> value <{value}>, it must be a number")
+    if not math.isfinite(value):
+        raise ValueError(f"Invalid <{key}> value <{value}>, it must be finite")
+    if value < 0:
+        raise ValueError(f"Invalid <{key}> value <{value}>, it must be positive")
+    return value
+
+
+def _estimate_resource(resource: dict, defaults: dict) -> dict:
+    """
+    Get the monthly (or "hours" based) footprint of a single resource.
+
+    :param resource (dict): The resource definition (see "estimate_footprint()").
+    :param defaults (dict): Default "region", "hours" and "utilization" to use.
+    """
+    service = str(resource.get("service", "")).strip().upper()
+    if service not in SUPPORTED_SERVICES:
+        raise ValueError(
+            f"Unsupported service <{resource.get('service')}>, valid services are {sorted(SUPPORTED_SERVICES)}"
+        )
+
+    region = str(resource.get("region") or defaults["region"]).strip().lower()
+    if region not in REGION_GRID_INTENSITY:
+        raise ValueError(f"Unsupported region <{region}>")
+    hours = _number(resource, "hours", defaults["hours"])
+    utilization = _number(resource, "utilization", defaults["utilization"])
+    if utilization > 1:
+        raise ValueError(f"Invalid <utilization> value <{utilization}>, use 0-1")
+    count = _number(resource, "count", 1)
+
+    watts = 0.0
+    vcpu_hours = 0.0
+    if service in INSTANCE_SERVICES:
+        instance_type = resource.get("instance_type")
+        if not instance_type:
+            raise ValueError(f"Missing <instance_type> for {service} resource")
+        catalog.validate_instance_type(instance_type, service)
+        vcpus, memory_gib, processor = get_instance_specs(instance_type)
+        # Multi-AZ RDS deployments run a standby instance (and storage copy)
+        replicas = 2 if resource.get("multi_az") else 1
+        watts = (
+            count * replicas * _compute_watts(vcpus, memory_gib, processor, utilization)
+        )
+        vcpu_hours = count * replicas * vcpus * hours
+        storage_gb = _number(resource, "storage_gb", 0)
+        watts += count * replicas * 2 * storage_gb / 1000 * STORAGE_WATTS_PER_TB["ssd"]
+        description = f"{count:g} x {instance_type}"
+
+    elif service == "FARGATE":
+        vcpus = _number(resource, "vcpu")
+        memory_gib = _number(resource, "memory_gb")
+        if (
+            vcpus > catalog.FARGATE_MAX_VCPU
+            or memory_gib > catalog.FARGATE_MAX_MEMORY_GIB
+        ):
+            raise ValueError(
+                f"Fargate tasks support up to {catalog.FARGATE_MAX_VCPU} vCPU and {catalog.FARGATE_MAX_MEMORY_GIB} GiB"
+            )
+        processor = "graviton" if resource.get("architecture") == "arm64" else "intel"
+        watts = count * _compute_watts(vcpus, memory_gib, processor, utilization)
+        vcpu_hours = count * vcpus * hours
+        description = f"{count:g} x Fargate task ({vcpus:g} vCPU, {memory_gib:g} GiB)"
+
+    elif service == "LAMBDA":
+        memory_mb = _number(resource, "memory_mb", catalog.LAMBDA_MIN_MEMORY_MB)
+        if (
+            not catalog.LAMBDA_MIN_MEMORY_MB
+            <= memory_mb
+            <= catalog.LAMBDA_MAX_MEMORY_MB
+        ):
+            raise ValueError(
+                f"Lambda memory must be between {catalog.LAMBDA_MIN_MEMORY_MB} and {catalog.LAMBDA_MAX_MEMORY_MB} MB"
+            )
+        invocations = _number(resource, "invocations")
+        duration_ms = _number(resource, "avg_duration_ms")
+        processor = "graviton" if resource.get("architecture") == "arm64" else "intel"
+        # Lambda is billed (and powered) only while running, not for the whole period
+        hours = invocations * duration_ms / 3_600_000
+        vcpus = memory_mb / LAMBDA_MB_PER_VCPU
+        watts = count * _compute_watts(vcpus, memory_mb / 1024, processor, utilization)
+        vcpu_hours = count * vcpus * hours
+        description = f"{count:g} x Lambda ({invocations:g} invocations x {duration_ms:g} ms, {memory_mb:g} MB)"
+
+    elif service == "EBS":
+        volume_type = str(resource.get("volume_type", "gp3")).strip().lower()
+        if volume_type not in EBS_STORAGE_MEDIA:
+            raise ValueError(
+                f"Unsupported EBS volume type <{volume_type}>, valid types are {catalog.EBS_VOLUME_TYPES}"
+            )
+        size_gb = _number(resource, "size_gb")
+        # EBS volumes are replicated within the availability zone
+        watts = (
+            count
+            * 2
+            * size_gb
+            / 1000
+            * STORAGE_WATTS_PER_TB[EBS_STORAGE_MEDIA[volume_type]]
+        )
+        description = f"{count:g} x {volume_type} ({size_gb:g} GB)"
+
+    else:  # S3
+        storage_class = str(resource.get("storage_class", "standard")).strip().lower()
+        storage_class = storage_class.replace("-", "_").replace(" ", "_")
+        if storage_class not in S3_STORAGE_MEDIA:
+            raise ValueError(
+                f"Unsupported S3 storage class <{storage_class}>, valid classes are {catalog.S3_STORAGE_CLASSES}"
+            )
+        storage_type, replication = S3_STORAGE_MEDIA[storage_class]
+        size_gb = _number(resource, "size_gb")
+        watts = replication * size_gb / 1000 * STORAGE_WATTS_PER_TB[storage_type]
+        description = f"{size_gb:g} GB in {storage_class.upper()}"
+
+    energy_kwh = watts * hours / 1000 * PUE
+    scope2 = energy_kwh * REGION_GRID_INTENSITY[region]
+    scope3 = _embodied_kgco2e(1, vcpu_hours) if vcpu_hours else 0.0
+
+    return {
+        "service": service,
+        "description": description,
+        "region": region,
+        "hours": round(hours, 4),
+        "energy_kwh": round(energy_kwh, 4),
+        "scope1_kgco2e": 0.0,
+        "scope2_kgco2e": round(scope2, 4),
+        "scope3_kgco2e": round(scope3, 4),
+        "total_kgco2e": round(scope2 + scope3, 4),
+    }
+
+
+def estimate_footprint(
+    resources: list[dict],
+    region: str = DEFAULT_REGION,
+    hours: float = DEFAULT_HOURS,
+    utilization: float = DEFAULT_UTILIZATION,
+) -> dict:
+    """
+    Calculate the carbon footprint (kgCO2e per scope) of a list of AWS resources.
+    Raises "ValueError" with a user-friendly message for invalid resources.
+
+    Examples of resources:
+        {"service": "EC2", "instance_type": "m5.large", "count": 3, "region": "us-east-1"}
+        {"service": "RDS", "instance_type": "db.r6g.large", "storage_gb": 100, "multi_az": true}
+        {"service": "LAMBDA", "memory_mb": 1024, "invocations": 1000000, "avg_duration_ms": 200}
+        {"service": "FARGATE", "vcpu": 1, "memory_gb": 2, "count": 4}
+        {"service": "EBS", "volume_type": "gp3", "size_gb": 500}
+        {"service": "S3", "storage_class": "STANDARD", "size_gb": 1000}
+
+    :param resources (list[dict]): The resources to evaluate.
+    :param region (str): Default region for resources without "region".
+    :param hours (float): Default usage hours for resources without "hours".
+    :param utilization (float): Default average CPU utilization (0-1).
+    """
+    if not resources:
+        raise ValueError("At least one resource is required")
+    # The defaults may come as JSON texts (e.g. "730"), like the resource values
+    hours = _number({"hours": hours}, "hours")
+    utilization = _number({"utilization": utilization}, "utilization")
+    if utilization > 1:
+        raise ValueError(f"Invalid <utilization> value <{utilization}>, use 0-1")
+    defaults = {"region": region, "hours": hours, "utilization": utilization}
+
+    results = []
+    for index, resource in enumerate(resources):
+        if not isinstance(resource, dict):
+            raise ValueError(f"Resource #{index} must be an object")
+        try:
+            results.append(_estimate_resource(resource, defaults))
+        except ValueError as e:
+            raise ValueError(f"Resource #{index}: {e}") from e
+
+    totals = {
+        key: round(sum(result[key] for result in results), 4)
+        for key in (
+            "energy_kwh",
+            "scope1_kgco2e",
+            "scope2_kgco2e",
+            "scope3_kgco2e",
+            "total_kgco2e",
+        )
+    }
+
+    assumptions = [
+        f"PUE of {PUE} for AWS data centers",
+        f"Average CPU utilization of {utilization:.0%} unless specified",
+    ]
+    if any(not resource.get("region") for resource in resources):
+        assumptions.append(f"Region {region} for resources without region")
+    if any(not resource.get("hours") for resource in resources):
+        assumptions.append(f"{hours:g} hours of usage for resources without hours")
+
+    return {"resources": results, "totals": totals, "assumptions": assumptions}
@@ -0,0 +1,301 @@
+####################################################################################################
+# CATALOG OF SUPPORTED AWS SERVICES AND SPECIFICATIONS (SINGLE SOURCE OF TRUTH)
+####################################################################################################
+
+# Built-in imports
+import difflib
+import re
+
+
+SUPPORTED_SERVICES = [
+    "EC2",
+    "RDS",
+    "Lambda",
+    "EKS",
+    "ELASTICACHE",
+    "FARGATE",
+    "EBS",
+    "S3",
+]
+
+# Instance families and their available sizes (per service)
+EC2_FAMILIES = {
+    "m5": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "metal"],
+    "m5a": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge"],
+    "m5ad": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge"],
+    "m5d": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "metal"],
+    "m5dn": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "metal"],
+    "m5n": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "metal"],
+    "m5zn": ["large", "xlarge", "2xlarge", "3xlarge", "6xlarge", "12xlarge", "metal"],
+    "m6a": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "32xlarge", "48xlarge", "metal"],
+    "m6g": ["medium", "large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "metal"],
+    "m6gd": ["medium", "large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "metal"],
+    "m6i": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "32xlarge", "metal"],
+    "m6id": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "32xlarge", "metal"],
+    "m6idn": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "32xlarge", "metal"],
+    "m6in": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "32xlarge", "metal"],
+    "m7a": ["medium", "large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "32xlarge", "48xlarge", "metal-48xl"],
+    "m7g": ["medium", "large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "metal"],
+    "m7gd": ["medium", "large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "metal"],
+    "m7i": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "48xlarge", "metal-24xl", "metal-48xl"],
+    "m7i-flex": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge"],
+    "m8g": ["medium", "large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge", "48xlarge", "metal-24xl", "metal-48xl"],
+    "mac1": ["metal"],
+    "mac2": ["metal"],
+    "mac2-m1ultra": ["metal"],
+    "mac2-m2": ["metal"],
+    "mac2-m2pro": ["metal"],
+    "t2": ["nano", "micro", "small", "medium", "large", "xlarge", "2xlarge"],
+    "t3": ["nano", "micro", "small", "medium", "large", "xlarge", "2xlarge"],
+    "t3a": ["nano", "micro", "small", "medium", "large", "xlarge", "2xlarge"],
+    "t4g": ["nano", "micro", "small", "medium", "large", "xlarge", "2xlarge"],
+}  # fmt: skip
+
+RDS_FAMILIES = {
+    "db.t2": ["micro", "small", "medium", "large", "xlarge", "2xlarge"],
+    "db.t3": ["micro", "small", "medium", "large", "xlarge", "2xlarge"],
+    "db.t4g": ["micro", "small", "medium", "large", "xlarge", "2xlarge"],
+    "db.m4": ["large", "xlarge", "2xlarge", "4xlarge", "10xlarge", "16xlarge"],
+    "db.m5": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge"],
+    "db.m5d": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge"],
+    "db.m6g": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge"],
+    "db.r4": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "16xlarge"],
+    "db.r5b": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge"],
+    "db.r5d": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge", "24xlarge"],
+    "db.r6g": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge"],
+    "db.x1": ["16xlarge", "32xlarge"],
+    "db.x1e": ["xlarge", "2xlarge", "4xlarge", "8xlarge", "16xlarge", "32xlarge"],
+    "db.x2g": ["medium", "large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge"],
+    "db.z1d": ["large", "xlarge", "2xlarge", "3xlarge", "6xlarge", "12xlarge"],
+}  # fmt: skip
+
+ELASTICACHE_FAMILIES = {
+    "cache.c7gn": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge"],
+    "cache.m4": ["large", "xlarge", "2xlarge", "4xlarge", "10xlarge"],
+    "cache.m5": ["large", "xlarge", "2xlarge", "4xlarge", "12xlarge", "24xlarge"],
+    "cache.m6g": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge"],
+    "cache.m7g": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge"],
+    "cache.r4": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "16xlarge"],
+    "cache.r5": ["large", "xlarge", "2xlarge", "4xlarge", "12xlarge", "24xlarge"],
+    "cache.r6g": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge"],
+    "cache.r6gd": ["xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge"],
+    "cache.r7g": ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge", "12xlarge", "16xlarge"],
+    "cache.t2": ["micro", "small", "medium"],
+    "cache.t3": ["micro", "small", "medium"],
+    "cache.t4g": ["micro", "small", "medium"],
+}  # fmt: skip
+
+FARGATE_MAX_VCPU = 16
+FARGATE_MAX_MEMORY_GIB = 120
+LAMBDA_MIN_MEMORY_MB = 128
+LAMBDA_MAX_MEMORY_MB = 10240
+
+S3_STORAGE_CLASSES = [
+    "STANDARD",
+    "INTELLIGENT_TIERING",
+    "EXPRESS_ONEZONE",
+    "STANDARD_IA",
+    "ONEZONE_IA",
+    "GLACIER_IR",
+    "GLACIER",
+    "DEEP_ARCHIVE",
+]
+
+EBS_VOLUME_TYPES = ["io2 Block Express", "io2", "io1", "gp3", "gp2", "st1", "sc1"]
+
+
+# Indexes built once at import time: "family -> sizes" (first level of the
+# "family.size" trie) and "instance type -> service" (O(1) membership checks)
+INSTANCE_FAMILIES = {
+    "EC2": EC2_FAMILIES,
+    "RDS": RDS_FAMILIES,
+    "ELASTICACHE": ELASTICACHE_FAMILIES,
+}
+FAMILY_INDEX = {
+    family: (service, tuple(sizes))
+    for service, families in INSTANCE_FAMILIES.items()
+    for family, sizes in families.items()
+}
+INSTANCE_TYPE_INDEX = {
+    f"{family}.{size}": service
+    for service, families in INSTANCE_FAMILIES.items()
+    for family, sizes in families.items()
+    for size in sizes
+}
+
+# EKS worker nodes are regular EC2 instances
+SERVICE_INSTANCE_CATALOG = {
+    "EC2": "EC2",
+    "EKS": "EC2",
+    "RDS": "RDS",
+    "ELASTICACHE": "ELASTICACHE",
+}
+
+# Candidate instance types in free text, such as "m5.large", "db.r6g.xlarge" or
+# "cache.t3.micro" (also catches misspelled sizes like "m5.xlarg" or "db.t3.medum")
+INSTANCE_TYPE_MENTION_PATTERN = re.compile(
+    r"\b(?:(?:db|cache)\.)?[a-z]+\d[a-z0-9-]*\.[a-z0-9-]*(?:nan|mic|sma|med|lar|met)[a-z0-9-]*\b",
+    re.IGNORECASE,
+)
+
+
+# Words of the sizes ("2xlarge" is "large"), to tell the misspelled sizes
+# ("xlarg", "medum") from other dotted words ("ec2.metadata")
+SIZE_WORDS = ("nano", "micro", "small", "medium", "large", "metal")
+SIZE_WORD_MIN_SIMILARITY = 0.8
+
+# Services named in free text, for the instance types without "db." or "cache."
+SERVICE_MENTION_PATTERNS = {
+    "EC2": re.compile(r"\b(?:ec2|eks)\b", re.IGNORECASE),
+    "RDS": re.compile(r"\b(?:rds|aurora)\b", re.IGNORECASE),
+    "ELASTICACHE": re.compile(
+        r"\b(?:elasticache|redis|memcached|valkey)\b", re.IGNORECASE
+    ),
+}
+SERVICE_PREFIXES = {"EC2": "", "RDS": "db.", "ELASTICACHE": "cache."}
+
+
+def is_valid_instance_type(instance_type: str, service: str | None = None) -> bool:
+    """
+    Check if an instance type exists in the catalog (optionally for a given service).
+
+    :param instance_type (str): The instance type (e.g. "m5.large" or "db.t3.medium").
+    :param service (str): Optional service name ("EC2", "EKS", "RDS" or "ELASTICACHE").
+    """
+    if not isinstance(instance_type, str):
+        return False
+    catalog_service = INSTANCE_TYPE_INDEX.get(instance_type.strip().lower())
+    if catalog_service is None:
+        return False
+    return (
+        service is None
+        or SERVICE_INSTANCE_CATALOG.get(service.upper()) == catalog_service
+    )
+
+
+def suggest_instance_types(
+    instance_type: str, service: str | None = None, limit: int = 3
+) -> list[str]:
+    """
+    Get the closest valid instance types for a (misspelled) instance type.
+    Sizes of the same family are preferred, so "m5.xlarg" suggests "m5.xlarge".
+
+    :param instance_type (str): The invalid instance type.
+    :param service (str): Optional service name to restrict the suggestions.
+    :param limit (int): Maximum number of suggestions.
+    """
+    instance_type = instance_type.strip().lower()
+    family = instance_type.rpartition(".")[0]
+    catalog_service = SERVICE_INSTANCE_CATALOG.get((service or "").upper())
+    family_service, sizes = FAMILY_INDEX.get(family, (None, ()))
+
+    if sizes and catalog_service in (None, family_service):
+        candidates = [f"{family}.{size}" for size in sizes]
+    else:
+        candidates = [
+            candidate
+            for candidate, candidate_service in INSTANCE_TYPE_INDEX.items()
+            if catalog_service in (None, candidate_service)
+        ]
+
+    return difflib.get_close_matches(instance_type, candidates, n=limit, cutoff=0.6)
+
+
+def validate_instance_type(instance_type: str, service: str | None = None) -> None:
+    """
+    Raise "ValueError" (with "did you mean" suggestions) for invalid instance types.
+
+    :param instance_type (str): The instance type to validate.
+    :param service (str): Optional service name ("EC2", "EKS", "RDS" or "ELASTICACHE").
+    """
+    if is_valid_instance_type(instance_type, service):
+        return
+    if not isinstance(instance_type, str):
+        raise ValueError(
+            f"Invalid <instance_type> value <{instance_type}>, it must be a text"
+        )
+
+    message = f"Unsupported instance type <{instance_type}>"
+    if service:
+        message += f" for {service.upper()}"
+    suggestions = suggest_instance_types(instance_type, service)
+    if suggestions:
+        message += f", did you mean {' or '.join(suggestions)}?"
+    raise ValueError(message)
+
+
+def _is_size_like(size: str) -> bool:
+    """
+    Check if the size of a mention is (or is close to) an instance size.
+    """
+    word = size.lower().lstrip("0123456789").removeprefix("x").partition("-")[0]
+    return word.endswith("large") or any(
+        difflib.SequenceMatcher(None, word, size_word).ratio()
+        >= SIZE_WORD_MIN_SIMILARITY
+        for size_word in SIZE_WORDS
+    )
+
+
+def find_invalid_instance_types(text: str) -> dict[str, list[str]]:
+    """
+    Find the instance types mentioned in a free text prompt that are not in
+    the catalog, with their suggestions (e.g. {"m5.hugelarge": ["m5.large"]}).
+    The mentions without "db." or "cache." are also checked with them, and
+    their service is the one named in the prompt (EC2 if none). The mentions
+    of prompts that name several of those services are left to the model.
+
+    :param text (str): The user prompt.
+    """
+    named_services = {
+        service
+        for service, pattern in SERVICE_MENTION_PATTERNS.items()
+        if pattern.search(text)
+    }
+    invalid = {}
+    for mention in INSTANCE_TYPE_MENTION_PATTERN.findall(text):
+        if mention in invalid or not _is_size_like(mention.rpartition(".")[2]):
+            continue
+        if mention.lower().startswith(("db.", "cache.")):
+            if not is_valid_instance_type(mention):
+                invalid[mention] = suggest_instance_types(mention)
+            continue
+
+        if any(
+            is_valid_instance_type(prefix + mention)
+            for prefix in SERVICE_PREFIXES.values()
+        ):
+            continue
+        if len(named_services) > 1:
+            continue  # Ambiguous service
+        service = next(iter(named_services), "EC2")
+        invalid[mention] = suggest_instance_types(
+            SERVICE_PREFIXES[service] + mention, service
+        )
+    return invalid
+
+
+def _render_families(families: dict[str, list[str]]) -> str:
+    return " | ".join(
+        f"{family}.{{{','.join(sizes)}}}" for family, sizes in families.items()
+    )
+
+
+def render_prompt_specifications() -> str:
+    """
+    Render the supported services and specifications for the system prompt.
+    Instance types are grouped by family ("m5.{large,xlarge}") to save tokens.
+    """
+    return (
+        f" You must validate request to the customer the type of AWS service, valid services are {SUPPORTED_SERVICES} "
+        f" valid EC2 (and EKS nodes) specifications are: {_render_families(EC2_FAMILIES)} "
+        f" valid RDS specifications are: {_render_families(RDS_FAMILIES)} "
+        f" valid ELASTICACHE specifications are: {_render_families(ELASTICACHE_FAMILIES)} "
+        f" valid fargate specifications max memory: {FARGATE_MAX_MEMORY_GIB} GiB and valid vCPU {FARGATE_MAX_VCPU}"
+        f" valid lambda specifications max memory: {LAMBDA_MAX_MEMORY_MB // 1024} GiB "
+        f" valid S3 specifications storage types: {', '.join(S3_STORAGE_CLASSES)} "
+        f" valid EBS specifications storage types: {', '.join(EBS_VOLUME_TYPES)} "
+    )
+
+
+# Rendered once, as the catalog does not change at runtime
+PROMPT_SPECIFICATIONS = render_prompt_specifications()
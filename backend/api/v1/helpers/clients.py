@@ -0,0 +1,40 @@
+####################################################################################################
+# SHARED BOTO3 CLIENTS (CREATED ONCE PER SERVICE AND REGION, THREAD-SAFE)
+####################################################################################################
+
+# Built-in imports
+import threading
+
+# External imports
+import boto3
+from botocore.config import Config
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(
+    service_name: str, region: str | None = None, config: Config | None = None
+):
+    """
+    Get the shared client of a service and region. The clients are created on
+    first use (out of the cold start), usually from threads ("asyncio.to_thread"
+    or executors), and creating them is not thread-safe, so each one is created
+    once under the lock, from its own session (not the shared default one).
+
+    :param service_name (str): The AWS service (e.g. "dynamodb").
+    :param region (str): The AWS region (default: the region of the function).
+    :param config (Config): Optional botocore config, used when it is created.
+    """
+    key = (service_name, region)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = boto3.session.Session().client(
+                    service_name=service_name, region_name=region, config=config
+                )
+                _clients[key] = client
+    return client
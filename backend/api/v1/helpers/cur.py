@@ -0,0 +1,553 @@
+####################################################################################################
+# CARBON FOOTPRINT OF AN ACCOUNT FROM ITS AWS COST AND USAGE REPORT (CUR) EXPORTS
+####################################################################################################
+"""
+Footprint report of the usage in AWS Cost and Usage Report exports (CUR 1.0 or
+CUR 2.0 columns, in CSV, gzipped CSV or Parquet). The line items are streamed
+and summed by product, usage type, region and instance type, so the memory
+only depends on the number of distinct usages (not on the file size). Those
+usages are mapped to the resources of "carbon.estimate_footprint()".
+
+Usage (from the "backend" folder):
+    python -m api.v1.helpers.cur cur-export.csv.gz
+    python -m api.v1.helpers.cur s3://bucket/cur/export-00001.snappy.parquet
+    python -m api.v1.helpers.cur cur-export.csv --recommendations
+"""
+
+# Built-in imports
+import io
+import os
+import csv
+import gzip
+import json
+import asyncio
+import argparse
+import importlib.util
+from collections import Counter
+from typing import IO
+
+# Own imports
+from api.v1.helpers import bedrock, carbon, catalog, clients, prompts, routing
+
+
+# PyArrow is optional (only needed for the Parquet exports)
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# Rows per batch of the Parquet exports (every batch is grouped in one pass)
+CUR_BATCH_ROWS = int(os.environ.get("CUR_BATCH_ROWS", 65_536))
+# Resources (with the highest footprint) and skipped usages in the summary
+CUR_TOP_ITEMS = int(os.environ.get("CUR_TOP_ITEMS", 10))
+
+# Bucket (and key prefix) of the exports that the API can read. Without it, the
+# API only accepts inline CSV exports (the CLI reads any local or S3 file)
+CUR_BUCKET = os.environ.get("CUR_BUCKET")
+CUR_PREFIX = os.environ.get("CUR_PREFIX", "")
+
+# Column names of every field in CUR 1.0 ("lineItem/UsageType") and CUR 2.0
+# or Athena ("line_item_usage_type") exports
+CUR_COLUMNS = {
+    "product_code": ("lineItem/ProductCode", "line_item_product_code"),
+    "usage_type": ("lineItem/UsageType", "line_item_usage_type"),
+    "usage_amount": ("lineItem/UsageAmount", "line_item_usage_amount"),
+    "line_item_type": ("lineItem/LineItemType", "line_item_line_item_type"),
+    "region": ("product/region", "product_region", "product_region_code"),
+    "instance_type": ("product/instanceType", "product_instance_type"),
+    "usage_start": ("lineItem/UsageStartDate", "line_item_usage_start_date"),
+}
+REQUIRED_FIELDS = ("product_code", "usage_type", "usage_amount")
+GROUP_FIELDS = ("product_code", "usage_type", "region", "instance_type")
+
+# Line items with usage (the rest are fees, taxes, credits, refunds, ...)
+USAGE_LINE_ITEM_TYPES = ("Usage", "DiscountedUsage", "SavingsPlanCoveredUsage")
+
+# Region prefixes of the usage types (the usages of us-east-1 may have none)
+USAGE_TYPE_REGIONS = {
+    "USE1": "us-east-1",
+    "USE2": "us-east-2",
+    "USW1": "us-west-1",
+    "USW2": "us-west-2",
+    "UGE1": "us-gov-east-1",
+    "UGW1": "us-gov-west-1",
+    "CAN1": "ca-central-1",
+    "SAE1": "sa-east-1",
+    "EU": "eu-west-1",
+    "EUW1": "eu-west-1",
+    "EUW2": "eu-west-2",
+    "EUW3": "eu-west-3",
+    "EUC1": "eu-central-1",
+    "EUN1": "eu-north-1",
+    "EUS1": "eu-south-1",
+    "APE1": "ap-east-1",
+    "APS1": "ap-southeast-1",
+    "APS2": "ap-southeast-2",
+    "APS3": "ap-south-1",
+    "APN1": "ap-northeast-1",
+    "APN2": "ap-northeast-2",
+    "APN3": "ap-northeast-3",
+    "MES1": "me-south-1",
+    "AFS1": "af-south-1",
+}
+
+INSTANCE_USAGE_PREFIXES = {
+    "AmazonEC2": ("BoxUsage", "SpotUsage", "DedicatedUsage", "HostBoxUsage"),
+    "AmazonRDS": ("InstanceUsage", "Multi-AZUsage"),
+    "AmazonElastiCache": ("NodeUsage",),
+}
+INSTANCE_SERVICES = {
+    "AmazonEC2": "EC2",
+    "AmazonRDS": "RDS",
+    "AmazonElastiCache": "ELASTICACHE",
+}
+
+# Suffixes of the "EBS:VolumeUsage" usage types
+EBS_VOLUME_TYPES = {
+    "gp2": "gp2",
+    "gp3": "gp3",
+    "piops": "io1",
+    "io2": "io2",
+    "st1": "st1",
+    "sc1": "sc1",
+}
+
+# Usage types of the S3 storage classes ("TimedStorage-<class>ByteHrs", in GB-Mo)
+S3_STORAGE_CLASSES = {
+    "TimedStorage-ByteHrs": "standard",
+    "TimedStorage-INT-FA-ByteHrs": "intelligent_tiering",
+    "TimedStorage-INT-IA-ByteHrs": "intelligent_tiering",
+    "TimedStorage-INT-AIA-ByteHrs": "intelligent_tiering",
+    "TimedStorage-XZ-ByteHrs": "express_onezone",
+    "TimedStorage-SIA-ByteHrs": "standard_ia",
+    "TimedStorage-ZIA-ByteHrs": "onezone_ia",
+    "TimedStorage-GIR-ByteHrs": "glacier_ir",
+    "TimedStorage-GlacierByteHrs": "glacier",
+    "TimedStorage-GDA-ByteHrs": "deep_archive",
+}
+
+SUMMARY_FIELDS = (
+    "energy_kwh",
+    "scope1_kgco2e",
+    "scope2_kgco2e",
+    "scope3_kgco2e",
+    "total_kgco2e",
+)
+
+
+def _resolve_columns(names: list[str]) -> dict[str, str]:
+    """
+    Map the fields of "CUR_COLUMNS" to the column names of an export (case
+    insensitive). Raises "ValueError" if a required field is missing.
+    """
+    by_lower = {name.lower(): name for name in names}
+    columns = {}
+    for field, aliases in CUR_COLUMNS.items():
+        for alias in aliases:
+            if alias.lower() in by_lower:
+                columns[field] = by_lower[alias.lower()]
+                break
+    missing = [
+        CUR_COLUMNS[field][0] for field in REQUIRED_FIELDS if field not in columns
+    ]
+    if missing:
+        raise ValueError(f"Not a CUR export, the columns {missing} are missing")
+    return columns
+
+
+class UsageAggregator:
+    """
+    Running sums of the usage amounts by (product, usage type, region, instance
+    type), with the line item counts and the period of the report.
+    """
+
+    def __init__(self) -> None:
+        self.usage: Counter[tuple[str, ...]] = Counter()
+        self.line_items = 0
+        self.usage_line_items = 0
+        self.period_start: str | None = None
+        self.period_end: str | None = None
+
+    def add_period(self, start: str | None, end: str | None) -> None:
+        if start and (self.period_start is None or start < self.period_start):
+            self.period_start = start
+        if end and (self.period_end is None or end > self.period_end):
+            self.period_end = end
+
+
+def read_csv(stream: IO[str], aggregator: UsageAggregator) -> None:
+    """
+    Add the line items of a CSV export (read row by row).
+
+    :param stream (IO[str]): The CSV export as text.
+    :param aggregator (UsageAggregator): The running sums of the report.
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if not header:
+        raise ValueError("The CUR export is empty")
+    columns = _resolve_columns(header)
+    index = {field: header.index(name) for field, name in columns.items()}
+    group_indexes = [index.get(field) for field in GROUP_FIELDS]
+    amount_index = index["usage_amount"]
+    type_index = index.get("line_item_type")
+    start_index = index.get("usage_start")
+
+    for row in reader:
+        aggregator.line_items += 1
+        if len(row) != len(header):
+            continue
+        if type_index is not None and row[type_index] not in USAGE_LINE_ITEM_TYPES:
+            continue
+        try:
+            amount = float(row[amount_index] or 0)
+        except ValueError:
+            continue
+        if not amount:
+            continue
+        key = tuple("" if i is None else row[i] for i in group_indexes)
+        aggregator.usage[key] += amount
+        aggregator.usage_line_items += 1
+        if start_index is not None:
+            aggregator.add_period(row[start_index], row[start_index])
+
+
+def _isoformat(value) -> str | None:
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def read_parquet(source, aggregator: UsageAggregator) -> None:
+    """
+    Add the line items of a Parquet export, by batches of "CUR_BATCH_ROWS"
+    rows that are filtered and grouped in a single (vectorized) pass.
+
+    :param source: The Parquet file (path or seekable file object).
+    :param aggregator (UsageAggregator): The running sums of the report.
+    """
+    if not PYARROW_AVAILABLE:
+        raise ValueError("The Parquet exports require PyArrow (pip install pyarrow)")
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(source)
+    columns = _resolve_columns(parquet_file.schema_arrow.names)
+    amount_column = columns["usage_amount"]
+    group_columns = [columns[field] for field in GROUP_FIELDS if field in columns]
+    usage_types = pa.array(USAGE_LINE_ITEM_TYPES)
+
+    for batch in parquet_file.iter_batches(
+        batch_size=CUR_BATCH_ROWS, columns=sorted(set(columns.values()))
+    ):
+        table = pa.Table.from_batches([batch])
+        aggregator.line_items += table.num_rows
+        if "line_item_type" in columns:
+            line_item_types = table[columns["line_item_type"]]
+            table = table.filter(pc.is_in(line_item_types, value_set=usage_types))
+        amounts = pc.cast(table[amount_column], pa.float64())
+        table = table.filter(pc.fill_null(pc.not_equal(amounts, 0), False))
+        if not table.num_rows:
+            continue
+        aggregator.usage_line_items += table.num_rows
+        if "usage_start" in columns:
+            bounds = pc.min_max(table[columns["usage_start"]]).as_py()
+            aggregator.add_period(_isoformat(bounds["min"]), _isoformat(bounds["max"]))
+
+        table = table.set_column(
+            table.schema.get_field_index(amount_column),
+            amount_column,
+            pc.cast(table[amount_column], pa.float64()),
+        )
+        grouped = table.group_by(group_columns).aggregate([(amount_column, "sum")])
+        for row in grouped.to_pylist():
+            key = tuple(
+                (row[columns[field]] or "") if field in columns else ""
+                for field in GROUP_FIELDS
+            )
+            aggregator.usage[key] += row[f"{amount_column}_sum"]
+
+
+def _open_csv(source: str) -> IO[str]:
+    if source.startswith("s3://"):
+        bucket, _, key = source[len("s3://") :].partition("/")
+        stream = clients.get_client("s3").get_object(Bucket=bucket, Key=key)["Body"]
+    else:
+        stream = open(source, "rb")
+    if source.endswith(".gz"):
+        stream = gzip.GzipFile(fileobj=stream)
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def read_export(source: str, aggregator: UsageAggregator) -> None:
+    """
+    Add the line items of a CUR export file (CSV, gzipped CSV or Parquet).
+
+    :param source (str): Local path or S3 URI ("s3://<bucket>/<key>") of the file.
+    :param aggregator (UsageAggregator): The running sums of the report.
+    """
+    if source.endswith(".parquet"):
+        if source.startswith("s3://") and PYARROW_AVAILABLE:
+            from pyarrow import fs
+
+            filesystem, path = fs.FileSystem.from_uri(source)
+            with filesystem.open_input_file(path) as parquet_file:
+                read_parquet(parquet_file, aggregator)
+        else:
+            read_parquet(source, aggregator)
+        return
+
+    with _open_csv(source) as stream:
+        read_csv(stream, aggregator)
+
+
+def _classify(
+    product_code: str, usage_type: str, region: str, instance_type: str
+) -> tuple[tuple[str, ...], str] | None:
+    """
+    Map a usage to the key of its resource and the metric of its usage amount,
+    e.g. ("EC2", "us-east-1", "m5.large", "") and "hours" (None if unsupported).
+    """
+    prefix, _, usage = usage_type.partition("-")
+    if prefix in USAGE_TYPE_REGIONS and usage:
+        region = region or USAGE_TYPE_REGIONS[prefix]
+    else:
+        usage = usage_type
+    region = region or carbon.DEFAULT_REGION
+    kind, _, detail = usage.partition(":")
+
+    if product_code in INSTANCE_SERVICES and kind.startswith(
+        INSTANCE_USAGE_PREFIXES[product_code]
+    ):
+        multi_az = "multi_az" if kind.startswith("Multi-AZ") else ""
+        service = INSTANCE_SERVICES[product_code]
+        return (service, region, instance_type or detail, multi_az), "hours"
+    if product_code == "AmazonEC2" and kind == "EBS":
+        volume_type = EBS_VOLUME_TYPES.get(detail.partition("VolumeUsage.")[2])
+        if volume_type:
+            return ("EBS", region, volume_type), "gb_months"
+    if product_code == "AmazonS3" and usage in S3_STORAGE_CLASSES:
+        return ("S3", region, S3_STORAGE_CLASSES[usage]), "gb_months"
+    if product_code == "AWSLambda" and usage.startswith("Lambda-GB-Second"):
+        architecture = "arm64" if usage.endswith("-ARM") else "x86_64"
+        return ("LAMBDA", region, architecture), "gb_seconds"
+    if product_code in ("AmazonECS", "AmazonEKS") and usage.startswith("Fargate-"):
+        architecture = "arm64" if "-ARM-" in usage else "x86_64"
+        if "vCPU-Hours" in usage:
+            return ("FARGATE", region, architecture), "vcpu_hours"
+        if usage.endswith("GB-Hours") and "Storage" not in usage:
+            return ("FARGATE", region, architecture), "gb_hours"
+    return None
+
+
+def _build_resource(key: tuple[str, ...], metrics: Counter) -> dict | None:
+    """
+    Resource of "carbon.estimate_footprint()" for the summed usage of a key
+    (None if it is not supported by the footprint calculations).
+    """
+    service, region = key[0], key[1]
+    if region not in carbon.REGION_GRID_INTENSITY:
+        return None
+    resource = {"service": service, "region": region, "hours": carbon.DEFAULT_HOURS}
+
+    if service in ("EC2", "RDS", "ELASTICACHE"):
+        instance_type, multi_az = key[2], key[3]
+        if not catalog.is_valid_instance_type(instance_type, service):
+            return None
+        # The instance hours of the period, as a single instance running for all of them
+        resource.update(
+            instance_type=instance_type,
+            hours=metrics["hours"],
+            multi_az=bool(multi_az),
+        )
+    elif service == "EBS":
+        # GB-months: the average size of every month, for a month of hours
+        resource.update(volume_type=key[2], size_gb=metrics["gb_months"])
+    elif service == "S3":
+        resource.update(storage_class=key[2], size_gb=metrics["gb_months"])
+    elif service == "LAMBDA":
+        # GB-seconds: the seconds of running time with 1 GB of memory
+        resource.update(
+            memory_mb=1024,
+            invocations=metrics["gb_seconds"],
+            avg_duration_ms=1000,
+            architecture=key[2],
+        )
+    else:  # FARGATE
+        if not metrics["vcpu_hours"]:
+            return None
+        # vCPU-hours: a single vCPU task with the average memory per vCPU
+        memory_gib = metrics["gb_hours"] / metrics["vcpu_hours"]
+        resource.update(
+            vcpu=1,
+            memory_gb=min(memory_gib, catalog.FARGATE_MAX_MEMORY_GIB),
+            hours=metrics["vcpu_hours"],
+            architecture=key[2],
+        )
+    return resource
+
+
+def summarize(
+    aggregator: UsageAggregator, utilization: float = carbon.DEFAULT_UTILIZATION
+) -> dict:
+    """
+    Compact footprint report of the usage: totals per service and per region,
+    the resources with the highest footprint and the usages not supported.
+
+    :param aggregator (UsageAggregator): The usage read from the CUR exports.
+    :param utilization (float): Average CPU utilization (0-1) of the compute.
+    """
+    usage_metrics: dict[tuple, Counter] = {}
+    skipped = Counter()
+    for (
+        product_code,
+        usage_type,
+        region,
+        instance_type,
+    ), amount in aggregator.usage.items():
+        classified = _classify(product_code, usage_type, region, instance_type)
+        if classified is None:
+            skipped[f"{product_code} {usage_type}"] += amount
+            continue
+        key, metric = classified
+        usage_metrics.setdefault(key, Counter())[metric] += amount
+
+    resources = []
+    for key, metrics in usage_metrics.items():
+        resource = _build_resource(key, metrics)
+        if resource is None:
+            skipped[" ".join(part for part in key if part)] += sum(metrics.values())
+        else:
+            resources.append(resource)
+    if not resources:
+        raise ValueError("The CUR export has no usage of the supported services")
+
+    footprint = carbon.estimate_footprint(resources, utilization=utilization)
+    by_service, by_region = {}, {}
+    for result in footprint["resources"]:
+        for group, name in (
+            (by_service, result["service"]),
+            (by_region, result["region"]),
+        ):
+            totals = group.setdefault(name, dict.fromkeys(SUMMARY_FIELDS, 0.0))
+            for field in SUMMARY_FIELDS:
+                totals[field] += result[field]
+    for group in (by_service, by_region):
+        for totals in group.values():
+            for field in SUMMARY_FIELDS:
+                totals[field] = round(totals[field], 4)
+
+    top_resources = sorted(
+        footprint["resources"], key=lambda result: result["total_kgco2e"], reverse=True
+    )
+    return {
+        "period": {"start": aggregator.period_start, "end": aggregator.period_end},
+        "line_items": {
+            "total": aggregator.line_items,
+            "usage": aggregator.usage_line_items,
+            "distinct_usages": len(aggregator.usage),
+        },
+        "totals": footprint["totals"],
+        "by_service": by_service,
+        "by_region": by_region,
+        "top_resources": top_resources[:CUR_TOP_ITEMS],
+        "skipped_usages": [
+            {"usage": usage, "amount": round(amount, 4)}
+            for usage, amount in skipped.most_common(CUR_TOP_ITEMS)
+        ],
+        "assumptions": footprint["assumptions"]
+        + [
+            "Instance usage as the total instance hours of the period",
+            "Lambda usage from its GB-seconds (the seconds with 1 GB of memory)",
+            "Fargate usage from its vCPU-hours and GB-hours",
+        ],
+    }
+
+
+def validate_sources(sources: list[str]) -> list[str]:
+    """
+    Validate the S3 URIs of the exports requested through the API: only the CSV
+    (or gzipped CSV) files under the "CUR_BUCKET" and "CUR_PREFIX" are allowed.
+    The Parquet exports are only supported by the CLI, as PyArrow is not in the
+    Lambda layers.
+
+    :param sources (list[str]): The S3 URIs ("s3://<bucket>/<key>") of the files.
+    """
+    if not CUR_BUCKET:
+        raise ValueError("The S3 <sources> are not enabled, send the <csv> export")
+    for source in sources:
+        bucket, _, key = source.removeprefix("s3://").partition("/")
+        if (
+            not source.startswith("s3://")
+            or bucket != CUR_BUCKET
+            or not key.startswith(CUR_PREFIX)
+        ):
+            allowed = f"s3://{CUR_BUCKET}/{CUR_PREFIX}"
+            raise ValueError(f"Invalid source <{source}>, it must be in {allowed}")
+        if key.endswith(".parquet"):
+            raise ValueError(
+                f"Invalid source <{source}>, the Parquet exports are only supported "
+                "by the CLI (use the CSV exports)"
+            )
+    return sources
+
+
+def build_report(
+    sources: list[str | IO[str]], utilization: float = carbon.DEFAULT_UTILIZATION
+) -> dict:
+    """
+    Footprint report of one or more CUR export files (see "summarize()").
+
+    :param sources (list): Local paths or S3 URIs of the export files, or CSV
+        text streams.
+    :param utilization (float): Average CPU utilization (0-1) of the compute.
+    """
+    aggregator = UsageAggregator()
+    for source in sources:
+        if isinstance(source, str):
+            read_export(source, aggregator)
+        else:
+            read_csv(source, aggregator)
+    return summarize(aggregator, utilization)
+
+
+async def arecommend(report: dict) -> dict:
+    """
+    Ask the model for recommendations on a footprint report. Only the compact
+    report is sent (never the line items). Returns the "answer" and "usage".
+
+    :param report (dict): The report returned by "build_report()".
+    """
+    messages = [
+        {"role": "user", "content": prompts.CUR_INSTRUCTIONS + json.dumps(report)}
+    ]
+    body = bedrock.build_request_body(prompts.SYSTEM_PROMPT, messages)
+    response_body = await routing.ainvoke(body, "heavy")
+    return {
+        "answer": bedrock.extract_text(response_body),
+        "usage": bedrock.extract_usage(response_body.get("usage", {})),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "sources", nargs="+", help="CUR export files (local paths or s3:// URIs)"
+    )
+    parser.add_argument(
+        "--utilization",
+        type=float,
+        default=carbon.DEFAULT_UTILIZATION,
+        help="Average CPU utilization (0-1)",
+    )
+    parser.add_argument(
+        "--recommendations",
+        action="store_true",
+        help="Ask the model (Bedrock) for recommendations on the report",
+    )
+    args = parser.parse_args()
+
+    report = build_report(args.sources, args.utilization)
+    if args.recommendations:
+        report["recommendations"] = asyncio.run(arecommend(report))["answer"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+####################################################################################################
+# IMAGE INGESTION (FORMAT DETECTION, DOWNSCALING, RECOMPRESSION AND DEDUPLICATION)
+####################################################################################################
+
+# Built-in imports
+import io
+import os
+import base64
+import hashlib
+import binascii
+import importlib.util
+
+
+# Pillow is optional (images are then only validated) and it is imported with
+# the first image, to keep it out of the cold start of the Lambda Functions
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+# Maximum size of an uploaded image (decoded), checked before any processing
+IMAGE_MAX_UPLOAD_BYTES = int(os.environ.get("IMAGE_MAX_UPLOAD_BYTES", 20_000_000))
+# Maximum size of an image (decoded) after the preprocessing, larger images are rejected
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 3_750_000))
+# Size target of the recompression (images below it are sent as uploaded)
+IMAGE_TARGET_BYTES = int(os.environ.get("IMAGE_TARGET_BYTES", 400_000))
+# Longest edge recommended for the Anthropic models, larger images are downscaled
+# by the model itself (so the extra pixels only cost upload size and latency)
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 1568))
+
+# Quality steps of the JPEG recompression, until the image fits the size target
+JPEG_QUALITIES = (85, 75, 65, 50)
+
+# Signatures (magic bytes) of the image formats supported by the model
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+PIL_FORMATS = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+    "image/gif": "GIF",
+    "image/webp": "WEBP",
+}
+SAVE_OPTIONS = {
+    "image/jpeg": {"quality": JPEG_QUALITIES[0], "optimize": True},
+    "image/png": {"optimize": True},
+}
+
+
+def sniff_media_type(data: bytes) -> str | None:
+    """
+    Detect the media type of an image from its magic bytes (None if unsupported).
+
+    :param data (bytes): The raw image.
+    """
+    for signature, media_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def decode_image(image_base64: str) -> bytes:
+    """
+    Decode a base64 image, optionally sent as a data URL ("data:image/...;base64,").
+
+    :param image_base64 (str): The "imageBase" of the captain endpoints.
+    """
+    if not isinstance(image_base64, str):
+        raise ValueError("The <imageBase> must be a base64 string")
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.partition(",")[2]
+    # Base64 has 4 characters for every 3 bytes
+    if len(image_base64) * 3 // 4 > IMAGE_MAX_UPLOAD_BYTES:
+        raise ValueError(
+            f"The image is too large, the maximum upload is {IMAGE_MAX_UPLOAD_BYTES} bytes"
+        )
+    try:
+        return base64.b64decode(image_base64, validate=True)
+    except binascii.Error:
+        raise ValueError("The <imageBase> is not valid base64")
+
+
+def image_digest(data: bytes) -> str:
+    """
+    Content hash of a raw image (to detect images already sent in a session).
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def _encode(image, pil_format: str, **options) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=pil_format, **options)
+    return output.getvalue()
+
+
+def _shrink(data: bytes, media_type: str) -> tuple[bytes, str]:
+    """
+    Downscale the image to "IMAGE_MAX_DIMENSION" and, if it is still above the
+    size target, recompress it (as JPEG with decreasing qualities if needed).
+    Returns the smallest version and its media type.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if getattr(image, "is_animated", False):
+        return data, media_type  # Animations are not resampled
+
+    resized = max(image.size) > IMAGE_MAX_DIMENSION
+    if not resized and len(data) <= IMAGE_TARGET_BYTES:
+        return data, media_type
+
+    candidates = []
+    if resized:
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+    else:
+        candidates.append((data, media_type))
+    # Diagrams compress better (and keep a sharper text) in their lossless format
+    if resized or media_type == "image/png":
+        options = SAVE_OPTIONS.get(media_type, {})
+        candidates.append(
+            (_encode(image, PIL_FORMATS[media_type], **options), media_type)
+        )
+    best = min(candidates, key=lambda candidate: len(candidate[0]))
+
+    if len(best[0]) > IMAGE_TARGET_BYTES:
+        # JPEG has no transparency, so it is flattened on a white background
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        for quality in JPEG_QUALITIES:
+            jpeg = _encode(image, "JPEG", quality=quality, optimize=True)
+            if len(jpeg) < len(best[0]):
+                best = (jpeg, "image/jpeg")
+            if len(jpeg) <= IMAGE_TARGET_BYTES:
+                break
+    return best
+
+
+def prepare_image(data: bytes) -> tuple[str, str]:
+    """
+    Preprocess a raw image for the model: detect its real media type, shrink it
+    (if Pillow is available) and enforce the "IMAGE_MAX_BYTES" budget.
+    Returns the media type and the base64 data of the image block.
+
+    :param data (bytes): The raw image (see "decode_image()").
+    """
+    media_type = sniff_media_type(data)
+    if media_type is None:
+        raise ValueError("Unsupported image format (supported: JPEG, PNG, GIF, WEBP)")
+
+    if PILLOW_AVAILABLE:
+        from PIL import Image
+
+        try:
+            data, media_type = _shrink(data, media_type)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ValueError(f"The image could not be processed: {e}")
+
+    if len(data) > IMAGE_MAX_BYTES:
+        raise ValueError(
+            f"The image is too large ({len(data)} bytes), "
+            f"the maximum is {IMAGE_MAX_BYTES} bytes"
+        )
+    return media_type, base64.b64encode(data).decode("ascii")
@@ -0,0 +1,335 @@
+####################################################################################################
+# ASYNCHRONOUS ASSESSMENT JOBS (JOB STORE, PAYLOADS AND WORK QUEUE)
+####################################################################################################
+
+# Built-in imports
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable
+
+# External imports
+from aws_lambda_powertools import Logger
+from ulid import ULID
+
+# Own imports
+from api.v1.helpers import clients
+
+
+logger = Logger(service="captain-sustainability", child=True)
+
+# Time to keep the jobs (and their payloads) after their submission
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 24 * 60 * 60))
+# Attempts of a job with errors (e.g. throttling) before it is marked as failed
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# A job "RUNNING" for longer than the worker timeout (plus a margin) lost its
+# attempt (worker timed out or crashed before updating it)
+JOB_RUNNING_TIMEOUT_SECONDS = int(os.environ.get("JOB_RUNNING_TIMEOUT_SECONDS", 660))
+# Backoff before retrying a failed attempt (full jitter, doubled per attempt).
+# The queue visibility timeout is much longer (6 times the worker timeout), so
+# the failed messages are made visible again after this delay instead
+JOB_RETRY_BASE_SECONDS = int(os.environ.get("JOB_RETRY_BASE_SECONDS", 30))
+JOB_RETRY_MAX_SECONDS = int(os.environ.get("JOB_RETRY_MAX_SECONDS", 300))
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+
+
+def new_job_id() -> str:
+    # ULIDs are sortable by submission time
+    return str(ULID())
+
+
+def retry_delay(attempt: int) -> int:
+    """
+    Seconds to wait before retrying a job after its failed "attempt" (1-based).
+    """
+    ceiling = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    return int(random.uniform(0, ceiling))
+
+
+class InMemoryJobBackend:
+    """
+    Jobs, payloads and queue in the process memory (for local development and
+    tests). The queued jobs are run by the API process itself (see "receive()").
+    """
+
+    def __init__(self, max_jobs: int = 1000) -> None:
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, str] = OrderedDict()
+        self._payloads: dict[str, str] = {}
+        self._queue: deque[str] = deque()
+        self._lock = threading.Lock()
+
+    def put_job(self, job: dict) -> None:
+        with self._lock:
+            self._jobs[job["job_id"]] = json.dumps(job)
+            while len(self._jobs) > self.max_jobs:
+                job_id, _ = self._jobs.popitem(last=False)
+                self._payloads.pop(f"input/{job_id}", None)
+                self._payloads.pop(f"result/{job_id}", None)
+
+    def get_job(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(job) if job else None
+
+    def put_payload(self, key: str, payload: dict) -> None:
+        with self._lock:
+            self._payloads[key] = json.dumps(payload)
+
+    def get_payload(self, key: str) -> dict:
+        with self._lock:
+            return json.loads(self._payloads[key])
+
+    def send(self, job_id: str) -> None:
+        with self._lock:
+            self._queue.append(job_id)
+
+    def receive(self) -> str | None:
+        """
+        Get the next queued job (None if the queue is empty).
+        """
+        with self._lock:
+            return self._queue.popleft() if self._queue else None
+
+    def delay(self, receipt_handle: str, delay_seconds: int) -> None:
+        # The local jobs run once (there are no retries to delay)
+        pass
+
+
+class AWSJobBackend:
+    """
+    Jobs on a DynamoDB table with TTL (partition key "job_id"), payloads on an
+    S3 bucket and queue on SQS. The payloads (inputs and results) are stored on
+    S3, as the images and the conversations can exceed the DynamoDB item size.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        bucket_name: str,
+        queue_url: str,
+        ttl_seconds: int,
+    ) -> None:
+        """
+        :param table_name (str): The DynamoDB table name.
+        :param bucket_name (str): The S3 bucket name (with a lifecycle expiration).
+        :param queue_url (str): The SQS queue URL (consumed by the worker function).
+        :param ttl_seconds (int): Time to live of the jobs since their submission.
+        """
+        self.table_name = table_name
+        self.bucket_name = bucket_name
+        self.queue_url = queue_url
+        self.ttl_seconds = ttl_seconds
+
+    def _client(self, service_name: str):
+        # Created on first use, to keep them out of the cold start
+        return clients.get_client(service_name)
+
+    def put_job(self, job: dict) -> None:
+        self._client("dynamodb").put_item(
+            TableName=self.table_name,
+            Item={
+                "job_id": {"S": job["job_id"]},
+                "job": {"S": json.dumps(job)},
+                "expires_at": {"N": str(int(job["created_at"]) + self.ttl_seconds)},
+            },
+        )
+
+    def get_job(self, job_id: str) -> dict | None:
+        response = self._client("dynamodb").get_item(
+            TableName=self.table_name,
+            Key={"job_id": {"S": job_id}},
+        )
+        item = response.get("Item")
+        if not item or int(item["expires_at"]["N"]) < time.time():
+            return None
+        return json.loads(item["job"]["S"])
+
+    def put_payload(self, key: str, payload: dict) -> None:
+        self._client("s3").put_object(
+            Bucket=self.bucket_name,
+            Key=f"jobs/{key}.json",
+            Body=json.dumps(payload).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def get_payload(self, key: str) -> dict:
+        response = self._client("s3").get_object(
+            Bucket=self.bucket_name, Key=f"jobs/{key}.json"
+        )
+        return json.loads(response["Body"].read())
+
+    def send(self, job_id: str) -> None:
+        self._client("sqs").send_message(QueueUrl=self.queue_url, MessageBody=job_id)
+
+    def delay(self, receipt_handle: str, delay_seconds: int) -> None:
+        """
+        Make a received message visible again after "delay_seconds".
+        """
+        self._client("sqs").change_message_visibility(
+            QueueUrl=self.queue_url,
+            ReceiptHandle=receipt_handle,
+            VisibilityTimeout=delay_seconds,
+        )
+
+
+class JobStore:
+    """
+    Async facade for the job backends (their calls run in a thread).
+    """
+
+    def __init__(self, backend: InMemoryJobBackend | AWSJobBackend) -> None:
+        self.backend = backend
+
+    @classmethod
+    def from_env(cls) -> "JobStore":
+        """
+        AWS backend if "JOBS_TABLE", "JOBS_BUCKET" and "JOBS_QUEUE_URL" are
+        configured, otherwise in-memory.
+        """
+        table_name = os.environ.get("JOBS_TABLE")
+        bucket_name = os.environ.get("JOBS_BUCKET")
+        queue_url = os.environ.get("JOBS_QUEUE_URL")
+        if table_name and bucket_name and queue_url:
+            return cls(
+                AWSJobBackend(table_name, bucket_name, queue_url, JOB_TTL_SECONDS)
+            )
+        return cls(InMemoryJobBackend())
+
+    @property
+    def local(self) -> bool:
+        """
+        Whether the queued jobs have to be run by this process (in-memory backend).
+        """
+        return isinstance(self.backend, InMemoryJobBackend)
+
+    async def _update(self, job: dict, **fields) -> dict:
+        job = {**job, **fields, "updated_at": time.time()}
+        await asyncio.to_thread(self.backend.put_job, job)
+        return job
+
+    async def asubmit(self, event: dict) -> dict:
+        """
+        Store the input of a new job and queue it. Returns the job.
+
+        :param event (dict): The input payload of the assessment.
+        """
+        now = time.time()
+        job = {
+            "job_id": new_job_id(),
+            "status": QUEUED,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await asyncio.to_thread(
+            self.backend.put_payload, f"input/{job['job_id']}", event
+        )
+        await asyncio.to_thread(self.backend.put_job, job)
+        await asyncio.to_thread(self.backend.send, job["job_id"])
+        return job
+
+    async def aget(self, job_id: str) -> dict | None:
+        """
+        Get a job with its "result" once it succeeded (None if unknown or expired).
+        The attempts lost by the worker are reported as "QUEUED" or "FAILED".
+
+        :param job_id (str): The job identifier returned by "asubmit()".
+        """
+        try:
+            ULID.from_str(job_id)
+        except ValueError:
+            return None
+        job = await asyncio.to_thread(self.backend.get_job, job_id)
+        if (
+            job
+            and job["status"] == RUNNING
+            and time.time() - job["updated_at"] > JOB_RUNNING_TIMEOUT_SECONDS
+        ):
+            # The lost attempt is retried from the queue, unless it was the last
+            # one (the message then goes to the dead-letter queue)
+            if job["attempts"] >= JOB_MAX_ATTEMPTS:
+                job.update(status=FAILED, error="The job timed out")
+            else:
+                job["status"] = QUEUED
+        if job and job["status"] == SUCCEEDED:
+            job["result"] = await asyncio.to_thread(
+                self.backend.get_payload, f"result/{job_id}"
+            )
+        return job
+
+    async def arun(
+        self,
+        job_id: str,
+        process: Callable[[dict], Awaitable[dict]],
+        final_attempt: bool = True,
+    ) -> None:
+        """
+        Run a queued job and store its result. Invalid inputs ("ValueError") fail
+        the job at once, other errors are raised again to retry the job (from the
+        queue), unless it is the "final_attempt".
+
+        :param job_id (str): The job identifier.
+        :param process (Callable): Async function that returns the job result for
+            the job input.
+        :param final_attempt (bool): Mark the job as failed if this attempt fails.
+        """
+        job = await asyncio.to_thread(self.backend.get_job, job_id)
+        if job is None or job["status"] in (SUCCEEDED, FAILED):
+            # Expired, or duplicated delivery of a finished job (at-least-once queues)
+            logger.info("Skipped a finished or expired job", job_id=job_id)
+            return
+
+        job = await self._update(job, status=RUNNING, attempts=job["attempts"] + 1)
+        try:
+            event = await asyncio.to_thread(self.backend.get_payload, f"input/{job_id}")
+            result = await process(event)
+        except ValueError as e:
+            await self._update(job, status=FAILED, error=str(e))
+            return
+        except Exception as e:
+            if final_attempt:
+                await self._update(job, status=FAILED, error=str(e))
+                return
+            await self._update(job, status=QUEUED, error=str(e))
+            raise
+
+        await asyncio.to_thread(self.backend.put_payload, f"result/{job_id}", result)
+        await self._update(job, status=SUCCEEDED, error=None)
+
+    async def adelay_retry(self, receipt_handle: str, attempt: int) -> None:
+        """
+        Retry a failed job from the queue after a short backoff (see
+        "retry_delay()"). Errors are only logged, the message is then retried
+        after the queue visibility timeout.
+
+        :param receipt_handle (str): The receipt handle of the queue message.
+        :param attempt (int): The failed attempt (the message receive count).
+        """
+        delay_seconds = retry_delay(attempt)
+        try:
+            await asyncio.to_thread(self.backend.delay, receipt_handle, delay_seconds)
+        except Exception as e:
+            logger.warning(f"Error delaying the retry of the job: {e}")
+            return
+        logger.info("Delayed the retry of the job", delay_seconds=delay_seconds)
+
+    async def arun_local(self, process: Callable[[dict], Awaitable[dict]]) -> None:
+        """
+        Run the queued jobs of the in-memory backend (local development).
+
+        :param process (Callable): See "arun()".
+        """
+        while (job_id := self.backend.receive()) is not None:
+            await self.arun(job_id, process)
+
+
+job_store = JobStore.from_env()
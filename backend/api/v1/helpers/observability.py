@@ -0,0 +1,224 @@
+####################################################################################################
+# PER-REQUEST METRICS (CLOUDWATCH EMBEDDED METRIC FORMAT), TRACING AND PAYLOAD LOGS
+####################################################################################################
+
+# Built-in imports
+import os
+import time
+import random
+import hashlib
+import logging
+from contextvars import ContextVar
+
+# External imports
+from aws_lambda_powertools import Tracer
+from aws_lambda_powertools.metrics import EphemeralMetrics, MetricUnit
+
+
+SERVICE_NAME = "captain-sustainability"
+METRICS_NAMESPACE = os.environ.get(
+    "POWERTOOLS_METRICS_NAMESPACE", "CaptainSustainability"
+)
+
+# Traces of the Lambda handler and of the boto3 calls (Bedrock and DynamoDB).
+# The X-Ray SDK takes ~100 ms to import, so the tracer is only created when it
+# can trace: on Lambda, unless "POWERTOOLS_TRACE_DISABLED" is set
+TRACING_ENABLED = (
+    "AWS_LAMBDA_FUNCTION_NAME" in os.environ
+    and os.environ.get("POWERTOOLS_TRACE_DISABLED", "false").lower() != "true"
+)
+tracer = Tracer(service=SERVICE_NAME) if TRACING_ENABLED else None
+
+# Metrics of the request in progress (the concurrent requests of the streaming
+# function and the items of a batch run in their own async contexts)
+_request_metrics: ContextVar["RequestMetrics | None"] = ContextVar(
+    "request_metrics", default=None
+)
+
+_cold_start = True
+
+# Share of the requests that log their full payloads (prompts and answers, but
+# never the image data) while the log level is above DEBUG. The Powertools
+# sampling ("POWERTOOLS_LOGGER_SAMPLE_RATE") is only decided on the cold start
+# and for all the logs of the container, so the payloads are sampled per request
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", 0))
+
+_payload_sampled: ContextVar[bool] = ContextVar("payload_sampled", default=False)
+
+
+class RequestMetrics:
+    """
+    Metrics of a single request, published as one EMF log entry when the
+    request ends, with the "route" and "model_id" dimensions.
+    """
+
+    def __init__(self) -> None:
+        # Ephemeral metrics are not shared between requests (unlike "Metrics")
+        self.metrics = EphemeralMetrics(
+            namespace=METRICS_NAMESPACE, service=SERVICE_NAME
+        )
+        self.model_id = "none"
+
+    def add(self, name: str, unit: MetricUnit, value: float) -> None:
+        self.metrics.add_metric(name=name, unit=unit, value=value)
+
+    def flush(self, route: str) -> None:
+        self.metrics.add_dimension(name="route", value=route)
+        self.metrics.add_dimension(name="model_id", value=self.model_id)
+        self.metrics.flush_metrics()
+
+
+def add_metric(name: str, unit: MetricUnit, value: float) -> None:
+    """
+    Add a metric to the current request (ignored outside of a request).
+
+    :param name (str): The metric name.
+    :param unit (MetricUnit): The metric unit.
+    :param value (float): The metric value.
+    """
+    metrics = _request_metrics.get()
+    if metrics is not None:
+        metrics.add(name, unit, value)
+
+
+def set_model(model_id: str) -> None:
+    """
+    Set the "model_id" dimension of the current request metrics.
+    """
+    metrics = _request_metrics.get()
+    if metrics is not None:
+        metrics.model_id = model_id
+
+
+def add_usage_metrics(usage: dict) -> None:
+    """
+    Add the token counts of a model call (see "bedrock.extract_usage()").
+    """
+    add_metric("InputTokens", MetricUnit.Count, usage["input_tokens"])
+    add_metric("OutputTokens", MetricUnit.Count, usage["output_tokens"])
+    add_metric(
+        "CacheReadInputTokens", MetricUnit.Count, usage["cache_read_input_tokens"]
+    )
+    add_metric(
+        "CacheWriteInputTokens", MetricUnit.Count, usage["cache_write_input_tokens"]
+    )
+
+
+def summarize_text(text: str) -> dict:
+    """
+    Stand-in of a text for the logs: its digest and length (not its content).
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return {"sha256": digest[:16], "length": len(text)}
+
+
+def _redact_content(content: str | list, keep_text: bool) -> str | dict | list:
+    if isinstance(content, str):
+        return content if keep_text else summarize_text(content)
+    blocks = []
+    for block in content:
+        if block.get("type") == "image":
+            source = block.get("source", {})
+            blocks.append(
+                {
+                    "type": "image",
+                    "media_type": source.get("media_type"),
+                    "bytes": len(source.get("data", "")) * 3 // 4,
+                }
+            )
+        elif block.get("type") == "text" and not keep_text:
+            blocks.append({"type": "text", **summarize_text(block["text"])})
+        else:
+            blocks.append(block)
+    return blocks
+
+
+def redact_messages(messages: list[dict], keep_text: bool = False) -> list[dict]:
+    """
+    Copy of a conversation that is safe and cheap to log: the image data is
+    replaced by its size and, unless "keep_text", the texts by their digest.
+
+    :param messages (list[dict]): The conversation in Anthropic "messages" format.
+    :param keep_text (bool): Keep the full texts (prompts and answers).
+    """
+    return [
+        {
+            "role": message["role"],
+            "content": _redact_content(message["content"], keep_text),
+        }
+        for message in messages
+    ]
+
+
+def log_messages(logger, message: str, messages: list[dict], **fields) -> None:
+    """
+    Log a conversation: redacted at INFO level, and with the full texts at
+    DEBUG level or for the sampled requests (see "LOG_PAYLOAD_SAMPLE_RATE").
+    The log fields are only built if the log is written.
+
+    :param logger (Logger): The Powertools logger of the caller.
+    :param message (str): The log message.
+    :param messages (list[dict]): The conversation in Anthropic "messages" format.
+    :param fields: Additional keys of the log entry.
+    """
+    # The "location" of the log entries is the caller of this function
+    if logger.isEnabledFor(logging.DEBUG):
+        messages = redact_messages(messages, keep_text=True)
+        logger.debug(message, stacklevel=3, messages=messages, **fields)
+    elif _payload_sampled.get():
+        messages = redact_messages(messages, keep_text=True)
+        logger.info(
+            message, stacklevel=3, messages=messages, payload_sampled=True, **fields
+        )
+    elif logger.isEnabledFor(logging.INFO):
+        logger.info(message, stacklevel=3, messages=redact_messages(messages), **fields)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that collects the metrics of every HTTP request: latency,
+    request and response bytes (also for streamed responses), cold start, and
+    the metrics added by the endpoints during the request. It also decides if
+    the request logs its full payloads (see "LOG_PAYLOAD_SAMPLE_RATE").
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        metrics = RequestMetrics()
+        sizes = {"request": 0, "response": 0}
+
+        async def receive_with_size():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def send_with_size(message):
+            if message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        token = _request_metrics.set(metrics)
+        sampled_token = _payload_sampled.set(random.random() < LOG_PAYLOAD_SAMPLE_RATE)
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive_with_size, send_with_size)
+        finally:
+            _request_metrics.reset(token)
+            _payload_sampled.reset(sampled_token)
+            latency_ms = (time.perf_counter() - start_time) * 1000
+            metrics.add("RequestLatency", MetricUnit.Milliseconds, latency_ms)
+            metrics.add("RequestBytes", MetricUnit.Bytes, sizes["request"])
+            metrics.add("ResponseBytes", MetricUnit.Bytes, sizes["response"])
+            metrics.add("ColdStart", MetricUnit.Count, int(cold_start))
+            # The route template (not the path) keeps the dimension cardinality low
+            route = scope.get("route")
+            metrics.flush(route.path if route is not None else "unmatched")
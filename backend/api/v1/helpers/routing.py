@@ -0,0 +1,269 @@
+####################################################################################################
+# MODEL REGISTRY, ROUTING (LIGHT/HEAVY TIERS) AND THROTTLING FAILOVER
+####################################################################################################
+
+# Built-in imports
+import os
+import json
+import time
+import random
+import asyncio
+from typing import AsyncIterator, Awaitable
+
+# External imports
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
+from botocore.exceptions import ClientError
+
+# Own imports
+from api.v1.helpers import admission, bedrock, catalog, observability
+
+
+logger = Logger(service="captain-sustainability", child=True)
+
+# Models of every tier, in failover order (the first one is the primary). Every
+# target is a Bedrock model or inference profile with an optional region (the
+# throttling quotas are per region). Configured with the "model_registry" of
+# the CDK "app_config", which is passed as JSON to the "MODEL_REGISTRY" variable
+DEFAULT_MODEL_REGISTRY = {
+    "heavy": [{"model_id": bedrock.MODEL_ID}],
+    "light": [
+        {"model_id": "us.anthropic.claude-3-5-haiku-20241022-v1:0"},
+        {"model_id": bedrock.MODEL_ID},
+    ],
+}
+MODEL_TIERS = ("light", "heavy")
+# Note: the system prompt is below the prompt caching minimum of Claude 3.5 Haiku
+# (2048 tokens), so the savings of the prompt cache only apply to the "heavy"
+# tier and to the long conversations of the "light" tier
+
+# Prompts up to this length (without images, structured resources or instance
+# types) are follow-ups or clarifications, answered by the "light" tier
+LIGHT_PROMPT_MAX_CHARS = int(os.environ.get("LIGHT_PROMPT_MAX_CHARS", 300))
+
+# Errors that move the request to the next model of the tier (the error codes
+# inside of the response streams start with lowercase, e.g. "throttlingException")
+FAILOVER_ERROR_CODES = {"throttlingexception", "serviceunavailableexception"}
+
+# When all the models of a tier are throttled, the request is retried with
+# exponential backoff and "full jitter" (spreads the retries of the concurrent
+# requests) while the deadline allows it, then rejected with a 429
+THROTTLE_RETRY_DEADLINE_SECONDS = float(
+    os.environ.get("THROTTLE_RETRY_DEADLINE_SECONDS", 10)
+)
+THROTTLE_BACKOFF_BASE_SECONDS = 0.5
+THROTTLE_BACKOFF_MAX_SECONDS = 8
+
+# Total time of a model call (all its attempts and backoffs, or the first event
+# of a stream), kept below the timeout of the caller (e.g. the 29 s of API-GW).
+# Every attempt is capped with the remaining time, then rejected with a 429
+MODEL_CALL_TIMEOUT_SECONDS = float(os.environ.get("MODEL_CALL_TIMEOUT_SECONDS", 300))
+
+
+def load_registry(registry_json: str | None) -> dict[str, list[dict]]:
+    """
+    Parse and validate the model registry (the default one if not configured).
+    A missing tier uses the models of the other one.
+
+    :param registry_json (str): The registry as JSON, {"<tier>": [{"model_id": ...,
+        "region": ...}, ...]} with the "light" and/or "heavy" tiers.
+    """
+    registry = json.loads(registry_json) if registry_json else {}
+    registry = {tier: targets for tier, targets in registry.items() if targets}
+    if not registry:
+        return DEFAULT_MODEL_REGISTRY
+
+    for tier, targets in registry.items():
+        if tier not in MODEL_TIERS:
+            raise ValueError(f"Unknown model tier <{tier}> in the MODEL_REGISTRY")
+        if not all(isinstance(target.get("model_id"), str) for target in targets):
+            raise ValueError(f"Every model of the <{tier}> tier needs a <model_id>")
+    return {
+        "heavy": registry.get("heavy", registry.get("light")),
+        "light": registry.get("light", registry.get("heavy")),
+    }
+
+
+MODEL_REGISTRY = load_registry(os.environ.get("MODEL_REGISTRY"))
+
+
+def select_tier(event: dict) -> str:
+    """
+    Select the model tier of a turn: the "heavy" tier for the image analysis and
+    the footprint calculations (structured resources, instance types or long
+    specifications), and the "light" tier for the rest (missing data, short
+    follow-ups and clarifications).
+
+    :param event (dict): The input payload of the captain endpoints.
+    """
+    prompt = event["promptBase"]
+    if (
+        event.get("imageBase")
+        or event.get("resources")
+        or len(prompt) > LIGHT_PROMPT_MAX_CHARS
+        or catalog.INSTANCE_TYPE_MENTION_PATTERN.search(prompt)
+    ):
+        return "heavy"
+    return "light"
+
+
+def primary_model(tier: str) -> str:
+    """
+    Get the model identifier of the first (primary) model of a tier.
+    """
+    return MODEL_REGISTRY[tier][0]["model_id"]
+
+
+def _is_throttled(error: ClientError) -> bool:
+    code = error.response.get("Error", {}).get("Code", "")
+    return code.lower() in FAILOVER_ERROR_CODES
+
+
+def _should_failover(error: ClientError, target_index: int, tier: str) -> bool:
+    """
+    Check if a failed model call is retried with the next model of the tier.
+    """
+    if not _is_throttled(error):
+        return False
+    if target_index + 1 >= len(MODEL_REGISTRY[tier]):
+        return False
+
+    code = error.response["Error"]["Code"]
+    next_target = MODEL_REGISTRY[tier][target_index + 1]
+    logger.warning(
+        f"Model call failed with {code}, failing over to the next model",
+        tier=tier,
+        model_id=next_target["model_id"],
+        region=next_target.get("region"),
+    )
+    observability.add_metric("ModelFailover", MetricUnit.Count, 1)
+    return True
+
+
+def _backoff_delay(
+    error: ClientError, attempt: int, deadline: float, tier: str
+) -> float:
+    """
+    Get the (jittered) delay before retrying a throttled tier, or raise
+    "admission.OverloadedError" if the retry would end after the deadline.
+    """
+    max_delay = min(
+        THROTTLE_BACKOFF_MAX_SECONDS, THROTTLE_BACKOFF_BASE_SECONDS * 2**attempt
+    )
+    delay = random.uniform(0, max_delay)
+    if time.monotonic() + delay > deadline:
+        logger.warning("Model tier throttled past the retry deadline", tier=tier)
+        observability.add_metric("ThrottleRejected", MetricUnit.Count, 1)
+        raise admission.OverloadedError(
+            "The assistant is receiving too many requests, retry later", max_delay
+        ) from error
+
+    logger.info(
+        "Model tier throttled, retrying", tier=tier, attempt=attempt, delay=delay
+    )
+    observability.add_metric("ThrottleRetry", MetricUnit.Count, 1)
+    return delay
+
+
+def _deadlines() -> tuple[float, float]:
+    """
+    Get the deadline of the throttling retries and the deadline of the call.
+    """
+    now = time.monotonic()
+    call_deadline = now + MODEL_CALL_TIMEOUT_SECONDS
+    return min(now + THROTTLE_RETRY_DEADLINE_SECONDS, call_deadline), call_deadline
+
+
+async def _with_deadline(call: Awaitable, deadline: float, tier: str):
+    """
+    Await a model call attempt, or raise "admission.OverloadedError" if it does
+    not finish before the deadline of the call.
+    """
+    try:
+        return await asyncio.wait_for(call, max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError as e:
+        logger.warning("Model call past its deadline", tier=tier)
+        observability.add_metric("ModelTimeout", MetricUnit.Count, 1)
+        raise admission.OverloadedError(
+            "The assistant is receiving too many requests, retry later",
+            THROTTLE_BACKOFF_MAX_SECONDS,
+        ) from e
+
+
+async def _ainvoke_tier(body: bytes, tier: str, call_deadline: float) -> dict:
+    for index, target in enumerate(MODEL_REGISTRY[tier]):
+        observability.set_model(target["model_id"])
+        try:
+            return await _with_deadline(
+                bedrock.ainvoke(body, target["model_id"], target.get("region")),
+                call_deadline,
+                tier,
+            )
+        except ClientError as e:
+            if not _should_failover(e, index, tier):
+                raise
+
+
+async def ainvoke(body: bytes, tier: str) -> dict:
+    """
+    Invoke the models of a tier (see "bedrock.ainvoke()"), failing over to the
+    next one when a model is throttled, and retrying the tier with backoff when
+    all of them are (see "THROTTLE_RETRY_DEADLINE_SECONDS"), within the
+    "MODEL_CALL_TIMEOUT_SECONDS".
+
+    :param body (bytes): The JSON body created with "bedrock.build_request_body()".
+    :param tier (str): The model tier ("light" or "heavy").
+    """
+    deadline, call_deadline = _deadlines()
+    attempt = 0
+    while True:
+        try:
+            return await _ainvoke_tier(body, tier, call_deadline)
+        except ClientError as e:
+            if not _is_throttled(e):
+                raise
+            await asyncio.sleep(_backoff_delay(e, attempt, deadline, tier))
+            attempt += 1
+
+
+async def ainvoke_stream(body: bytes, tier: str) -> AsyncIterator[dict]:
+    """
+    Invoke the models of a tier with response streaming (see
+    "bedrock.ainvoke_stream()"). The failover and the retries only happen
+    before the first event, as the streamed tokens are already on their way
+    to the client.
+
+    :param body (bytes): The JSON body created with "bedrock.build_request_body()".
+    :param tier (str): The model tier ("light" or "heavy").
+    """
+    deadline, call_deadline = _deadlines()
+    attempt = 0
+    started = False
+    while True:
+        try:
+            for index, target in enumerate(MODEL_REGISTRY[tier]):
+                observability.set_model(target["model_id"])
+                stream = bedrock.ainvoke_stream(
+                    body, target["model_id"], target.get("region")
+                )
+                try:
+                    # Only the first event is capped, the rest streams to the client
+                    event = await _with_deadline(
+                        anext(stream, None), call_deadline, tier
+                    )
+                    started = True
+                    if event is not None:
+                        yield event
+                        async for event in stream:
+                            yield event
+                    return
+                except ClientError as e:
+                    if started or not _should_failover(e, index, tier):
+                        raise
+                finally:
+                    await stream.aclose()
+        except ClientError as e:
+            if started or not _is_throttled(e):
+                raise
+            await asyncio.sleep(_backoff_delay(e, attempt, deadline, tier))
+            attempt += 1
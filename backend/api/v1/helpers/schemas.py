@@ -0,0 +1,192 @@
+####################################################################################################
+# REQUEST AND RESPONSE MODELS OF THE CAPTAIN ENDPOINTS (WITH THE PAYLOAD SIZE LIMITS)
+####################################################################################################
+
+# Built-in imports
+import os
+import base64
+import binascii
+from typing import Annotated, Literal
+
+# External imports
+from pydantic import BaseModel, Field, model_validator
+
+# Own imports
+from api.v1.helpers import carbon, images
+
+
+# Size limits of the payloads, checked before any work is done (a payload over
+# them is rejected with a 422 before the session, image or model calls)
+PROMPT_MAX_CHARS = int(os.environ.get("PROMPT_MAX_CHARS", 20_000))
+MESSAGE_MAX_CHARS = int(os.environ.get("MESSAGE_MAX_CHARS", 100_000))
+MESSAGE_MAX_BLOCKS = 20
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", 200))
+RESOURCES_MAX_ITEMS = 500
+SESSION_ID_MAX_CHARS = 128
+# Base64 (4 characters per 3 bytes) of the largest upload, plus a data URL prefix
+IMAGE_MAX_CHARS = images.IMAGE_MAX_UPLOAD_BYTES * 4 // 3 + 100
+# Base64 of the largest preprocessed image (the images of the history were
+# already preprocessed when they were sent as "imageBase")
+HISTORY_IMAGE_MAX_CHARS = images.IMAGE_MAX_BYTES * 4 // 3 + 4
+# Maximum items per batch (every item can result in a model call)
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 500))
+# Inline CUR exports (below the Lambda payload limit) and S3 exports per report
+CUR_CSV_MAX_CHARS = int(os.environ.get("CUR_CSV_MAX_CHARS", 5 * 1024 * 1024))
+CUR_SOURCES_MAX_ITEMS = 100
+
+
+class TextBlock(BaseModel):
+    """
+    Text content block of a message.
+    """
+
+    type: Literal["text"]
+    text: str = Field(max_length=MESSAGE_MAX_CHARS)
+
+
+class ImageSource(BaseModel):
+    type: Literal["base64"]
+    media_type: Literal["image/jpeg", "image/png", "image/gif", "image/webp"]
+    data: str = Field(min_length=16, max_length=HISTORY_IMAGE_MAX_CHARS)
+
+
+class ImageBlock(BaseModel):
+    """
+    Image content block of a message (as returned in the "messages" of the
+    responses), whose data must be of its declared media type.
+    """
+
+    type: Literal["image"]
+    source: ImageSource
+
+    @model_validator(mode="after")
+    def check_media_type(self) -> "ImageBlock":
+        # The first 12 bytes (16 base64 characters) are enough for the signature
+        try:
+            header = base64.b64decode(self.source.data[:16], validate=True)
+        except binascii.Error:
+            raise ValueError("The image data is not valid base64")
+        if images.sniff_media_type(header) != self.source.media_type:
+            raise ValueError("The image data does not match its <media_type>")
+        return self
+
+
+ContentBlock = Annotated[TextBlock | ImageBlock, Field(discriminator="type")]
+
+
+class Message(BaseModel):
+    """
+    Message of a conversation in Anthropic "messages" format.
+    """
+
+    role: Literal["user", "assistant"]
+    content: (
+        Annotated[str, Field(max_length=MESSAGE_MAX_CHARS)]
+        | Annotated[list[ContentBlock], Field(max_length=MESSAGE_MAX_BLOCKS)]
+    )
+
+
+class CaptainRequest(BaseModel):
+    """
+    Input of an assessment: stateless mode with the "messages" history, or
+    session mode with the "sessionId" (no "messages", see "_open_session()").
+    """
+
+    promptBase: str = Field(min_length=1, max_length=PROMPT_MAX_CHARS)
+    imageBase: str | None = Field(default=None, max_length=IMAGE_MAX_CHARS)
+    messages: list[Message] | None = Field(
+        default=None, max_length=HISTORY_MAX_MESSAGES
+    )
+    sessionId: str | None = Field(default=None, max_length=SESSION_ID_MAX_CHARS)
+    resources: list[dict] | None = Field(default=None, max_length=RESOURCES_MAX_ITEMS)
+
+    def to_event(self) -> dict:
+        """
+        Get the input payload for the assessment functions (without the fields
+        that were not sent).
+        """
+        return self.model_dump(exclude_none=True)
+
+
+class BatchItem(CaptainRequest):
+    """
+    Assessment of a batch, with an optional "id" returned in its result line.
+    The items run concurrently and in stateless mode, so they have no "sessionId".
+    """
+
+    id: str | int | None = None
+
+    @model_validator(mode="after")
+    def check_stateless(self) -> "BatchItem":
+        if self.sessionId is not None:
+            raise ValueError(
+                "The batch items are stateless, use <messages> instead of <sessionId>"
+            )
+        return self
+
+
+class BatchRequest(BaseModel):
+    """
+    Input of "POST /captain/batch": the "items" and an optional "concurrency"
+    (capped by the "BATCH_MAX_CONCURRENCY" of the endpoint).
+    """
+
+    items: list[BatchItem] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+    concurrency: int | None = Field(default=None, ge=1)
+
+
+class EstimateRequest(BaseModel):
+    """
+    Input of "POST /captain/estimate": the "resources" (see
+    "carbon.estimate_footprint()") and the defaults of the resources.
+    """
+
+    resources: list[dict] = Field(max_length=RESOURCES_MAX_ITEMS)
+    region: str = Field(default=carbon.DEFAULT_REGION, max_length=32)
+    hours: float = Field(default=carbon.DEFAULT_HOURS, ge=0, allow_inf_nan=False)
+    utilization: float = Field(default=carbon.DEFAULT_UTILIZATION, ge=0, le=1)
+
+
+class CurRequest(BaseModel):
+    """
+    Input of "POST /captain/cur": a "csv" export inline or the S3 URIs of the
+    exports in "sources" (see "cur.validate_sources()").
+    """
+
+    csv: str | None = Field(default=None, max_length=CUR_CSV_MAX_CHARS)
+    sources: list[str] | None = Field(default=None, max_length=CUR_SOURCES_MAX_ITEMS)
+    utilization: float = Field(default=carbon.DEFAULT_UTILIZATION, ge=0, le=1)
+    recommendations: bool = False
+
+
+class Usage(BaseModel):
+    """
+    Token usage of a model call (see "bedrock.extract_usage()").
+    """
+
+    input_tokens: int
+    output_tokens: int
+    cache_read_input_tokens: int
+    cache_write_input_tokens: int
+    cache_hit: bool
+
+
+class Assessment(BaseModel):
+    """
+    Result of an assessment: the "Answer" (HTML), the conversation ("messages"
+    or "sessionId") and the token "usage".
+    """
+
+    Answer: str
+    messages: list[Message] | None = None
+    sessionId: str | None = None
+    usage: Usage
+
+
+class CaptainResponse(BaseModel):
+    """
+    Response of "POST /captain" (envelope kept for the existing clients).
+    """
+
+    body: Assessment
+    statusCode: int = 200
@@ -0,0 +1,254 @@
+####################################################################################################
+# SERVER-SIDE CONVERSATION SESSIONS WITH TOKEN-BUDGETED HISTORY
+####################################################################################################
+
+# Built-in imports
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+# Own imports
+from api.v1.helpers import clients, prompts
+
+
+# Maximum (estimated) tokens of the stored history, older turns are summarized
+SESSION_TOKEN_BUDGET = int(os.environ.get("SESSION_TOKEN_BUDGET", 8000))
+SESSION_SUMMARY_MAX_CHARS = int(os.environ.get("SESSION_SUMMARY_MAX_CHARS", 4000))
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", 7 * 24 * 60 * 60))
+# Digests of the latest images of the session, to avoid sending them again
+SESSION_MAX_IMAGE_DIGESTS = 20
+
+# Approximations for the token estimations (no tokenizer is available at runtime)
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 1600
+
+IMAGE_PLACEHOLDER = "[Architecture image sent by the user, already analysed above]"
+IMAGE_REPEATED = "[The user sent again the architecture image already analysed above]"
+SUMMARY_HEADER = "Summary of the earlier conversation (older turns were removed):\n"
+
+MARKUP_PATTERN = re.compile(r"<[^>]+>|```(?:html)?")
+
+
+def estimate_tokens(content: str | list) -> int:
+    """
+    Estimate the tokens of a message content (texts and images).
+
+    :param content (str | list): The content of an Anthropic "messages" message.
+    """
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + 1
+    return sum(
+        IMAGE_TOKENS
+        if block.get("type") == "image"
+        else len(block.get("text", "")) // CHARS_PER_TOKEN + 1
+        for block in content
+    )
+
+
+def _strip_images(message: dict) -> dict:
+    """
+    Copy of the message with its image blocks replaced by a short placeholder,
+    as the images are only sent to the model in the turn they were uploaded.
+    """
+    if isinstance(message["content"], str):
+        return message
+    content = [
+        {"type": "text", "text": IMAGE_PLACEHOLDER}
+        if block.get("type") == "image"
+        else block
+        for block in message["content"]
+    ]
+    return {**message, "content": content}
+
+
+def _text(content: str | list) -> str:
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") for block in content)
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[: max_chars - 3] + "..."
+
+
+def _summarize_turn(turn: list[dict]) -> str:
+    """
+    Compact (extractive) summary of a conversation turn, without a model call.
+    """
+    lines = []
+    for message in turn:
+        text = _text(message["content"])
+        if message["role"] == "user":
+            text = text.replace(prompts.VALIDATION_INSTRUCTIONS, "")
+            lines.append(f"- User: {_shorten(text, 300)}")
+        else:
+            lines.append(f"- Captain: {_shorten(MARKUP_PATTERN.sub(' ', text), 500)}")
+    return "\n".join(lines)
+
+
+def new_session() -> dict:
+    return {"messages": [], "summary": "", "image_digests": []}
+
+
+def has_image(session: dict, digest: str) -> bool:
+    """
+    Check if an image (by content digest) was already sent in the session.
+    """
+    return digest in session.get("image_digests", [])
+
+
+def add_image(session: dict, digest: str) -> dict:
+    """
+    Copy of the session with the digest of a new image (only the latest are kept).
+    """
+    digests = [*session.get("image_digests", []), digest]
+    return {**session, "image_digests": digests[-SESSION_MAX_IMAGE_DIGESTS:]}
+
+
+def build_history(session: dict) -> list[dict]:
+    """
+    Get the history to send to the model for a stored session: the windowed
+    messages, with the summary of the older turns in the first user message.
+
+    :param session (dict): The stored session ("messages" and "summary").
+    """
+    messages = [dict(message) for message in session["messages"]]
+    if session["summary"] and messages:
+        first_content = messages[0]["content"]
+        summary_block = {"type": "text", "text": SUMMARY_HEADER + session["summary"]}
+        if isinstance(first_content, str):
+            first_content = [{"type": "text", "text": first_content}]
+        messages[0]["content"] = [summary_block, *first_content]
+    return messages
+
+
+def append_turn(
+    session: dict, turn: list[dict], token_budget: int = SESSION_TOKEN_BUDGET
+) -> dict:
+    """
+    Add a completed turn (user messages and answer) to the session, and keep the
+    history within the token budget: images are dropped and the oldest turns are
+    folded into the summary, so request sizes stay flat as the conversation grows.
+
+    :param session (dict): The stored session ("messages" and "summary").
+    :param turn (list[dict]): The new messages (ending with the assistant answer).
+    :param token_budget (int): Maximum estimated tokens of the stored messages.
+    """
+    messages = session["messages"] + [_strip_images(message) for message in turn]
+    summary = session["summary"]
+
+    tokens = sum(estimate_tokens(message["content"]) for message in messages)
+    while tokens > token_budget:
+        # Drop whole turns (up to the first answer), so the history starts with a user message
+        end = next(
+            (i for i, message in enumerate(messages) if message["role"] == "assistant"),
+            None,
+        )
+        if end is None or end == len(messages) - 1:
+            break  # Always keep the latest turn
+        dropped, messages = messages[: end + 1], messages[end + 1 :]
+        tokens -= sum(estimate_tokens(message["content"]) for message in dropped)
+        summary = f"{summary}\n{_summarize_turn(dropped)}".strip()
+
+    # Only the most recent part of the summary is kept
+    summary = summary[-SESSION_SUMMARY_MAX_CHARS:]
+    return {**session, "messages": messages, "summary": summary}
+
+
+class InMemorySessionStore:
+    """
+    Session store in the process memory (for local development and tests).
+    """
+
+    def __init__(self, max_sessions: int = 1000) -> None:
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> dict | None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return json.loads(session) if session else None
+
+    def save(self, session_id: str, session: dict) -> None:
+        with self._lock:
+            self._sessions[session_id] = json.dumps(session)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+
+class DynamoDBSessionStore:
+    """
+    Session store on a DynamoDB table with TTL (partition key "session_id").
+    """
+
+    def __init__(self, table_name: str, ttl_seconds: int, client=None) -> None:
+        """
+        :param table_name (str): The DynamoDB table name.
+        :param ttl_seconds (int): Time to live of the sessions since their last turn.
+        :param client: Optional boto3 DynamoDB client (e.g. for local tests with moto).
+        """
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+
+    @property
+    def client(self):
+        # Created on first use, to keep it out of the cold start
+        if self._client is None:
+            self._client = clients.get_client("dynamodb")
+        return self._client
+
+    def load(self, session_id: str) -> dict | None:
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"session_id": {"S": session_id}},
+        )
+        item = response.get("Item")
+        if not item or int(item["expires_at"]["N"]) < time.time():
+            return None
+        return json.loads(item["session"]["S"])
+
+    def save(self, session_id: str, session: dict) -> None:
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "session_id": {"S": session_id},
+                "session": {"S": json.dumps(session)},
+                "expires_at": {"N": str(int(time.time()) + self.ttl_seconds)},
+            },
+        )
+
+
+class SessionStore:
+    """
+    Async facade for the session store backends (their calls run in a thread).
+    """
+
+    def __init__(self, backend: InMemorySessionStore | DynamoDBSessionStore) -> None:
+        self.backend = backend
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        """
+        DynamoDB backend if "SESSIONS_TABLE" is configured, otherwise in-memory.
+        """
+        table_name = os.environ.get("SESSIONS_TABLE")
+        if table_name:
+            return cls(DynamoDBSessionStore(table_name, SESSION_TTL_SECONDS))
+        return cls(InMemorySessionStore())
+
+    async def aload(self, session_id: str) -> dict | None:
+        return await asyncio.to_thread(self.backend.load, session_id)
+
+    async def asave(self, session_id: str, session: dict) -> None:
+        await asyncio.to_thread(self.backend.save, session_id, session)
+
+
+session_store = SessionStore.from_env()
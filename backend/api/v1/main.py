@@ -7,24 +7,33 @@ import os
 
 # External imports
 from mangum import Mangum
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 
 # Own imports
 from api.v1.routers import captain
+from api.v1.helpers import observability
 
 # Environment used to dynamically load the FastAPI docs with stages
 ENVIRONMENT = os.environ.get("ENVIRONMENT")
 
+# The docs can be disabled (their OpenAPI schema is only generated on request)
+ENABLE_DOCS = os.environ.get("ENABLE_DOCS", "true").lower() == "true"
+
+# The streaming function is exposed by a public Function URL (without the API-GW
+# throttling), so it only serves the streaming route
+STREAM_ONLY = os.environ.get("STREAM_ONLY", "false").lower() == "true"
+STREAM_ROUTE_PATH = "/captain/stream"
+
 
 app = FastAPI(
     title="CAPTAIN APP FastAPI",
     description="The CAPTAIN API is a cool example to showcase a production-grade FastAPI usage on top of AWS with Lambda Functions and API-GW",
     version="1.0",
     root_path=f"/{ENVIRONMENT}" if ENVIRONMENT else None,
-    docs_url="/api/v1/docs",
-    openapi_url="/api/v1/docs/openapi.json",
+    docs_url="/api/v1/docs" if ENABLE_DOCS else None,
+    openapi_url="/api/v1/docs/openapi.json" if ENABLE_DOCS else None,
 )
 
 # Required to allow CORS for the API (for local development and external frontends)
@@ -35,9 +44,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache", "X-Cache-Tier", "Retry-After"],
 )
 
-app.include_router(captain.router, prefix="/api/v1")
+# Metrics of every request (added last, so it wraps the other middlewares)
+app.add_middleware(observability.MetricsMiddleware)
+
+if STREAM_ONLY:
+    stream_router = APIRouter(
+        routes=[
+            route for route in captain.router.routes if route.path == STREAM_ROUTE_PATH
+        ]
+    )
+    app.include_router(stream_router, prefix="/api/v1")
+else:
+    app.include_router(captain.router, prefix="/api/v1")
+
+mangum_handler = Mangum(app)
+
 
 # This is the Lambda Function's entrypoint (handler)
-handler = Mangum(app)
+def handler(event, context):
+    return mangum_handler(event, context)
+
+
+# Note: the responses are not added to the traces, as they can be large
+if observability.tracer is not None:
+    handler = observability.tracer.capture_lambda_handler(
+        handler, capture_response=False
+    )
@@ -0,0 +1,52 @@
+###############################################################################
+# Entrypoint for the worker that processes the queued assessment jobs (SQS)
+###############################################################################
+
+# Built-in imports
+import asyncio
+
+# External imports
+from aws_lambda_powertools.utilities.batch import (
+    BatchProcessor,
+    EventType,
+    process_partial_response,
+)
+from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
+
+# Own imports
+from api.v1.routers import captain
+from api.v1.helpers import jobs, observability
+
+
+processor = BatchProcessor(event_type=EventType.SQS)
+
+# A single event loop for all the invocations of the execution environment
+loop = asyncio.new_event_loop()
+
+
+def record_handler(record: SQSRecord) -> None:
+    # The failed records go back to the queue (retries) until the final attempt
+    attempt = int(record.attributes.approximate_receive_count)
+    final_attempt = attempt >= jobs.JOB_MAX_ATTEMPTS
+    try:
+        loop.run_until_complete(captain.run_job(record.body, final_attempt))
+    except Exception:
+        # Retried after a short backoff, not after the queue visibility timeout
+        loop.run_until_complete(
+            jobs.job_store.adelay_retry(record.receipt_handle, attempt)
+        )
+        raise
+
+
+# This is the Lambda Function's entrypoint (handler)
+def handler(event, context):
+    return process_partial_response(
+        event=event,
+        record_handler=record_handler,
+        processor=processor,
+        context=context,
+    )
+
+
+if observability.tracer is not None:
+    handler = observability.tracer.capture_lambda_handler(handler)
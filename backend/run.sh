@@ -0,0 +1,11 @@
+#!/bin/bash
+
+####################################################################################################
+# ENTRYPOINT FOR THE STREAMING LAMBDA FUNCTION (UVICORN BEHIND THE "AWS LAMBDA WEB ADAPTER")
+####################################################################################################
+
+# Mangum buffers the whole response, so the streaming endpoints run the same FastAPI "app" with
+# uvicorn, and the Lambda Web Adapter forwards the chunks to the Lambda Function URL.
+PATH=$PATH:$LAMBDA_TASK_ROOT/bin \
+    PYTHONPATH=$PYTHONPATH:/opt/python:$LAMBDA_RUNTIME_DIR \
+    exec python -m uvicorn --port=$PORT api.v1.main:app
@@ -0,0 +1,24 @@
+###############################################################################
+# Shared configuration of the backend tests (no AWS resources are used)
+###############################################################################
+
+# Built-in imports
+import os
+
+# The environment is set before the backend modules are imported, so they use
+# their in-memory backends and never reach AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "true")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("ADMISSION_RATE_PER_SECOND", "0")
+for variable in (
+    "RESPONSE_CACHE_TABLE",
+    "SESSIONS_TABLE",
+    "JOBS_TABLE",
+    "JOBS_BUCKET",
+    "JOBS_QUEUE_URL",
+    "ENVIRONMENT",
+):
+    os.environ.pop(variable, None)
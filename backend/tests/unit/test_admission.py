@@ -0,0 +1,100 @@
+# Built-in imports
+import asyncio
+
+# External imports
+import pytest
+
+# Own imports
+from api.v1.helpers import admission
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = admission.TokenBucket(rate=2, burst=3, now=0)
+    assert [bucket.take(0) for _ in range(3)] == [0, 0, 0]
+    # Empty: the next token arrives after 1 / rate seconds
+    assert bucket.take(0) == pytest.approx(0.5)
+    assert bucket.take(0.5) == 0
+    # Never refilled over the burst
+    bucket.take(100, cost=3)
+    assert bucket.tokens == 0
+
+
+def test_token_bucket_charges_the_full_cost_of_large_requests():
+    bucket = admission.TokenBucket(rate=1, burst=5, now=0)
+    # Admitted once the bucket is full, with a debt of the rest of its cost
+    assert bucket.take(0, cost=50) == 0
+    assert bucket.tokens == -45
+    assert bucket.take(0) == pytest.approx(46)
+    assert bucket.take(40, cost=50) == pytest.approx(10)
+    assert bucket.take(50, cost=50) == 0
+
+
+def test_admission_controller_charges_every_batch_item():
+    controller = admission.AdmissionController(rate=1, burst=10, max_clients=10)
+    controller.admit("a", cost=500)
+    with pytest.raises(admission.OverloadedError) as error:
+        controller.admit("a")
+    assert int(error.value.retry_after) >= 490
+
+
+def test_admission_controller_limits_every_client():
+    controller = admission.AdmissionController(rate=1, burst=2, max_clients=10)
+    controller.admit("a")
+    controller.admit("a")
+    with pytest.raises(admission.OverloadedError) as error:
+        controller.admit("a")
+    assert error.value.retry_after == "1"
+    # Other clients have their own bucket
+    controller.admit("b")
+
+
+def test_admission_controller_evicts_the_oldest_clients():
+    controller = admission.AdmissionController(rate=1, burst=1, max_clients=2)
+    for client_id in ("a", "b", "c"):
+        controller.admit(client_id)
+    assert list(controller._buckets) == ["b", "c"]
+
+
+def test_admission_controller_disabled():
+    controller = admission.AdmissionController(rate=0, burst=1, max_clients=1)
+    for _ in range(10):
+        controller.admit("a")
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = admission.SingleFlight()
+    calls = []
+
+    async def call() -> dict:
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": "ok"}
+
+    async def run() -> list:
+        return await asyncio.gather(
+            *(single_flight.arun("key", call) for _ in range(5))
+        )
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert all(result == {"answer": "ok"} for result, _ in results)
+    # Finished calls are not shared with the next callers
+    assert asyncio.run(single_flight.arun("key", call)) == ({"answer": "ok"}, False)
+
+
+def test_single_flight_shares_the_errors():
+    single_flight = admission.SingleFlight()
+
+    async def call() -> dict:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("ThrottlingException")
+
+    async def run() -> list:
+        return await asyncio.gather(
+            *(single_flight.arun("key", call) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run()))
+    assert single_flight._calls == {}
@@ -0,0 +1,136 @@
+# Built-in imports
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# External imports
+import pytest
+
+# Own imports
+from api.v1.helpers import bedrock, clients
+
+
+MESSAGES = [
+    {"role": "user", "content": "Assess 2 m5.large"},
+    {"role": "assistant", "content": "<p>Answer</p>"},
+    {"role": "user", "content": "And with m6g.large?"},
+]
+
+
+def test_build_request_body_with_prompt_cache():
+    body = json.loads(bedrock.build_request_body("SYSTEM", MESSAGES, prompt_cache=True))
+
+    assert body["anthropic_version"] == bedrock.ANTHROPIC_VERSION
+    assert body["max_tokens"] == bedrock.MAX_TOKENS
+    assert body["system"] == [
+        {"type": "text", "text": "SYSTEM", "cache_control": bedrock.CACHE_CHECKPOINT}
+    ]
+    # The checkpoint is on the last answer of the model (the stable prefix)
+    assert body["messages"][1]["content"] == [
+        {
+            "type": "text",
+            "text": "<p>Answer</p>",
+            "cache_control": bedrock.CACHE_CHECKPOINT,
+        }
+    ]
+    assert body["messages"][2] == MESSAGES[2]
+    # The input messages are not modified
+    assert MESSAGES[1]["content"] == "<p>Answer</p>"
+
+
+def test_build_request_body_without_prompt_cache():
+    body = json.loads(
+        bedrock.build_request_body("SYSTEM", MESSAGES, prompt_cache=False)
+    )
+
+    assert body["system"] == "SYSTEM"
+    assert body["messages"] == MESSAGES
+
+
+def test_extract_usage():
+    usage = bedrock.extract_usage(
+        {"input_tokens": 10, "output_tokens": 5, "cache_read_input_tokens": 100}
+    )
+    assert usage == {
+        "input_tokens": 10,
+        "output_tokens": 5,
+        "cache_read_input_tokens": 100,
+        "cache_write_input_tokens": 0,
+        "cache_hit": True,
+    }
+
+
+class CountingSession:
+    created = 0
+
+    def client(self, **kwargs):
+        # Slow enough for the concurrent callers to overlap
+        time.sleep(0.05)
+        CountingSession.created += 1
+        return object()
+
+
+def test_get_client_is_created_once(monkeypatch):
+    monkeypatch.setattr(clients.boto3.session, "Session", CountingSession)
+    monkeypatch.setattr(clients, "_clients", {})
+
+    with ThreadPoolExecutor(16) as executor:
+        created = list(
+            executor.map(lambda _: bedrock.get_client("eu-west-1"), range(16))
+        )
+        created += list(executor.map(lambda _: clients.get_client("s3"), range(16)))
+
+    # One client per service and region
+    assert CountingSession.created == 2
+    assert all(client is created[0] for client in created[:16])
+    assert all(client is created[16] for client in created[16:])
+
+
+class BlockingEventStream:
+    """
+    Fake Bedrock EventStream: the first chunk is at once, the second one waits
+    for "release" (a read in progress when the consumer is cancelled).
+    """
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.closed = False
+
+    def __iter__(self):
+        yield {"chunk": {"bytes": b'{"type": "message_start"}'}}
+        self.release.wait(5)
+        yield {"chunk": {"bytes": b'{"type": "message_stop"}'}}
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeStreamingClient:
+    def __init__(self, stream: BlockingEventStream) -> None:
+        self.stream = stream
+
+    def invoke_model_with_response_stream(self, body, modelId):
+        return {"body": self.stream}
+
+
+def test_ainvoke_stream_cancelled_during_a_read(monkeypatch):
+    stream = BlockingEventStream()
+    monkeypatch.setattr(
+        bedrock, "get_client", lambda region=None: FakeStreamingClient(stream)
+    )
+
+    async def consume() -> None:
+        events = bedrock.ainvoke_stream(b"{}")
+        assert await anext(events) == {"type": "message_start"}
+        task = asyncio.create_task(anext(events))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        threading.Timer(0.05, stream.release.set).start()
+        await task
+
+    # The cancellation is not replaced by "generator already executing"
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(consume())
+    assert stream.closed
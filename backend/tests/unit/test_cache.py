@@ -0,0 +1,113 @@
+# Built-in imports
+import time
+import asyncio
+
+# External imports
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+# Own imports
+from api.v1.helpers import cache
+
+
+TABLE_NAME = "response-cache"
+
+
+@pytest.fixture
+def dynamodb_client():
+    with mock_dynamodb():
+        client = boto3.client("dynamodb", region_name="us-east-1")
+        client.create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{"AttributeName": "cache_key", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "cache_key", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield client
+
+
+def test_build_cache_key_normalizes_whitespace_and_images():
+    image = {"type": "image", "source": {"type": "base64", "data": "aGVsbG8="}}
+    key = cache.build_cache_key(
+        "model",
+        "system",
+        [{"role": "user", "content": [image, {"type": "text", "text": "a  b"}]}],
+    )
+    same = cache.build_cache_key(
+        "model",
+        "system",
+        [{"role": "user", "content": [image, {"type": "text", "text": "a b"}]}],
+    )
+    other_model = cache.build_cache_key(
+        "other",
+        "system",
+        [{"role": "user", "content": [image, {"type": "text", "text": "a b"}]}],
+    )
+    assert key == same
+    assert key != other_model
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = cache.LRUCache(max_bytes=40)
+    lru.set("a", {"v": "1234567890"})
+    lru.set("b", {"v": "1234567890"})
+    assert lru.get("a") is not None  # "a" becomes the most recently used
+    lru.set("c", {"v": "1234567890"})
+
+    assert lru.get("b") is None
+    assert lru.get("a") is not None
+    assert lru.get("c") is not None
+    assert lru.current_bytes <= 40
+
+
+def test_lru_cache_skips_values_larger_than_the_cache():
+    lru = cache.LRUCache(max_bytes=10)
+    lru.set("a", {"value": "a value larger than the cache"})
+    assert lru.get("a") is None
+    assert lru.current_bytes == 0
+
+
+def test_response_cache_memory_only():
+    response_cache = cache.ResponseCache(cache.LRUCache(1024))
+    assert asyncio.run(response_cache.aget("key")) == (None, None)
+
+    asyncio.run(response_cache.aset("key", {"answer": "cached"}))
+    assert asyncio.run(response_cache.aget("key")) == ({"answer": "cached"}, "memory")
+
+
+def test_response_cache_promotes_shared_hits(dynamodb_client):
+    shared = cache.DynamoDBCache(TABLE_NAME, ttl_seconds=60, client=dynamodb_client)
+    shared.set("key", {"answer": "shared"})
+    response_cache = cache.ResponseCache(cache.LRUCache(1024), shared)
+
+    assert response_cache.get("key") == ({"answer": "shared"}, "dynamodb")
+    # The hit was promoted to the in-process tier
+    assert response_cache.get("key") == ({"answer": "shared"}, "memory")
+
+
+def test_dynamodb_cache_ignores_expired_items(dynamodb_client):
+    shared = cache.DynamoDBCache(TABLE_NAME, ttl_seconds=60, client=dynamodb_client)
+    dynamodb_client.put_item(
+        TableName=TABLE_NAME,
+        Item={
+            "cache_key": {"S": "key"},
+            "value": {"S": '{"answer": "old"}'},
+            "expires_at": {"N": str(int(time.time()) - 1)},
+        },
+    )
+    assert shared.get("key") is None
+
+
+def test_response_cache_shared_errors_are_not_fatal():
+    class BrokenCache:
+        def get(self, key):
+            raise RuntimeError("DynamoDB is down")
+
+        def set(self, key, value):
+            raise RuntimeError("DynamoDB is down")
+
+    response_cache = cache.ResponseCache(cache.LRUCache(1024), BrokenCache())
+    assert response_cache.get("key") == (None, None)
+    response_cache.set("key", {"answer": "cached"})
+    assert response_cache.get("key") == ({"answer": "cached"}, "memory")
@@ -0,0 +1,263 @@
+# Built-in imports
+import json
+import base64
+
+# External imports
+import pytest
+from fastapi.testclient import TestClient
+
+# Own imports
+from api.v1.helpers import admission, schemas
+from api.v1.routers import captain
+from api.v1.main import app
+
+
+client = TestClient(app)
+
+INVALID_PROMPT = "Assess 3 instances of m5.hugelarge"
+
+
+@pytest.fixture
+def no_model(monkeypatch):
+    async def fail(*args, **kwargs):
+        raise AssertionError("The model must not be called")
+
+    monkeypatch.setattr("api.v1.helpers.routing.ainvoke", fail)
+
+
+@pytest.fixture
+def no_image(monkeypatch):
+    async def fail(*args, **kwargs):
+        raise AssertionError("The image must not be processed")
+
+    monkeypatch.setattr(captain, "_prepare_image", fail)
+
+
+def test_rejection_skips_the_image_and_the_model(no_model, no_image):
+    response = client.post(
+        "/api/v1/captain",
+        json={
+            "promptBase": INVALID_PROMPT,
+            "imageBase": "not-an-image",
+            "messages": [],
+        },
+    )
+    assert response.status_code == 200
+    body = response.json()["body"]
+    assert "m5.hugelarge is not a supported instance type" in body["Answer"]
+    assert [message["role"] for message in body["messages"]] == ["user", "assistant"]
+
+
+def test_stream_rejection_skips_the_image_and_the_model(no_model, no_image):
+    response = client.post(
+        "/api/v1/captain/stream?output_format=ndjson",
+        json={
+            "promptBase": INVALID_PROMPT,
+            "imageBase": "not-an-image",
+            "messages": [],
+        },
+    )
+    assert response.status_code == 200
+    assert '"type":"done"' in response.text
+    assert "m5.hugelarge" in response.text
+
+
+def test_client_id_ignores_the_spoofed_forwarded_addresses(monkeypatch):
+    controller = admission.AdmissionController(rate=1, burst=2, max_clients=10)
+    monkeypatch.setattr(admission, "admission_controller", controller)
+
+    # Every request claims another origin, but the last address is the same
+    statuses = [
+        client.post(
+            "/api/v1/captain",
+            json={"promptBase": INVALID_PROMPT, "messages": []},
+            headers={"X-Forwarded-For": f"10.0.0.{i}, 203.0.113.7"},
+        ).status_code
+        for i in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+    assert list(controller._buckets) == ["203.0.113.7"]
+
+
+def test_client_id_of_the_api_gateway_events():
+    request = captain.Request(
+        {
+            "type": "http",
+            "headers": [(b"x-forwarded-for", b"10.0.0.1, 198.51.100.1")],
+            "aws.event": {"requestContext": {"identity": {"sourceIp": "203.0.113.7"}}},
+        }
+    )
+    assert captain._client_id(request) == "203.0.113.7"
+
+
+def test_stream_throttling_is_a_429(monkeypatch):
+    async def throttled(body, tier):
+        raise admission.OverloadedError("Too many requests", 2.5)
+        yield
+
+    monkeypatch.setattr("api.v1.helpers.routing.ainvoke_stream", throttled)
+    response = client.post(
+        "/api/v1/captain/stream", json={"promptBase": "Why?", "messages": []}
+    )
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+
+
+def test_stream_forwards_the_model_tokens(monkeypatch):
+    async def stream(body, tier):
+        yield {"type": "message_start", "message": {"usage": {"input_tokens": 10}}}
+        for text in ("<p>Hello", " world</p>"):
+            yield {
+                "type": "content_block_delta",
+                "delta": {"type": "text_delta", "text": text},
+            }
+        yield {"type": "message_delta", "usage": {"output_tokens": 4}}
+
+    monkeypatch.setattr("api.v1.helpers.routing.ainvoke_stream", stream)
+    response = client.post(
+        "/api/v1/captain/stream?output_format=ndjson",
+        json={"promptBase": "Why the streaming?", "messages": []},
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["delta", "delta", "done"]
+    assert lines[-1]["Answer"] == "<p>Hello world</p>"
+    assert lines[-1]["usage"]["output_tokens"] == 4
+
+
+PNG_BASE64 = base64.b64encode(b"\x89PNG\r\n\x1a\n" + bytes(16)).decode()
+
+
+def _image_message(media_type: str, data: str) -> dict:
+    source = {"type": "base64", "media_type": media_type, "data": data}
+    return {"role": "user", "content": [{"type": "image", "source": source}]}
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        _image_message("image/png", "A" * (schemas.HISTORY_IMAGE_MAX_CHARS + 1)),
+        _image_message("image/jpeg", PNG_BASE64),
+        _image_message("image/tiff", PNG_BASE64),
+        _image_message("image/png", "not base64 at all!"),
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "x" * (schemas.MESSAGE_MAX_CHARS + 1)}
+            ],
+        },
+        {"role": "user", "content": [{"type": "document", "source": {}}]},
+    ],
+)
+def test_invalid_history_block_is_422(message, no_model):
+    response = client.post(
+        "/api/v1/captain", json={"promptBase": "Why?", "messages": [message]}
+    )
+    assert response.status_code == 422
+
+
+def test_history_image_round_trip(no_model, no_image):
+    history = [
+        _image_message("image/png", PNG_BASE64),
+        {"role": "assistant", "content": [{"type": "text", "text": "<p>Ok</p>"}]},
+    ]
+    response = client.post(
+        "/api/v1/captain",
+        json={"promptBase": INVALID_PROMPT, "messages": history},
+    )
+    assert response.status_code == 200
+    assert response.json()["body"]["messages"][:2] == history
+
+
+def _batch_lines(payload: dict) -> list[dict]:
+    response = client.post("/api/v1/captain/batch", json=payload)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"items": []},
+        {"items": "notalist"},
+        {"items": [{"promptBase": "Why?", "messages": "notalist"}]},
+        {"items": [{"messages": []}]},
+        {"items": [{"promptBase": "Why?", "sessionId": "some-session"}]},
+        {"items": [{"promptBase": "Why?"}], "concurrency": 0},
+        {"items": [{"promptBase": "Why?"}] * (schemas.BATCH_MAX_ITEMS + 1)},
+    ],
+)
+def test_batch_invalid_input_is_422(payload):
+    response = client.post("/api/v1/captain/batch", json=payload)
+    assert response.status_code == 422
+
+
+def test_batch_results(monkeypatch, no_image):
+    async def ainvoke(body, tier):
+        if b"fails" in body:
+            raise AttributeError("'str' object has no attribute 'append'")
+        return {
+            "content": [{"type": "text", "text": "<p>Answer</p>"}],
+            "usage": {"input_tokens": 10, "output_tokens": 5},
+        }
+
+    monkeypatch.setattr("api.v1.helpers.routing.ainvoke", ainvoke)
+    lines = _batch_lines(
+        {
+            "items": [
+                {"id": "ok", "promptBase": "Why the batch?"},
+                {"id": 2, "promptBase": INVALID_PROMPT},
+                {"id": "fails", "promptBase": "This one fails"},
+            ],
+            "concurrency": 100,
+        }
+    )
+
+    results = {line["id"]: line for line in lines[:-1]}
+    assert results["ok"]["status"] == "ok"
+    assert results["ok"]["Answer"] == "<p>Answer</p>"
+    assert "m5.hugelarge" in results[2]["Answer"]
+    # The internal errors are not returned to the client
+    assert results["fails"] == {
+        "index": 2,
+        "id": "fails",
+        "status": "error",
+        "error": "Internal error",
+    }
+    assert lines[-1]["summary"]["succeeded"] == 2
+    assert lines[-1]["summary"]["failed"] == 1
+
+
+def test_batch_returns_the_input_errors(no_model):
+    lines = _batch_lines(
+        {
+            "items": [
+                {
+                    "promptBase": "Assess it",
+                    "messages": [],
+                    "resources": [{"service": "EC2", "instance_type": 5}],
+                }
+            ]
+        }
+    )
+    assert lines[0]["status"] == "error"
+    assert "instance_type" in lines[0]["error"]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"csv": 5},
+        {"sources": "s3://cur-bucket/cur/export.csv"},
+        {"sources": [5]},
+        {"csv": "a,b\n1,2\n", "utilization": 3},
+    ],
+)
+def test_cur_invalid_input_is_422(payload):
+    response = client.post("/api/v1/captain/cur", json=payload)
+    assert response.status_code == 422
+
+
+def test_cur_requires_a_source():
+    response = client.post("/api/v1/captain/cur", json={"csv": ""})
+    assert response.status_code == 400
@@ -0,0 +1,141 @@
+# External imports
+import pytest
+from fastapi.testclient import TestClient
+
+# Own imports
+from api.v1.helpers import carbon, catalog
+from api.v1.main import app
+
+
+client = TestClient(app)
+
+
+def test_estimate_footprint_ec2():
+    footprint = carbon.estimate_footprint(
+        [{"service": "EC2", "instance_type": "m5.large", "count": 2}]
+    )
+    result = footprint["resources"][0]
+    assert result["description"] == "2 x m5.large"
+    assert result["hours"] == carbon.DEFAULT_HOURS
+    assert footprint["totals"]["total_kgco2e"] > 0
+
+
+def test_estimate_footprint_numbers_as_text():
+    footprint = carbon.estimate_footprint(
+        [{"service": "EC2", "instance_type": "m5.large", "hours": "100"}],
+        hours="730",
+        utilization="0.3",
+    )
+    assert footprint["resources"][0]["hours"] == 100
+    assert "Average CPU utilization of 30% unless specified" in footprint["assumptions"]
+
+
+@pytest.mark.parametrize(
+    "kwargs, message",
+    [
+        ({"hours": "many"}, "<hours>"),
+        ({"utilization": "high"}, "<utilization>"),
+        ({"utilization": 2}, "use 0-1"),
+    ],
+)
+def test_estimate_footprint_invalid_defaults(kwargs, message):
+    with pytest.raises(ValueError, match=message):
+        carbon.estimate_footprint(
+            [{"service": "EC2", "instance_type": "m5.large"}], **kwargs
+        )
+
+
+@pytest.mark.parametrize("instance_type", [5, ["m5.large"], {"type": "m5.large"}])
+def test_estimate_footprint_non_text_instance_type(instance_type):
+    with pytest.raises(ValueError, match="instance_type"):
+        carbon.estimate_footprint([{"service": "EC2", "instance_type": instance_type}])
+
+
+def test_is_valid_instance_type_non_text():
+    assert catalog.is_valid_instance_type(5) is False
+    assert catalog.is_valid_instance_type("m5.large", "EC2") is True
+
+
+@pytest.mark.parametrize("value", ["inf", "-inf", "nan", float("inf")])
+def test_estimate_footprint_non_finite_numbers(value):
+    with pytest.raises(ValueError, match="it must be finite"):
+        carbon.estimate_footprint(
+            [{"service": "EC2", "instance_type": "m5.large", "count": value}]
+        )
+
+
+def test_estimate_footprint_lambda_count():
+    function = {"service": "LAMBDA", "invocations": 100_000_000, "avg_duration_ms": 500}
+    single = carbon.estimate_footprint([function])["resources"][0]
+    triple = carbon.estimate_footprint([{**function, "count": 3}])["resources"][0]
+    assert triple["description"].startswith("3 x Lambda")
+    assert triple["total_kgco2e"] == pytest.approx(3 * single["total_kgco2e"], rel=1e-3)
+
+
+def test_captain_estimate_invalid_input_is_400():
+    response = client.post(
+        "/api/v1/captain/estimate",
+        json={"resources": [{"service": "EC2", "instance_type": 5}]},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"resources": [{"service": "EC2", "instance_type": "m5.large"}], "hours": "x"},
+        {
+            "resources": [{"service": "EC2", "instance_type": "m5.large"}],
+            "utilization": "y",
+        },
+        {
+            "resources": [{"service": "EC2", "instance_type": "m5.large"}],
+            "utilization": 2,
+        },
+        {"resources": "m5.large"},
+        {
+            "resources": [{"service": "EC2", "instance_type": "m5.large"}],
+            "hours": "inf",
+        },
+    ],
+)
+def test_captain_estimate_invalid_defaults_are_422(payload):
+    response = client.post("/api/v1/captain/estimate", json=payload)
+    assert response.status_code == 422
+
+
+def test_captain_estimate_non_finite_count_is_400():
+    response = client.post(
+        "/api/v1/captain/estimate",
+        json={
+            "resources": [
+                {"service": "EC2", "instance_type": "m5.large", "count": "inf"}
+            ]
+        },
+    )
+    assert response.status_code == 400
+
+
+def test_captain_estimate_numbers_as_text():
+    response = client.post(
+        "/api/v1/captain/estimate",
+        json={
+            "resources": [{"service": "EC2", "instance_type": "m5.large"}],
+            "hours": "730",
+            "utilization": "0.3",
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["totals"]["total_kgco2e"] > 0
+
+
+def test_captain_invalid_instance_type_is_400():
+    response = client.post(
+        "/api/v1/captain",
+        json={
+            "promptBase": "Assess my resources",
+            "messages": [],
+            "resources": [{"service": "EC2", "instance_type": 5}],
+        },
+    )
+    assert response.status_code == 400
@@ -0,0 +1,55 @@
+# External imports
+import pytest
+
+# Own imports
+from api.v1.helpers import catalog
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "Assess 3 instances of m5.large and 2 t3.micro",
+        "An RDS db.r6g.xlarge and a cache.t3.small",
+        "2 ElastiCache nodes r6g.large",
+        "An Aurora cluster with r6g.large instances",
+        "I set ec2.metadata options",
+        "See the docs at example.com and v1.2.3",
+        "An EC2 m5.large with a Redis r9g.hugelarge",
+    ],
+)
+def test_find_invalid_instance_types_accepts(prompt):
+    assert catalog.find_invalid_instance_types(prompt) == {}
+
+
+def test_find_invalid_instance_types_misspelled_sizes():
+    invalid = catalog.find_invalid_instance_types("4 m5.xlarg and a db.t3.medum")
+    assert invalid["m5.xlarg"][0] == "m5.xlarge"
+    assert invalid["db.t3.medum"][0] == "db.t3.medium"
+
+
+def test_find_invalid_instance_types_suggests_the_named_service():
+    invalid = catalog.find_invalid_instance_types("2 ElastiCache nodes r6g.hugelarge")
+    assert invalid["r6g.hugelarge"]
+    assert all(s.startswith("cache.r6g.") for s in invalid["r6g.hugelarge"])
+
+    invalid = catalog.find_invalid_instance_types("Assess 3 instances of m5.hugelarge")
+    assert invalid["m5.hugelarge"][0] == "m5.large"
+
+
+def test_find_invalid_instance_types_reports_each_mention_once():
+    invalid = catalog.find_invalid_instance_types("m5.xlarg, m5.xlarg and m5.xlarg")
+    assert list(invalid) == ["m5.xlarg"]
+
+
+def test_suggest_instance_types():
+    assert catalog.suggest_instance_types("m5.xlarg")[0] == "m5.xlarge"
+    assert catalog.suggest_instance_types("m5.large", "RDS")[0] == "db.m5.large"
+    assert catalog.suggest_instance_types("zz9.qqq") == []
+
+
+def test_validate_instance_type():
+    catalog.validate_instance_type("m6g.large", "EKS")
+    with pytest.raises(ValueError, match="for RDS"):
+        catalog.validate_instance_type("m5.large", "RDS")
+    with pytest.raises(ValueError, match="did you mean cache.t3.micro"):
+        catalog.validate_instance_type("cache.t3.micr", "ELASTICACHE")
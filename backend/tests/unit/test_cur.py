@@ -0,0 +1,113 @@
+# Built-in imports
+import io
+
+# External imports
+import pytest
+from fastapi.testclient import TestClient
+
+# Own imports
+from api.v1.helpers import cur
+from api.v1.main import app
+
+
+client = TestClient(app)
+
+HEADER = (
+    "lineItem/LineItemType,lineItem/ProductCode,lineItem/UsageType,"
+    "lineItem/UsageAmount,product/region,product/instanceType,"
+    "lineItem/UsageStartDate\n"
+)
+CUR_CSV = HEADER + (
+    "Usage,AmazonEC2,BoxUsage:m5.large,400,us-east-1,m5.large,2024-05-01T00:00:00Z\n"
+    "Usage,AmazonEC2,BoxUsage:m5.large,330,us-east-1,m5.large,2024-05-20T00:00:00Z\n"
+    "Tax,AmazonEC2,BoxUsage:m5.large,999,us-east-1,m5.large,2024-05-31T00:00:00Z\n"
+    "Usage,AmazonEC2,EUW1-EBS:VolumeUsage.gp3,100,,,2024-05-01T00:00:00Z\n"
+    "Usage,AWSLambda,Lambda-GB-Second-ARM,36000,us-east-1,,2024-05-02T00:00:00Z\n"
+    "Usage,AmazonRoute53,HostedZone,1,,,2024-05-01T00:00:00Z\n"
+    "Usage,AmazonEC2,BoxUsage:m5.large,not-a-number,us-east-1,m5.large,\n"
+    "Usage,AmazonEC2,short-row\n"
+)
+
+
+def _report(csv_text: str = CUR_CSV) -> dict:
+    return cur.build_report([io.StringIO(csv_text)])
+
+
+def test_read_csv_sums_the_usage_line_items():
+    aggregator = cur.UsageAggregator()
+    cur.read_csv(io.StringIO(CUR_CSV), aggregator)
+
+    assert aggregator.line_items == 8
+    assert aggregator.usage_line_items == 5
+    assert (
+        aggregator.usage[("AmazonEC2", "BoxUsage:m5.large", "us-east-1", "m5.large")]
+        == 730
+    )
+    assert aggregator.period_start == "2024-05-01T00:00:00Z"
+    assert aggregator.period_end == "2024-05-20T00:00:00Z"
+
+
+def test_build_report_maps_the_usage_to_resources():
+    report = _report()
+
+    assert set(report["by_service"]) == {"EC2", "EBS", "LAMBDA"}
+    assert set(report["by_region"]) == {"us-east-1", "eu-west-1"}
+    ec2 = next(r for r in report["top_resources"] if r["service"] == "EC2")
+    assert ec2["hours"] == 730
+    assert report["skipped_usages"] == [
+        {"usage": "AmazonRoute53 HostedZone", "amount": 1.0}
+    ]
+    assert report["totals"]["total_kgco2e"] > 0
+
+
+def test_build_report_requires_the_usage_columns():
+    with pytest.raises(ValueError):
+        _report("lineItem/ProductCode,lineItem/UsageType\nAmazonEC2,BoxUsage\n")
+    with pytest.raises(ValueError):
+        _report("")
+    with pytest.raises(ValueError, match="no usage of the supported services"):
+        _report(HEADER + "Usage,AmazonRoute53,HostedZone,1,,,\n")
+
+
+def test_cur_endpoint_inline_csv():
+    response = client.post("/api/v1/captain/cur", json={"csv": CUR_CSV})
+    assert response.status_code == 200
+    assert response.json()["report"]["line_items"]["usage"] == 5
+
+
+def test_cur_endpoint_without_a_cur_bucket(monkeypatch):
+    monkeypatch.setattr(cur, "CUR_BUCKET", None)
+    response = client.post(
+        "/api/v1/captain/cur", json={"sources": ["s3://bucket/cur/export.csv"]}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "s3://other-bucket/cur/export.csv",
+        "s3://cur-bucket/other/export.csv",
+        "s3://cur-bucket-2/cur/export.csv",
+        "https://cur-bucket/cur/export.csv",
+        "/etc/passwd",
+        "s3://cur-bucket/cur/export-00001.snappy.parquet",
+    ],
+)
+def test_cur_endpoint_only_reads_the_cur_bucket(monkeypatch, source):
+    monkeypatch.setattr(cur, "CUR_BUCKET", "cur-bucket")
+    monkeypatch.setattr(cur, "CUR_PREFIX", "cur/")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The source must not be read")
+
+    monkeypatch.setattr(cur, "read_export", fail)
+    response = client.post("/api/v1/captain/cur", json={"sources": [source]})
+    assert response.status_code == 400
+
+
+def test_validate_sources_allows_the_cur_prefix(monkeypatch):
+    monkeypatch.setattr(cur, "CUR_BUCKET", "cur-bucket")
+    monkeypatch.setattr(cur, "CUR_PREFIX", "cur/")
+    sources = ["s3://cur-bucket/cur/2024-05/export-00001.csv.gz"]
+    assert cur.validate_sources(sources) == sources
@@ -0,0 +1,95 @@
+# Built-in imports
+import io
+import os
+import base64
+
+# External imports
+import pytest
+
+# Own imports
+from api.v1.helpers import images
+
+# Pillow is optional for the API (see "images.PILLOW_AVAILABLE")
+Image = pytest.importorskip("PIL.Image")
+
+
+def _image(size: tuple[int, int], pil_format: str, noise: bool = False) -> bytes:
+    if noise:
+        image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    else:
+        image = Image.new("RGB", size, "green")
+    output = io.BytesIO()
+    image.save(output, format=pil_format)
+    return output.getvalue()
+
+
+def _open(image_base64: str) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(image_base64)))
+
+
+@pytest.mark.parametrize(
+    "pil_format, media_type",
+    [("PNG", "image/png"), ("JPEG", "image/jpeg"), ("WEBP", "image/webp")],
+)
+def test_sniff_media_type(pil_format, media_type):
+    assert images.sniff_media_type(_image((8, 8), pil_format)) == media_type
+
+
+def test_sniff_media_type_unsupported():
+    assert images.sniff_media_type(_image((8, 8), "BMP")) is None
+    assert images.sniff_media_type(b"") is None
+
+
+def test_decode_image_data_url():
+    data = _image((8, 8), "PNG")
+    encoded = base64.b64encode(data).decode()
+    assert images.decode_image(encoded) == data
+    assert images.decode_image(f"data:image/png;base64,{encoded}") == data
+
+
+@pytest.mark.parametrize("image_base64", ["not base64!", b"aGVsbG8=", None])
+def test_decode_image_invalid(image_base64):
+    with pytest.raises(ValueError, match="imageBase"):
+        images.decode_image(image_base64)
+
+
+def test_prepare_image_unsupported_format():
+    with pytest.raises(ValueError, match="Unsupported image format"):
+        images.prepare_image(_image((8, 8), "BMP"))
+
+
+def test_prepare_image_small_image_is_unchanged():
+    data = _image((64, 32), "PNG")
+    assert images.prepare_image(data) == (
+        "image/png",
+        base64.b64encode(data).decode(),
+    )
+
+
+def test_prepare_image_downscales_to_max_dimension():
+    media_type, image_base64 = images.prepare_image(_image((3000, 1000), "PNG"))
+    assert media_type == "image/png"
+    assert _open(image_base64).size == (images.IMAGE_MAX_DIMENSION, 523)
+
+
+def test_prepare_image_recompresses_above_target(monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_TARGET_BYTES", 20_000)
+    data = _image((200, 200), "PNG", noise=True)
+    assert len(data) > images.IMAGE_TARGET_BYTES
+
+    media_type, image_base64 = images.prepare_image(data)
+    assert media_type == "image/jpeg"
+    assert len(base64.b64decode(image_base64)) < len(data)
+    assert _open(image_base64).size == (200, 200)
+
+
+def test_prepare_image_above_max_bytes_is_rejected(monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_MAX_BYTES", 1_000)
+    with pytest.raises(ValueError, match="The image is too large"):
+        images.prepare_image(_image((200, 200), "PNG", noise=True))
+
+
+def test_prepare_image_without_pillow_is_only_validated(monkeypatch):
+    monkeypatch.setattr(images, "PILLOW_AVAILABLE", False)
+    data = _image((3000, 1000), "PNG")
+    assert images.prepare_image(data)[1] == base64.b64encode(data).decode()
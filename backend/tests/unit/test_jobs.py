@@ -0,0 +1,161 @@
+# Built-in imports
+import time
+import asyncio
+
+# External imports
+import boto3
+import pytest
+from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
+from moto import mock_sqs
+
+# Own imports
+from api.v1 import worker
+from api.v1.helpers import jobs
+
+
+EVENT = {"promptBase": "Assess 2 m5.large"}
+
+
+@pytest.fixture
+def store():
+    return jobs.JobStore(jobs.InMemoryJobBackend())
+
+
+def _submit(store: jobs.JobStore) -> str:
+    return asyncio.run(store.asubmit(EVENT))["job_id"]
+
+
+async def _answer(event: dict) -> dict:
+    return {"Answer": event["promptBase"]}
+
+
+async def _invalid(event: dict) -> dict:
+    raise ValueError("Invalid <promptBase>")
+
+
+async def _throttled(event: dict) -> dict:
+    raise RuntimeError("ThrottlingException")
+
+
+def test_arun_stores_the_result(store):
+    job_id = _submit(store)
+    asyncio.run(store.arun(job_id, _answer))
+
+    job = asyncio.run(store.aget(job_id))
+    assert job["status"] == jobs.SUCCEEDED
+    assert job["attempts"] == 1
+    assert job["result"] == {"Answer": EVENT["promptBase"]}
+
+
+def test_arun_fails_invalid_inputs_at_once(store):
+    job_id = _submit(store)
+    asyncio.run(store.arun(job_id, _invalid, final_attempt=False))
+
+    job = asyncio.run(store.aget(job_id))
+    assert job["status"] == jobs.FAILED
+    assert job["error"] == "Invalid <promptBase>"
+
+
+def test_arun_requeues_other_errors(store):
+    job_id = _submit(store)
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.arun(job_id, _throttled, final_attempt=False))
+
+    job = asyncio.run(store.aget(job_id))
+    assert job["status"] == jobs.QUEUED
+    assert job["attempts"] == 1
+
+
+def test_arun_fails_on_the_final_attempt(store):
+    job_id = _submit(store)
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.arun(job_id, _throttled, final_attempt=False))
+    asyncio.run(store.arun(job_id, _throttled, final_attempt=True))
+
+    job = asyncio.run(store.aget(job_id))
+    assert job["status"] == jobs.FAILED
+    assert job["attempts"] == 2
+
+
+def test_arun_skips_duplicated_deliveries(store):
+    job_id = _submit(store)
+    asyncio.run(store.arun(job_id, _answer))
+    # A finished job is not processed again
+    asyncio.run(store.arun(job_id, _throttled))
+    assert asyncio.run(store.aget(job_id))["status"] == jobs.SUCCEEDED
+
+
+def test_aget_unknown_jobs(store):
+    assert asyncio.run(store.aget("not-a-ulid")) is None
+    assert asyncio.run(store.aget(jobs.new_job_id())) is None
+
+
+def test_retry_delay_is_bounded(monkeypatch):
+    monkeypatch.setattr(jobs.random, "uniform", lambda low, high: high)
+    assert jobs.retry_delay(1) == jobs.JOB_RETRY_BASE_SECONDS
+    assert jobs.retry_delay(2) == jobs.JOB_RETRY_BASE_SECONDS * 2
+    assert jobs.retry_delay(20) == jobs.JOB_RETRY_MAX_SECONDS
+
+
+@mock_sqs
+def test_adelay_retry_changes_the_message_visibility(monkeypatch):
+    monkeypatch.setattr(jobs, "retry_delay", lambda attempt: 0)
+    sqs = boto3.client("sqs")
+    queue_url = sqs.create_queue(
+        QueueName="jobs", Attributes={"VisibilityTimeout": "3600"}
+    )["QueueUrl"]
+    backend = jobs.AWSJobBackend("jobs", "jobs", queue_url, 60)
+    store = jobs.JobStore(backend)
+
+    backend.send("job")
+    message = sqs.receive_message(QueueUrl=queue_url)["Messages"][0]
+    assert "Messages" not in sqs.receive_message(QueueUrl=queue_url)
+
+    asyncio.run(store.adelay_retry(message["ReceiptHandle"], attempt=1))
+    # Visible again right after the backoff, not after the visibility timeout
+    assert sqs.receive_message(QueueUrl=queue_url)["Messages"][0]["Body"] == "job"
+
+
+def test_worker_delays_the_retries(monkeypatch):
+    delayed = []
+
+    async def fail(job_id: str, final_attempt: bool) -> None:
+        raise RuntimeError("ThrottlingException")
+
+    async def delay(receipt_handle: str, attempt: int) -> None:
+        delayed.append((receipt_handle, attempt))
+
+    monkeypatch.setattr(worker.captain, "run_job", fail)
+    monkeypatch.setattr(worker.jobs.job_store, "adelay_retry", delay)
+    record = SQSRecord(
+        {
+            "body": "job",
+            "receiptHandle": "handle",
+            "attributes": {"ApproximateReceiveCount": "2"},
+        }
+    )
+    with pytest.raises(RuntimeError):
+        worker.record_handler(record)
+    assert delayed == [("handle", 2)]
+
+
+@pytest.mark.parametrize(
+    "attempts, status", [(1, jobs.QUEUED), (jobs.JOB_MAX_ATTEMPTS, jobs.FAILED)]
+)
+def test_aget_reports_the_lost_attempts(store, attempts, status):
+    job_id = _submit(store)
+    job = store.backend.get_job(job_id)
+    stale = time.time() - jobs.JOB_RUNNING_TIMEOUT_SECONDS - 1
+    store.backend.put_job(
+        {**job, "status": jobs.RUNNING, "attempts": attempts, "updated_at": stale}
+    )
+    assert asyncio.run(store.aget(job_id))["status"] == status
+
+
+def test_aget_reports_the_running_jobs(store):
+    job_id = _submit(store)
+    job = store.backend.get_job(job_id)
+    store.backend.put_job(
+        {**job, "status": jobs.RUNNING, "attempts": jobs.JOB_MAX_ATTEMPTS}
+    )
+    assert asyncio.run(store.aget(job_id))["status"] == jobs.RUNNING
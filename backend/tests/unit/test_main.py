@@ -0,0 +1,31 @@
+# Built-in imports
+import importlib
+
+# External imports
+import pytest
+from fastapi.testclient import TestClient
+
+# Own imports
+from api.v1 import main
+
+
+@pytest.fixture
+def stream_only_app(monkeypatch):
+    monkeypatch.setenv("STREAM_ONLY", "true")
+    yield importlib.reload(main).app
+    monkeypatch.delenv("STREAM_ONLY")
+    importlib.reload(main)
+
+
+def test_stream_only_app_serves_only_the_stream_route(stream_only_app):
+    paths = {getattr(route, "path", None) for route in stream_only_app.routes}
+    assert "/api/v1/captain/stream" in paths
+    assert not paths & {
+        "/api/v1/captain",
+        "/api/v1/captain/jobs",
+        "/api/v1/captain/cur",
+    }
+
+    client = TestClient(stream_only_app)
+    assert client.post("/api/v1/captain/batch", json={"items": []}).status_code == 404
+    assert client.get("/api/v1/captain/jobs/some-job").status_code == 404
@@ -0,0 +1,78 @@
+# Built-in imports
+import json
+
+# External imports
+from aws_lambda_powertools.metrics import MetricUnit
+from fastapi.testclient import TestClient
+
+# Own imports
+from api.v1.helpers import observability
+from api.v1.main import app
+
+
+client = TestClient(app)
+
+
+def _emf_entries(output: str) -> list[dict]:
+    entries = [json.loads(line) for line in output.splitlines() if '"_aws"' in line]
+    return [entry for entry in entries if "_aws" in entry]
+
+
+def test_request_metrics_are_flushed_as_one_emf_entry(capsys):
+    response = client.post(
+        "/api/v1/captain/estimate",
+        json={"resources": [{"service": "EC2", "instance_type": "m5.large"}]},
+    )
+    assert response.status_code == 200
+
+    entries = _emf_entries(capsys.readouterr().out)
+    assert len(entries) == 1
+    entry = entries[0]
+    metric_names = {
+        metric["Name"]
+        for directive in entry["_aws"]["CloudWatchMetrics"]
+        for metric in directive["Metrics"]
+    }
+    assert {"RequestLatency", "RequestBytes", "ResponseBytes", "ColdStart"} <= (
+        metric_names
+    )
+    # The dimensions are the route template and the model (none without a call)
+    assert entry["route"] == "/api/v1/captain/estimate"
+    assert entry["model_id"] == "none"
+    assert entry["ResponseBytes"] == [len(response.content)]
+    assert entry["RequestBytes"][0] > 0
+
+
+def test_unmatched_routes_have_a_single_dimension_value(capsys):
+    client.get("/api/v1/not-a-route/123")
+    entries = _emf_entries(capsys.readouterr().out)
+    assert [entry["route"] for entry in entries] == ["unmatched"]
+
+
+def test_add_metric_outside_of_a_request_is_ignored(capsys):
+    observability.add_metric("InputTokens", MetricUnit.Count, 1)
+    observability.set_model("model")
+    assert _emf_entries(capsys.readouterr().out) == []
+
+
+def test_redact_messages_drops_the_image_data():
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {"media_type": "image/png", "data": "a" * 400},
+                },
+                {"type": "text", "text": "Assess it"},
+            ],
+        }
+    ]
+    redacted = observability.redact_messages(messages)
+    assert redacted[0]["content"][0] == {
+        "type": "image",
+        "media_type": "image/png",
+        "bytes": 300,
+    }
+    assert redacted[0]["content"][1]["length"] == len("Assess it")
+    assert "text" not in redacted[0]["content"][1]
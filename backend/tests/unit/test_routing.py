@@ -0,0 +1,187 @@
+# Built-in imports
+import time
+import asyncio
+
+# External imports
+import pytest
+from botocore.exceptions import ClientError
+
+# Own imports
+from api.v1.helpers import admission, bedrock, routing
+
+
+REGISTRY = {
+    "light": [{"model_id": "light-1"}, {"model_id": "light-2", "region": "us-west-2"}],
+    "heavy": [{"model_id": "heavy-1"}],
+}
+
+
+def _error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "InvokeModel")
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_REGISTRY", REGISTRY)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+
+    async def sleep(delay: float) -> None:
+        delays.append(delay)
+
+    monkeypatch.setattr(routing.asyncio, "sleep", sleep)
+    return delays
+
+
+def _fake_bedrock(monkeypatch, results: dict[str, list]) -> list:
+    """
+    Fake "bedrock.ainvoke()" that returns (or raises) the next result of every
+    model, and records the calls.
+    """
+    calls = []
+
+    async def ainvoke(body, model_id, region=None):
+        calls.append((model_id, region))
+        result = results[model_id].pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(routing.bedrock, "ainvoke", ainvoke)
+    return calls
+
+
+def test_select_tier():
+    assert routing.select_tier({"promptBase": "And the storage?"}) == "light"
+    assert routing.select_tier({"promptBase": "Assess 2 m5.large"}) == "heavy"
+    assert routing.select_tier({"promptBase": "Hi", "imageBase": "data"}) == "heavy"
+    assert routing.select_tier({"promptBase": "x" * 301}) == "heavy"
+
+
+def test_load_registry():
+    assert routing.load_registry(None) == routing.DEFAULT_MODEL_REGISTRY
+    registry = routing.load_registry('{"heavy": [{"model_id": "heavy-1"}]}')
+    assert registry["light"] == [{"model_id": "heavy-1"}]
+    with pytest.raises(ValueError):
+        routing.load_registry('{"medium": [{"model_id": "model"}]}')
+
+
+def test_ainvoke_fails_over_to_the_next_model(monkeypatch, sleeps):
+    calls = _fake_bedrock(
+        monkeypatch,
+        {"light-1": [_error("ThrottlingException")], "light-2": [{"answer": "ok"}]},
+    )
+    assert asyncio.run(routing.ainvoke(b"{}", "light")) == {"answer": "ok"}
+    assert calls == [("light-1", None), ("light-2", "us-west-2")]
+    assert sleeps == []
+
+
+def test_ainvoke_does_not_fail_over_other_errors(monkeypatch, sleeps):
+    _fake_bedrock(monkeypatch, {"light-1": [_error("ValidationException")]})
+    with pytest.raises(ClientError):
+        asyncio.run(routing.ainvoke(b"{}", "light"))
+
+
+def test_ainvoke_retries_a_throttled_tier_with_backoff(monkeypatch, sleeps):
+    monkeypatch.setattr(routing.random, "uniform", lambda low, high: high)
+    calls = _fake_bedrock(
+        monkeypatch,
+        {
+            "heavy-1": [
+                _error("ThrottlingException"),
+                _error("ServiceUnavailableException"),
+                {"answer": "ok"},
+            ]
+        },
+    )
+    assert asyncio.run(routing.ainvoke(b"{}", "heavy")) == {"answer": "ok"}
+    assert len(calls) == 3
+    # Exponential backoff (the jitter is up to the doubled delay)
+    assert sleeps == [
+        routing.THROTTLE_BACKOFF_BASE_SECONDS,
+        routing.THROTTLE_BACKOFF_BASE_SECONDS * 2,
+    ]
+
+
+def test_ainvoke_rejects_after_the_retry_deadline(monkeypatch, sleeps):
+    monkeypatch.setattr(routing, "THROTTLE_RETRY_DEADLINE_SECONDS", 0)
+    _fake_bedrock(monkeypatch, {"heavy-1": [_error("ThrottlingException")]})
+    with pytest.raises(admission.OverloadedError):
+        asyncio.run(routing.ainvoke(b"{}", "heavy"))
+
+
+def test_ainvoke_stream_fails_over_before_the_first_event(monkeypatch, sleeps):
+    calls = []
+
+    async def ainvoke_stream(body, model_id, region=None):
+        calls.append(model_id)
+        if model_id == "light-1":
+            raise _error("throttlingException")
+        yield {"type": "message_start"}
+        yield {"type": "message_stop"}
+
+    monkeypatch.setattr(routing.bedrock, "ainvoke_stream", ainvoke_stream)
+
+    async def collect() -> list:
+        return [event async for event in routing.ainvoke_stream(b"{}", "light")]
+
+    assert asyncio.run(collect()) == [
+        {"type": "message_start"},
+        {"type": "message_stop"},
+    ]
+    assert calls == ["light-1", "light-2"]
+
+
+def test_ainvoke_stream_does_not_retry_a_started_stream(monkeypatch, sleeps):
+    async def ainvoke_stream(body, model_id, region=None):
+        yield {"type": "message_start"}
+        raise _error("throttlingException")
+
+    monkeypatch.setattr(routing.bedrock, "ainvoke_stream", ainvoke_stream)
+
+    async def collect() -> list:
+        return [event async for event in routing.ainvoke_stream(b"{}", "heavy")]
+
+    with pytest.raises(ClientError):
+        asyncio.run(collect())
+    assert sleeps == []
+
+
+def test_bedrock_client_does_not_retry():
+    # The throttling retries are done by the routing, within its deadline
+    assert bedrock.BEDROCK_CLIENT_CONFIG.retries["total_max_attempts"] == 1
+
+
+def test_ainvoke_caps_the_attempts_with_the_call_deadline(monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_CALL_TIMEOUT_SECONDS", 0.05)
+    calls = []
+
+    async def ainvoke(body, model_id, region=None):
+        calls.append(model_id)
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(routing.bedrock, "ainvoke", ainvoke)
+    start_time = time.monotonic()
+    with pytest.raises(admission.OverloadedError):
+        asyncio.run(routing.ainvoke(b"{}", "light"))
+    assert time.monotonic() - start_time < 1
+    assert calls == ["light-1"]
+
+
+def test_ainvoke_stream_caps_the_first_event(monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_CALL_TIMEOUT_SECONDS", 0.05)
+
+    async def ainvoke_stream(body, model_id, region=None):
+        await asyncio.sleep(10)
+        yield {"type": "message_start"}
+
+    monkeypatch.setattr(routing.bedrock, "ainvoke_stream", ainvoke_stream)
+
+    async def collect() -> list:
+        return [event async for event in routing.ainvoke_stream(b"{}", "heavy")]
+
+    with pytest.raises(admission.OverloadedError):
+        asyncio.run(collect())
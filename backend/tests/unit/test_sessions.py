@@ -0,0 +1,117 @@
+# Built-in imports
+import asyncio
+
+# External imports
+from fastapi.testclient import TestClient
+
+# Own imports
+from api.v1.helpers import sessions
+from api.v1.main import app
+
+
+IMAGE_BLOCK = {"type": "image", "source": {"type": "base64", "data": "aGVsbG8="}}
+
+
+def _turn(number: int, words: int = 200) -> list[dict]:
+    return [
+        {"role": "user", "content": f"Question {number} " + "word " * words},
+        {"role": "assistant", "content": f"<p>Answer {number}</p> " + "word " * words},
+    ]
+
+
+def test_estimate_tokens():
+    assert sessions.estimate_tokens("a" * 40) == 11
+    assert (
+        sessions.estimate_tokens([IMAGE_BLOCK, {"type": "text", "text": "a" * 40}])
+        == sessions.IMAGE_TOKENS + 11
+    )
+
+
+def test_append_turn_strips_images():
+    turn = [
+        {"role": "user", "content": [IMAGE_BLOCK]},
+        {"role": "user", "content": "Assess it"},
+        {"role": "assistant", "content": "<p>Done</p>"},
+    ]
+    session = sessions.append_turn(sessions.new_session(), turn)
+    assert session["messages"][0]["content"] == [
+        {"type": "text", "text": sessions.IMAGE_PLACEHOLDER}
+    ]
+
+
+def test_append_turn_keeps_the_history_within_the_budget():
+    session = sessions.new_session()
+    for number in range(10):
+        session = sessions.append_turn(session, _turn(number), token_budget=600)
+
+    tokens = sum(sessions.estimate_tokens(m["content"]) for m in session["messages"])
+    assert tokens <= 600
+    # The history starts with a user message and ends with the latest answer
+    assert session["messages"][0]["role"] == "user"
+    assert "Answer 9" in session["messages"][-1]["content"]
+    # The dropped turns are folded into the summary, which keeps its latest part
+    assert "Question 8" in session["summary"]
+    assert len(session["summary"]) <= sessions.SESSION_SUMMARY_MAX_CHARS
+
+
+def test_append_turn_always_keeps_the_latest_turn():
+    session = sessions.append_turn(
+        sessions.new_session(), _turn(1, words=2000), token_budget=10
+    )
+    assert len(session["messages"]) == 2
+    assert session["summary"] == ""
+
+
+def test_build_history_adds_the_summary_to_the_first_message():
+    session = {
+        "messages": [{"role": "user", "content": "Hello"}],
+        "summary": "- User: earlier question",
+        "image_digests": [],
+    }
+    history = sessions.build_history(session)
+    assert history[0]["content"][0]["text"].startswith(sessions.SUMMARY_HEADER)
+    assert history[0]["content"][1] == {"type": "text", "text": "Hello"}
+    # The stored session is not modified
+    assert session["messages"][0]["content"] == "Hello"
+
+
+def test_add_image_keeps_the_latest_digests():
+    session = sessions.new_session()
+    for number in range(sessions.SESSION_MAX_IMAGE_DIGESTS + 5):
+        session = sessions.add_image(session, f"digest-{number}")
+    assert len(session["image_digests"]) == sessions.SESSION_MAX_IMAGE_DIGESTS
+    assert not sessions.has_image(session, "digest-0")
+    assert sessions.has_image(session, "digest-24")
+
+
+def test_in_memory_session_store_roundtrip():
+    store = sessions.SessionStore(sessions.InMemorySessionStore())
+    assert asyncio.run(store.aload("missing")) is None
+    asyncio.run(store.asave("session", {"messages": [], "summary": "s"}))
+    assert asyncio.run(store.aload("session"))["summary"] == "s"
+
+
+def test_captain_session_mode(monkeypatch):
+    requests = []
+
+    async def fake_ainvoke(body, tier):
+        requests.append(body)
+        return {
+            "content": [{"type": "text", "text": "<p>Answer</p>"}],
+            "usage": {"input_tokens": 10, "output_tokens": 5},
+        }
+
+    monkeypatch.setattr("api.v1.helpers.routing.ainvoke", fake_ainvoke)
+    client = TestClient(app)
+
+    first = client.post("/api/v1/captain", json={"promptBase": "First question"})
+    session_id = first.json()["body"]["sessionId"]
+    second = client.post(
+        "/api/v1/captain",
+        json={"promptBase": "Second question", "sessionId": session_id},
+    )
+
+    assert second.status_code == 200
+    assert "messages" not in second.json()["body"]
+    # The second request carries the stored history of the first turn
+    assert b"First question" in requests[-1]
@@ -0,0 +1,147 @@
+####################################################################################################
+# COLD START BENCHMARK FOR THE LAMBDA HANDLER ("api.v1.main.handler")
+####################################################################################################
+"""
+Measure the cold start of the Lambda handler locally: every run is a fresh
+Python process that imports "api.v1.main" (init phase) and then invokes the
+handler with API-GW REST events (first invocations). No AWS calls are made.
+
+Usage (from the repository root):
+    python benchmarks/cold_start.py --runs 10
+    python benchmarks/cold_start.py --importtime 15
+    python benchmarks/cold_start.py --max-import-ms 600  # Exit code 1 on regressions
+"""
+
+# Built-in imports
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Own imports
+from events import BACKEND_DIR, BENCHMARK_ENVIRONMENT, LambdaContext, build_rest_event
+
+
+# Requests of the first invocations (none of them calls the model)
+FIRST_INVOCATIONS = {
+    "get_captain": build_rest_event("GET", "/api/v1/captain"),
+    "post_estimate": build_rest_event(
+        "POST",
+        "/api/v1/captain/estimate",
+        {"resources": [{"service": "EC2", "instance_type": "m5.large"}]},
+    ),
+}
+
+
+def measure_child() -> None:
+    """
+    Measure a single cold start (runs in the fresh benchmark process).
+    """
+    import time
+    import resource
+
+    sys.path.insert(0, BACKEND_DIR)
+    start = time.perf_counter()
+    from api.v1.main import handler
+
+    result = {"import_ms": (time.perf_counter() - start) * 1000}
+    for name, event in FIRST_INVOCATIONS.items():
+        start = time.perf_counter()
+        response = handler(event, LambdaContext())
+        result[f"{name}_ms"] = (time.perf_counter() - start) * 1000
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"Unexpected response for {name}: {response}")
+    result["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+
+
+def run_child(extra_env: dict) -> dict:
+    completed = subprocess.run(
+        [sys.executable, __file__, "--child"],
+        env={**os.environ, **BENCHMARK_ENVIRONMENT, **extra_env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def print_importtime(top: int) -> None:
+    """
+    Print the modules with the highest cumulative import time ("-X importtime").
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api.v1.main"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **BENCHMARK_ENVIRONMENT},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        rows.append((int(cumulative), module.strip()))
+    print(f"\nTop {top} imports by cumulative time:")
+    for cumulative, module in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=10, help="Number of cold starts")
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Extra environment variable for the handler (e.g. ENABLE_DOCS=false)",
+    )
+    parser.add_argument(
+        "--importtime", type=int, default=0, metavar="N", help="Show the top N imports"
+    )
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        help="Fail (exit code 1) if the median import time is above this value",
+    )
+    args = parser.parse_args()
+
+    if args.child:
+        measure_child()
+        return 0
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    runs = [run_child(extra_env) for _ in range(args.runs)]
+
+    print(
+        f"Cold starts of api.v1.main.handler ({args.runs} runs, {sys.version.split()[0]})"
+    )
+    print(f"{'metric':<20}{'median':>10}{'min':>10}{'max':>10}")
+    for metric in runs[0]:
+        values = [run[metric] for run in runs]
+        print(
+            f"{metric:<20}{statistics.median(values):>10.1f}"
+            f"{min(values):>10.1f}{max(values):>10.1f}"
+        )
+
+    if args.importtime:
+        print_importtime(args.importtime)
+
+    median_import_ms = statistics.median(run["import_ms"] for run in runs)
+    if args.max_import_ms and median_import_ms > args.max_import_ms:
+        print(
+            f"\nREGRESSION: median import time {median_import_ms:.1f} ms "
+            f"is above {args.max_import_ms} ms"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
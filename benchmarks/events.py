@@ -0,0 +1,60 @@
+####################################################################################################
+# SHARED HELPERS FOR THE BENCHMARKS (ENVIRONMENT AND SYNTHETIC LAMBDA EVENTS)
+####################################################################################################
+
+# Built-in imports
+import os
+import json
+
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend")
+
+# Environment of the benchmarked backend (no credentials, tables or network needed)
+BENCHMARK_ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "LOG_LEVEL": "ERROR",
+    "POWERTOOLS_TRACE_DISABLED": "true",
+    # All the requests come from the same client (no per-client admission control)
+    "ADMISSION_RATE_PER_SECOND": "0",
+    "PYTHONDONTWRITEBYTECODE": "1",
+}
+
+
+def build_rest_event(method: str, path: str, body: dict | None = None) -> dict:
+    """
+    Build a minimal API-GW REST (proxy integration) event for the Mangum handler.
+
+    :param method (str): The HTTP method.
+    :param path (str): The resource path (without the stage).
+    :param body (dict): Optional JSON body.
+    """
+    return {
+        "resource": path,
+        "path": path,
+        "httpMethod": method,
+        "headers": {"content-type": "application/json", "host": "localhost"},
+        "multiValueHeaders": {},
+        "queryStringParameters": None,
+        "multiValueQueryStringParameters": None,
+        "pathParameters": None,
+        "stageVariables": None,
+        "requestContext": {
+            "resourcePath": path,
+            "httpMethod": method,
+            "path": path,
+            "stage": "benchmark",
+            "requestId": "benchmark",
+            "identity": {"sourceIp": "127.0.0.1"},
+        },
+        "body": json.dumps(body) if body is not None else None,
+        "isBase64Encoded": False,
+    }
+
+
+class LambdaContext:
+    function_name = "benchmark"
+    memory_limit_in_mb = 512
+    invoked_function_arn = "arn:aws:lambda:us-east-1:123456789012:function:benchmark"
+    aws_request_id = "benchmark"
@@ -0,0 +1,140 @@
+####################################################################################################
+# LOCAL STAND-IN FOR THE BEDROCK RUNTIME CLIENT (NO NETWORK ACCESS NEEDED)
+####################################################################################################
+
+# Built-in imports
+import io
+import json
+import time
+import random
+import threading
+from typing import Iterator
+
+# External imports
+from botocore.exceptions import ClientError
+
+
+class FakeBedrockRuntime:
+    """
+    Fake "bedrock-runtime" client with the same "invoke_model" and
+    "invoke_model_with_response_stream" interface as boto3. It blocks the
+    calling thread like the real client, for a configurable time to first
+    token plus the generation time of the answer at a given token rate.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 300,
+        tokens_per_second: float = 80,
+        output_tokens: int = 200,
+        throttle_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        """
+        :param latency_ms (float): Time to first token.
+        :param tokens_per_second (float): Generation speed of the output tokens.
+        :param output_tokens (int): Tokens of every answer.
+        :param throttle_rate (float): Probability (0-1) of a "ThrottlingException".
+        :param seed (int): Seed for the throttling errors (reproducible runs).
+        """
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._cached_prefixes: set[int] = set()
+        self.calls = 0
+        self.throttled = 0
+
+    def _start(self, body: str, operation: str) -> dict:
+        """
+        Count the call, raise the throttling errors and get the input "usage"
+        (the system prompt is reported as cached after its first request).
+        """
+        request = json.loads(body)
+        system = json.dumps(request.get("system"))
+        with self._lock:
+            self.calls += 1
+            if self._random.random() < self.throttle_rate:
+                self.throttled += 1
+                raise ClientError(
+                    {
+                        "Error": {
+                            "Code": "ThrottlingException",
+                            "Message": "Too many requests, please wait before trying again.",
+                        }
+                    },
+                    operation,
+                )
+            cache_hit = hash(system) in self._cached_prefixes
+            self._cached_prefixes.add(hash(system))
+
+        input_tokens = len(body) // 4
+        system_tokens = len(system) // 4
+        return {
+            "input_tokens": input_tokens - system_tokens,
+            "cache_read_input_tokens": system_tokens if cache_hit else 0,
+            "cache_creation_input_tokens": 0 if cache_hit else system_tokens,
+        }
+
+    def _tokens(self) -> Iterator[str]:
+        for i in range(self.output_tokens):
+            yield "<p>" if i == 0 else f"token{i} "
+
+    def invoke_model(self, body: str, modelId: str, **kwargs) -> dict:
+        usage = self._start(body, "InvokeModel")
+        time.sleep(self.latency_ms / 1000 + self.output_tokens / self.tokens_per_second)
+        answer = {
+            "id": "msg_fake",
+            "type": "message",
+            "role": "assistant",
+            "model": modelId,
+            "content": [{"type": "text", "text": "".join(self._tokens())}],
+            "stop_reason": "end_turn",
+            "usage": {**usage, "output_tokens": self.output_tokens},
+        }
+        return {"body": io.BytesIO(json.dumps(answer).encode("utf-8"))}
+
+    def invoke_model_with_response_stream(
+        self, body: str, modelId: str, **kwargs
+    ) -> dict:
+        usage = self._start(body, "InvokeModelWithResponseStream")
+        return {"body": self._stream(usage, modelId)}
+
+    def _stream(self, usage: dict, model_id: str) -> Iterator[dict]:
+        def chunk(event: dict) -> dict:
+            return {"chunk": {"bytes": json.dumps(event).encode("utf-8")}}
+
+        time.sleep(self.latency_ms / 1000)
+        yield chunk(
+            {
+                "type": "message_start",
+                "message": {"model": model_id, "usage": {**usage, "output_tokens": 1}},
+            }
+        )
+        yield chunk(
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            }
+        )
+        for token in self._tokens():
+            time.sleep(1 / self.tokens_per_second)
+            yield chunk(
+                {
+                    "type": "content_block_delta",
+                    "index": 0,
+                    "delta": {"type": "text_delta", "text": token},
+                }
+            )
+        yield chunk({"type": "content_block_stop", "index": 0})
+        yield chunk(
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn"},
+                "usage": {"output_tokens": self.output_tokens},
+            }
+        )
+        yield chunk({"type": "message_stop"})
@@ -0,0 +1,409 @@
+####################################################################################################
+# OFFLINE LOAD TEST AND LATENCY BENCHMARK FOR THE CAPTAIN API (FAKE BEDROCK, NO NETWORK)
+####################################################################################################
+"""
+Drive the backend with a local stand-in for Bedrock, both through the Lambda
+handler ("api.v1.main.handler", Mangum with API-GW REST events, one request at
+a time like a Lambda execution environment) and through the ASGI "app" directly
+(concurrent requests, like the uvicorn streaming function). Reports latency
+percentiles, requests per second, event-loop lag and memory per request.
+
+Usage (from the repository root):
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --modes asgi --routes post,stream --concurrency 32
+    python benchmarks/load_test.py --latency-ms 800 --tokens-per-second 60 --throttle-rate 0.05
+    python benchmarks/load_test.py --output baseline.json
+"""
+
+# Built-in imports
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import logging
+import contextlib
+import argparse
+import itertools
+import statistics
+import tracemalloc
+
+# Own imports
+from events import BACKEND_DIR, BENCHMARK_ENVIRONMENT, LambdaContext, build_rest_event
+from fake_bedrock import FakeBedrockRuntime
+
+
+# Routes of the benchmark: method, path and whether they call the model
+ROUTES = {
+    "get": ("GET", "/api/v1/captain", False),
+    "post": ("POST", "/api/v1/captain", True),
+    "stream": ("POST", "/api/v1/captain/stream", True),
+}
+
+PROMPT = "Assess 2 EC2 m5.large instances running 24/7 in us-east-1 (workload {})"
+
+# Unique workload numbers, so that the prompts are never answered by the response cache
+WORKLOAD_IDS = itertools.count(1)
+
+# Interval of the event-loop lag monitor
+LAG_INTERVAL_SECONDS = 0.005
+
+
+def request_body(route: str, cache_hits: bool) -> dict | None:
+    """
+    Body of a request (unique prompts, unless all of them should be answered
+    by the response cache after the first one).
+    """
+    if not ROUTES[route][2]:
+        return None
+    workload = 0 if cache_hits else next(WORKLOAD_IDS)
+    return {"messages": [], "promptBase": PROMPT.format(workload)}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile (0 for an empty list).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(
+    mode: str, route: str, latencies: list[float], errors: int, elapsed: float, **extra
+) -> dict:
+    return {
+        "mode": mode,
+        "route": route,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+        **extra,
+    }
+
+
+####################################################################################################
+# LAMBDA HANDLER (MANGUM) MODE
+####################################################################################################
+
+
+def use_lambda_event_loop() -> None:
+    """
+    Mangum runs the requests in the current event loop of the thread (as on
+    Lambda), which "asyncio.run()" of the ASGI mode leaves closed.
+    """
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+def run_mangum(handler, route: str, requests: int, cache_hits: bool) -> dict:
+    """
+    Sequential invocations of the Lambda handler (one request per execution
+    environment at a time, as on Lambda).
+    """
+    method, path, _ = ROUTES[route]
+    use_lambda_event_loop()
+    events = [
+        build_rest_event(method, path, request_body(route, cache_hits))
+        for _ in range(requests)
+    ]
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for event in events:
+        request_start = time.perf_counter()
+        response = handler(event, LambdaContext())
+        latencies.append(time.perf_counter() - request_start)
+        errors += response["statusCode"] >= 400
+    return summarize("mangum", route, latencies, errors, time.perf_counter() - start)
+
+
+def measure_memory(handler, route: str, requests: int, cache_hits: bool) -> dict:
+    """
+    Peak memory allocated while serving a request and memory retained after
+    it (tracemalloc slows the requests down, so it runs in a separate pass).
+    """
+    method, path, _ = ROUTES[route]
+    use_lambda_event_loop()
+    peaks = []
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for _ in range(requests):
+        event = build_rest_event(method, path, request_body(route, cache_hits))
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        handler(event, LambdaContext())
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {
+        "peak_kib_per_request": statistics.median(peaks) / 1024,
+        "retained_kib_per_request": retained / requests / 1024,
+    }
+
+
+####################################################################################################
+# ASGI MODE
+####################################################################################################
+
+
+async def asgi_request(app, method: str, path: str, body: dict | None) -> dict:
+    """
+    Send a single HTTP request to the ASGI app (without any server or client)
+    and get its status, size and time to first byte.
+    """
+    request_body = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"host", b"localhost")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("localhost", 80),
+    }
+    sent = False
+    disconnected = asyncio.Event()
+    result = {"status": 500, "bytes": 0, "ttfb": None}
+    start = time.perf_counter()
+
+    async def receive() -> dict:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": request_body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if result["ttfb"] is None:
+                result["ttfb"] = time.perf_counter() - start
+            result["bytes"] += len(message["body"])
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        pass  # The error response (if any) was already sent by the app
+    finally:
+        disconnected.set()
+    return result
+
+
+async def monitor_loop_lag(lags: list[float], stop: asyncio.Event) -> None:
+    """
+    Measure how late the event loop wakes up a sleeping task (time blocked by
+    synchronous code in the coroutines).
+    """
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL_SECONDS)
+        lags.append(max(0.0, time.perf_counter() - start - LAG_INTERVAL_SECONDS))
+
+
+async def run_asgi(
+    app, route: str, requests: int, concurrency: int, cache_hits: bool
+) -> dict:
+    """
+    Concurrent requests to the ASGI app (at most "concurrency" at once).
+    """
+    method, path, _ = ROUTES[route]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, ttfbs, lags = [], [], []
+    errors = 0
+
+    async def one_request() -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            result = await asgi_request(
+                app, method, path, request_body(route, cache_hits)
+            )
+            latencies.append(time.perf_counter() - start)
+            errors += result["status"] >= 400
+            if result["ttfb"] is not None:
+                ttfbs.append(result["ttfb"])
+
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+
+    return summarize(
+        "asgi",
+        route,
+        latencies,
+        errors,
+        elapsed,
+        ttfb_p50_ms=percentile(ttfbs, 50) * 1000,
+        loop_lag_p99_ms=percentile(lags, 99) * 1000,
+        loop_lag_max_ms=max(lags, default=0.0) * 1000,
+    )
+
+
+####################################################################################################
+# MAIN
+####################################################################################################
+
+
+def load_backend(fake_bedrock: FakeBedrockRuntime, log_level: str):
+    """
+    Import the backend with the benchmark environment and the fake Bedrock
+    client (the logs are serialized as usual, but discarded).
+    """
+    os.environ.update({**BENCHMARK_ENVIRONMENT, "LOG_LEVEL": log_level})
+    for variable in ("RESPONSE_CACHE_TABLE", "SESSIONS_TABLE", "ENVIRONMENT"):
+        os.environ.pop(variable, None)
+    sys.path.insert(0, BACKEND_DIR)
+
+    from api.v1 import main
+    from api.v1.helpers import bedrock
+
+    bedrock.get_client = lambda region=None: fake_bedrock
+    # The logger handles the uncaught exceptions, which would go to the discarded logs
+    sys.excepthook = sys.__excepthook__
+    devnull = open(os.devnull, "w")
+    for handler in logging.getLogger("captain-sustainability").handlers:
+        handler.setStream(devnull)
+    return main
+
+
+# Columns of the results table: name, width and decimals
+RESULT_COLUMNS = [
+    ("requests", 9, 0),
+    ("errors", 7, 0),
+    ("rps", 9, 1),
+    ("p50_ms", 9, 1),
+    ("p95_ms", 9, 1),
+    ("p99_ms", 9, 1),
+    ("max_ms", 9, 1),
+    ("ttfb_p50_ms", 12, 1),
+    ("loop_lag_p99_ms", 16, 2),
+    ("loop_lag_max_ms", 16, 2),
+    ("peak_kib_per_request", 21, 1),
+    ("retained_kib_per_request", 25, 2),
+]
+
+
+def print_results(results: list[dict]) -> None:
+    print(
+        f"{'mode':<8}{'route':<8}"
+        + "".join(f"{name:>{width}}" for name, width, _ in RESULT_COLUMNS)
+    )
+    for result in results:
+        print(
+            f"{result['mode']:<8}{result['route']:<8}"
+            + "".join(
+                f"{result[name]:>{width}.{decimals}f}"
+                if name in result
+                else f"{'-':>{width}}"
+                for name, width, decimals in RESULT_COLUMNS
+            )
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", default="mangum,asgi", help="mangum and/or asgi")
+    parser.add_argument(
+        "--routes",
+        default="get,post",
+        help=f"Comma-separated routes ({', '.join(ROUTES)}); stream is asgi only",
+    )
+    parser.add_argument("--requests", type=int, default=50, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=16, help="ASGI mode only")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests")
+    parser.add_argument(
+        "--memory-requests",
+        type=int,
+        default=20,
+        help="Requests of the tracemalloc pass (0 to skip it)",
+    )
+    parser.add_argument(
+        "--cache-hits",
+        action="store_true",
+        help="Repeat the same prompt (served by the response cache)",
+    )
+    parser.add_argument("--log-level", default="INFO", help="LOG_LEVEL of the backend")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake TTFT")
+    parser.add_argument("--tokens-per-second", type=float, default=2000)
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    fake_bedrock = FakeBedrockRuntime(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    )
+    main_module = load_backend(fake_bedrock, args.log_level)
+    modes = args.modes.split(",")
+    routes = args.routes.split(",")
+    for route in routes:
+        if route not in ROUTES:
+            parser.error(f"Unknown route <{route}>")
+
+    results = []
+    # The metrics (EMF) are printed to stdout, so they are discarded as the logs
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        for route in routes:
+            if "mangum" in modes and route != "stream":
+                run_mangum(main_module.handler, route, args.warmup, args.cache_hits)
+                result = run_mangum(
+                    main_module.handler, route, args.requests, args.cache_hits
+                )
+                if args.memory_requests:
+                    result.update(
+                        measure_memory(
+                            main_module.handler,
+                            route,
+                            args.memory_requests,
+                            args.cache_hits,
+                        )
+                    )
+                results.append(result)
+
+            if "asgi" in modes:
+                app = main_module.app
+                asyncio.run(run_asgi(app, route, args.warmup, 1, args.cache_hits))
+                results.append(
+                    asyncio.run(
+                        run_asgi(
+                            app, route, args.requests, args.concurrency, args.cache_hits
+                        )
+                    )
+                )
+
+    print(
+        f"Fake Bedrock: TTFT {args.latency_ms} ms, {args.tokens_per_second} tokens/s, "
+        f"{args.output_tokens} output tokens, throttle rate {args.throttle_rate} "
+        f"({fake_bedrock.calls} calls, {fake_bedrock.throttled} throttled)\n"
+    )
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"configuration": vars(args), "results": results}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
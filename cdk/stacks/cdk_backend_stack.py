@@ -1,19 +1,43 @@
 # Built-in imports
 import os
+import json
 
 # External imports
 from aws_cdk import (
     Stack,
     RemovalPolicy,
     Duration,
+    aws_dynamodb,
     aws_iam,
     aws_lambda,
+    aws_lambda_event_sources,
+    aws_s3,
+    aws_sqs,
     aws_apigateway as aws_apigw,
     CfnOutput,
 )
 from constructs import Construct
 
 
+# Get relative path for folder that contains Lambda function source
+# ! Note--> we must obtain parent dirs to create path (that"s why there is "os.path.dirname()")
+PATH_TO_LAMBDA_FUNCTION_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    "backend",
+)
+
+
+# Supported values of the Lambda settings in the "app_config"
+LAMBDA_ARCHITECTURES = {
+    "x86_64": aws_lambda.Architecture.X86_64,
+    "arm64": aws_lambda.Architecture.ARM_64,
+}
+LAMBDA_RUNTIMES = {
+    "3.11": aws_lambda.Runtime.PYTHON_3_11,
+    "3.12": aws_lambda.Runtime.PYTHON_3_12,
+}
+
+
 class BackendStack(Stack):
     """
     Class to create the backend resources, for the Captain Planet API Backend on AWS.
@@ -40,16 +64,176 @@ class BackendStack(Stack):
         self.main_resources_name = main_resources_name
         self.app_config = app_config
         self.deployment_environment = self.app_config["deployment_environment"]
+        # Models of the "light" and "heavy" tiers, in failover order (see "routing.py")
+        self.model_registry = json.dumps(self.app_config.get("model_registry", {}))
+
+        # Admission control of the API functions (per-client token buckets) and
+        # retries of the throttled models before answering with a 429
+        self.admission_environment = {
+            "ADMISSION_RATE_PER_SECOND": str(
+                self.app_config.get("admission_rate_per_second", 1)
+            ),
+            "ADMISSION_BURST": str(self.app_config.get("admission_burst", 10)),
+            "THROTTLE_RETRY_DEADLINE_SECONDS": str(
+                self.app_config.get("throttle_retry_deadline_seconds", 10)
+            ),
+        }
+
+        # Lambda settings that impact the cold starts (all of them are optional)
+        self.lambda_architecture_name = self.app_config.get(
+            "lambda_architecture", "x86_64"
+        )
+        self.lambda_architecture = LAMBDA_ARCHITECTURES[self.lambda_architecture_name]
+        self.lambda_runtime = LAMBDA_RUNTIMES[
+            self.app_config.get("lambda_python_version", "3.11")
+        ]
+        self.lambda_memory_size = self.app_config.get("lambda_memory_size", 512)
+        # X-Ray tracing adds ~100 ms to the cold starts (import of the X-Ray SDK)
+        self.enable_tracing = self.app_config.get("enable_tracing", True)
+        self.lambda_tracing = (
+            aws_lambda.Tracing.ACTIVE
+            if self.enable_tracing
+            else aws_lambda.Tracing.DISABLED
+        )
+        self.lambda_snap_start = self.app_config.get("lambda_snap_start", False)
+        self.lambda_provisioned_concurrency = self.app_config.get(
+            "lambda_provisioned_concurrency", 0
+        )
+        if (
+            self.lambda_snap_start
+            and self.lambda_runtime == aws_lambda.Runtime.PYTHON_3_11
+        ):
+            raise ValueError("SnapStart requires <lambda_python_version> 3.12 or newer")
+        if self.lambda_snap_start and self.lambda_provisioned_concurrency:
+            raise ValueError("SnapStart and provisioned concurrency can't be combined")
+
+        # Asynchronous jobs (the worker has a longer timeout than the API)
+        self.jobs_worker_timeout = Duration.minutes(
+            self.app_config.get("jobs_worker_timeout_minutes", 10)
+        )
+        self.jobs_max_attempts = self.app_config.get("jobs_max_attempts", 3)
+
+        # Optional bucket (and key prefix) with the Cost and Usage Report exports
+        # (read by "/captain/cur", which is limited to them)
+        self.cur_bucket_name = self.app_config.get("cur_bucket_name")
+        self.cur_prefix = self.app_config.get("cur_prefix", "")
+        self.cur_environment = (
+            {"CUR_BUCKET": self.cur_bucket_name, "CUR_PREFIX": self.cur_prefix}
+            if self.cur_bucket_name
+            else {}
+        )
 
         # Main methods for the deployment
+        self.create_dynamodb_tables()
+        self.create_job_queue()
         self.create_lambda_layers()
         self.create_lambda_functions()
+        self.create_job_worker()
+        self.create_lambda_aliases()
         self.create_rest_api()
         self.configure_rest_api_simple()  # --> Simple example usage of REST-API (proxy)
+        self.create_streaming_function_url()
 
         # Create CloudFormation outputs
         self.generate_cloudformation_outputs()
 
+    def create_dynamodb_tables(self) -> None:
+        """
+        Create the DynamoDB tables for the solution.
+        """
+
+        # Shared tier of the response cache (expired items are removed by the TTL)
+        self.dynamodb_table_response_cache = aws_dynamodb.Table(
+            self,
+            "DynamoDB-Table-ResponseCache",
+            table_name=f"{self.main_resources_name}-response-cache-{self.deployment_environment}",
+            partition_key=aws_dynamodb.Attribute(
+                name="cache_key", type=aws_dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expires_at",
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
+        # Conversation sessions (windowed history), removed by the TTL after inactivity
+        self.dynamodb_table_sessions = aws_dynamodb.Table(
+            self,
+            "DynamoDB-Table-Sessions",
+            table_name=f"{self.main_resources_name}-sessions-{self.deployment_environment}",
+            partition_key=aws_dynamodb.Attribute(
+                name="session_id", type=aws_dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expires_at",
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
+        # Status of the asynchronous jobs, removed by the TTL a day after submission
+        self.dynamodb_table_jobs = aws_dynamodb.Table(
+            self,
+            "DynamoDB-Table-Jobs",
+            table_name=f"{self.main_resources_name}-jobs-{self.deployment_environment}",
+            partition_key=aws_dynamodb.Attribute(
+                name="job_id", type=aws_dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expires_at",
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
+    def create_job_queue(self) -> None:
+        """
+        Create the resources of the asynchronous jobs: the S3 bucket for their
+        payloads (inputs with images and results) and the SQS queue (with a DLQ).
+        """
+
+        self.s3_bucket_jobs = aws_s3.Bucket(
+            self,
+            "S3-Bucket-Jobs",
+            block_public_access=aws_s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=aws_s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+            lifecycle_rules=[aws_s3.LifecycleRule(expiration=Duration.days(1))],
+            removal_policy=RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+        )
+
+        # Jobs that crash or time out in all their attempts (for inspection)
+        self.sqs_queue_jobs_dlq = aws_sqs.Queue(
+            self,
+            "SQS-Queue-Jobs-DLQ",
+            queue_name=f"{self.main_resources_name}-jobs-dlq-{self.deployment_environment}",
+            retention_period=Duration.days(14),
+            enforce_ssl=True,
+        )
+
+        # The visibility timeout is 6 times the worker timeout (AWS recommendation),
+        # the worker makes the failed jobs visible again after a short backoff
+        self.sqs_queue_jobs = aws_sqs.Queue(
+            self,
+            "SQS-Queue-Jobs",
+            queue_name=f"{self.main_resources_name}-jobs-{self.deployment_environment}",
+            visibility_timeout=Duration.seconds(
+                self.jobs_worker_timeout.to_seconds() * 6
+            ),
+            retention_period=Duration.days(1),
+            enforce_ssl=True,
+            dead_letter_queue=aws_sqs.DeadLetterQueue(
+                queue=self.sqs_queue_jobs_dlq,
+                max_receive_count=self.jobs_max_attempts,
+            ),
+        )
+
+        self.jobs_environment = {
+            "JOBS_TABLE": self.dynamodb_table_jobs.table_name,
+            "JOBS_BUCKET": self.s3_bucket_jobs.bucket_name,
+            "JOBS_QUEUE_URL": self.sqs_queue_jobs.queue_url,
+            "JOB_MAX_ATTEMPTS": str(self.jobs_max_attempts),
+            "JOB_RUNNING_TIMEOUT_SECONDS": str(
+                int(self.jobs_worker_timeout.to_seconds()) + 60
+            ),
+        }
+
     def create_lambda_layers(self) -> None:
         """
         Create the Lambda layers that are necessary for the additional runtime
@@ -60,7 +244,7 @@ class BackendStack(Stack):
         self.lambda_layer_powertools = aws_lambda.LayerVersion.from_layer_version_arn(
             self,
             "Layer-powertools",
-            layer_version_arn=f"arn:aws:lambda:{self.region}:017000801446:layer:AWSLambdaPowertoolsPythonV2:71",
+            layer_version_arn=f"arn:aws:lambda:{self.region}:017000801446:layer:AWSLambdaPowertoolsPythonV2{'-Arm64' if self.lambda_architecture_name == 'arm64' else ''}:71",
         )
 
         # Layer for "common" Python requirements (fastapi, pydantic, ...)
@@ -69,37 +253,57 @@ class BackendStack(Stack):
             "Layer-common",
             code=aws_lambda.Code.from_asset("lambda-layers/common/modules"),
             compatible_runtimes=[
-                aws_lambda.Runtime.PYTHON_3_11,
+                self.lambda_runtime,
             ],
             description="Lambda Layer for Python with <common> library",
             removal_policy=RemovalPolicy.DESTROY,
-            compatible_architectures=[aws_lambda.Architecture.X86_64],
+            compatible_architectures=[self.lambda_architecture],
+        )
+
+        # Layer for the "Lambda Web Adapter" (enables response streaming with uvicorn)
+        self.lambda_layer_web_adapter = aws_lambda.LayerVersion.from_layer_version_arn(
+            self,
+            "Layer-web-adapter",
+            layer_version_arn=f"arn:aws:lambda:{self.region}:753240598075:layer:LambdaAdapterLayer{'Arm64' if self.lambda_architecture_name == 'arm64' else 'X86'}:24",
         )
 
     def create_lambda_functions(self) -> None:
         """
         Create the Lambda Functions for the solution.
         """
-        # Get relative path for folder that contains Lambda function source
-        # ! Note--> we must obtain parent dirs to create path (that"s why there is "os.path.dirname()")
-        PATH_TO_LAMBDA_FUNCTION_FOLDER = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-            "backend",
-        )
-
         # Lambda Function for API Backend
         self.lambda_captain_planet: aws_lambda.Function = aws_lambda.Function(
             self,
             "Lambda-captain",
-            runtime=aws_lambda.Runtime.PYTHON_3_11,
+            runtime=self.lambda_runtime,
+            architecture=self.lambda_architecture,
             function_name=f"{self.main_resources_name}-{self.deployment_environment}",
             handler="api/v1/main.handler",
             code=aws_lambda.Code.from_asset(PATH_TO_LAMBDA_FUNCTION_FOLDER),
             timeout=Duration.seconds(30),
-            memory_size=512,
+            memory_size=self.lambda_memory_size,
+            tracing=self.lambda_tracing,
             environment={
                 "ENVIRONMENT": self.app_config["deployment_environment"],
+                # Below the 29 s of API-GW, so slow calls get a 429 (not a 504)
+                "MODEL_CALL_TIMEOUT_SECONDS": "25",
                 "LOG_LEVEL": self.app_config["log_level"],
+                "LOG_PAYLOAD_SAMPLE_RATE": str(
+                    self.app_config.get("log_payload_sample_rate", 0)
+                ),
+                "POWERTOOLS_SERVICE_NAME": "captain-sustainability",
+                "POWERTOOLS_METRICS_NAMESPACE": self.app_config.get(
+                    "metrics_namespace", "CaptainSustainability"
+                ),
+                "POWERTOOLS_TRACE_DISABLED": str(not self.enable_tracing).lower(),
+                "ENABLE_DOCS": str(self.app_config.get("enable_docs", True)).lower(),
+                "BEDROCK_CLIENT_PRELOAD": str(self.lambda_snap_start).lower(),
+                "MODEL_REGISTRY": self.model_registry,
+                **self.admission_environment,
+                "RESPONSE_CACHE_TABLE": self.dynamodb_table_response_cache.table_name,
+                "SESSIONS_TABLE": self.dynamodb_table_sessions.table_name,
+                **self.jobs_environment,
+                **self.cur_environment,
             },
             layers=[
                 self.lambda_layer_powertools,
@@ -112,6 +316,164 @@ class BackendStack(Stack):
             ),
         )
 
+        # Lambda Function for the streaming endpoints (same code, but served by
+        # uvicorn behind the "Lambda Web Adapter" instead of Mangum)
+        self.lambda_captain_stream: aws_lambda.Function = aws_lambda.Function(
+            self,
+            "Lambda-captain-stream",
+            runtime=self.lambda_runtime,
+            architecture=self.lambda_architecture,
+            function_name=f"{self.main_resources_name}-stream-{self.deployment_environment}",
+            handler="run.sh",
+            code=aws_lambda.Code.from_asset(PATH_TO_LAMBDA_FUNCTION_FOLDER),
+            timeout=Duration.minutes(5),
+            memory_size=self.lambda_memory_size,
+            tracing=self.lambda_tracing,
+            # Its Function URL is public and skips the API-GW throttling, so
+            # the concurrency (and the model spend) is capped here instead
+            reserved_concurrent_executions=self.app_config.get(
+                "stream_reserved_concurrency", 10
+            ),
+            environment={
+                "LOG_LEVEL": self.app_config["log_level"],
+                "LOG_PAYLOAD_SAMPLE_RATE": str(
+                    self.app_config.get("log_payload_sample_rate", 0)
+                ),
+                "POWERTOOLS_SERVICE_NAME": "captain-sustainability",
+                "POWERTOOLS_METRICS_NAMESPACE": self.app_config.get(
+                    "metrics_namespace", "CaptainSustainability"
+                ),
+                "ENABLE_DOCS": "false",
+                # The Function URL only serves the streaming route (see "main.py")
+                "STREAM_ONLY": "true",
+                "BEDROCK_CLIENT_PRELOAD": str(self.lambda_snap_start).lower(),
+                "MODEL_REGISTRY": self.model_registry,
+                **self.admission_environment,
+                "RESPONSE_CACHE_TABLE": self.dynamodb_table_response_cache.table_name,
+                "SESSIONS_TABLE": self.dynamodb_table_sessions.table_name,
+                # The uvicorn requests are not Lambda invocations for the tracer
+                "POWERTOOLS_TRACE_DISABLED": "true",
+                "AWS_LAMBDA_EXEC_WRAPPER": "/opt/bootstrap",
+                "AWS_LWA_INVOKE_MODE": "response_stream",
+                "PORT": "8000",
+            },
+            layers=[
+                self.lambda_layer_powertools,
+                self.lambda_layer_common,
+                self.lambda_layer_web_adapter,
+            ],
+        )
+        self.lambda_captain_stream.role.add_managed_policy(
+            aws_iam.ManagedPolicy.from_aws_managed_policy_name(
+                "AmazonBedrockFullAccess",
+            ),
+        )
+
+        for lambda_function in [self.lambda_captain_planet, self.lambda_captain_stream]:
+            self.dynamodb_table_response_cache.grant_read_write_data(lambda_function)
+            self.dynamodb_table_sessions.grant_read_write_data(lambda_function)
+
+        # The jobs and the CUR exports are only served by the API function
+        self.dynamodb_table_jobs.grant_read_write_data(self.lambda_captain_planet)
+        self.s3_bucket_jobs.grant_read_write(self.lambda_captain_planet)
+        self.sqs_queue_jobs.grant_send_messages(self.lambda_captain_planet)
+
+        if self.cur_bucket_name:
+            s3_bucket_cur = aws_s3.Bucket.from_bucket_name(
+                self, "S3-Bucket-CUR", self.cur_bucket_name
+            )
+            s3_bucket_cur.grant_read(self.lambda_captain_planet, f"{self.cur_prefix}*")
+
+    def create_job_worker(self) -> None:
+        """
+        Create the Lambda Function that processes the queued jobs (same code as
+        the API, with the "api/v1/worker.handler" entrypoint).
+        """
+
+        self.lambda_captain_worker: aws_lambda.Function = aws_lambda.Function(
+            self,
+            "Lambda-captain-worker",
+            runtime=self.lambda_runtime,
+            architecture=self.lambda_architecture,
+            function_name=f"{self.main_resources_name}-worker-{self.deployment_environment}",
+            handler="api/v1/worker.handler",
+            code=aws_lambda.Code.from_asset(PATH_TO_LAMBDA_FUNCTION_FOLDER),
+            timeout=self.jobs_worker_timeout,
+            memory_size=self.lambda_memory_size,
+            tracing=self.lambda_tracing,
+            environment={
+                "LOG_LEVEL": self.app_config["log_level"],
+                "LOG_PAYLOAD_SAMPLE_RATE": str(
+                    self.app_config.get("log_payload_sample_rate", 0)
+                ),
+                "POWERTOOLS_SERVICE_NAME": "captain-sustainability",
+                "POWERTOOLS_METRICS_NAMESPACE": self.app_config.get(
+                    "metrics_namespace", "CaptainSustainability"
+                ),
+                "POWERTOOLS_TRACE_DISABLED": str(not self.enable_tracing).lower(),
+                "MODEL_REGISTRY": self.model_registry,
+                "RESPONSE_CACHE_TABLE": self.dynamodb_table_response_cache.table_name,
+                "SESSIONS_TABLE": self.dynamodb_table_sessions.table_name,
+                **self.jobs_environment,
+            },
+            layers=[
+                self.lambda_layer_powertools,
+                self.lambda_layer_common,
+            ],
+        )
+        self.lambda_captain_worker.role.add_managed_policy(
+            aws_iam.ManagedPolicy.from_aws_managed_policy_name(
+                "AmazonBedrockFullAccess",
+            ),
+        )
+        self.dynamodb_table_response_cache.grant_read_write_data(
+            self.lambda_captain_worker
+        )
+        self.dynamodb_table_sessions.grant_read_write_data(self.lambda_captain_worker)
+        self.dynamodb_table_jobs.grant_read_write_data(self.lambda_captain_worker)
+        self.s3_bucket_jobs.grant_read_write(self.lambda_captain_worker)
+
+        # One job per invocation, and a bounded concurrency to stay below the
+        # Bedrock quotas (the bursts are buffered in the queue)
+        self.lambda_captain_worker.add_event_source(
+            aws_lambda_event_sources.SqsEventSource(
+                self.sqs_queue_jobs,
+                batch_size=1,
+                report_batch_item_failures=True,
+                max_concurrency=self.app_config.get("jobs_max_concurrency", 5),
+            )
+        )
+
+    def create_lambda_aliases(self) -> None:
+        """
+        Publish the Lambda Functions with a "live" alias when SnapStart or the
+        provisioned concurrency are enabled (both only apply to published
+        versions). Otherwise, the integrations use the "$LATEST" version.
+        """
+        self.lambda_captain_planet_target = self.lambda_captain_planet
+        self.lambda_captain_stream_target = self.lambda_captain_stream
+        if not (self.lambda_snap_start or self.lambda_provisioned_concurrency):
+            return
+
+        aliases = []
+        for lambda_function in [self.lambda_captain_planet, self.lambda_captain_stream]:
+            if self.lambda_snap_start:
+                # The L2 construct only accepts SnapStart for Java runtimes (escape hatch)
+                lambda_function.node.default_child.add_property_override(
+                    "SnapStart", {"ApplyOn": "PublishedVersions"}
+                )
+            aliases.append(
+                aws_lambda.Alias(
+                    self,
+                    f"{lambda_function.node.id}-alias",
+                    alias_name="live",
+                    version=lambda_function.current_version,
+                    provisioned_concurrent_executions=self.lambda_provisioned_concurrency
+                    or None,
+                )
+            )
+        self.lambda_captain_planet_target, self.lambda_captain_stream_target = aliases
+
     def create_rest_api(self):
         """
         Method to create the REST-API Gateway for exposing the "captain-planet"
@@ -123,11 +485,17 @@ class BackendStack(Stack):
             "RESTAPI",
             rest_api_name=self.app_config["api_gw_name"],
             description=f"REST API Gateway for {self.main_resources_name}",
-            handler=self.lambda_captain_planet,
+            handler=self.lambda_captain_planet_target,
             deploy_options=aws_apigw.StageOptions(
                 stage_name=self.deployment_environment,
                 description=f"REST API for {self.main_resources_name} in {self.deployment_environment} environment",
                 metrics_enabled=True,
+                tracing_enabled=self.enable_tracing,
+                # Global limits of the API (the per-client limits are in the function)
+                throttling_rate_limit=self.app_config.get("api_throttling_rate_limit"),
+                throttling_burst_limit=self.app_config.get(
+                    "api_throttling_burst_limit"
+                ),
             ),
             default_cors_preflight_options=aws_apigw.CorsOptions(
                 allow_origins=aws_apigw.Cors.ALL_ORIGINS,
@@ -154,7 +522,7 @@ class BackendStack(Stack):
 
         # Define all API-Lambda integrations for the API methods
         api_lambda_integration_captain = aws_apigw.LambdaIntegration(
-            self.lambda_captain_planet
+            self.lambda_captain_planet_target
         )
 
         # Enable proxies for the "/api/v1/docs" endpoints
@@ -172,6 +540,24 @@ class BackendStack(Stack):
             default_integration=api_lambda_integration_captain,
         )
 
+    def create_streaming_function_url(self):
+        """
+        Method to expose the streaming Lambda Function with a Function URL, as
+        the REST-API Gateway buffers the whole response before returning it.
+        The URL is public, so its function only serves the streaming route and
+        has a reserved concurrency (see "create_lambda_functions").
+        """
+
+        self.function_url_stream = self.lambda_captain_stream_target.add_function_url(
+            auth_type=aws_lambda.FunctionUrlAuthType.NONE,
+            invoke_mode=aws_lambda.InvokeMode.RESPONSE_STREAM,
+            cors=aws_lambda.FunctionUrlCorsOptions(
+                allowed_origins=["*"],
+                allowed_methods=[aws_lambda.HttpMethod.POST],
+                allowed_headers=["*"],
+            ),
+        )
+
     def generate_cloudformation_outputs(self) -> None:
         """
         Method to add the relevant CloudFormation outputs.
@@ -190,3 +576,17 @@ class BackendStack(Stack):
             value=f"https://{self.api.rest_api_id}.execute-api.{self.region}.amazonaws.com/{self.deployment_environment}/api/v1/captain",
             description="BACKEND_API_URL_CAPTAIN",
         )
+
+        CfnOutput(
+            self,
+            "BACKEND_API_URL_CAPTAIN_JOBS",
+            value=f"https://{self.api.rest_api_id}.execute-api.{self.region}.amazonaws.com/{self.deployment_environment}/api/v1/captain/jobs",
+            description="BACKEND_API_URL_CAPTAIN_JOBS",
+        )
+
+        CfnOutput(
+            self,
+            "BACKEND_STREAM_URL_CAPTAIN",
+            value=f"{self.function_url_stream.url}api/v1/captain/stream",
+            description="BACKEND_STREAM_URL_CAPTAIN",
+        )